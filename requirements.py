@@ -67,6 +67,7 @@ extras_require = {'crate': ['crate==0.27.1'],
                               'bacpypes==0.16.7',
                               'modbus-tk==1.1.2',
                               'pyserial==3.5'],
+                  'export': ['pyarrow==12.0.1'],
                   'influxdb': ['influxdb==5.3.1'],
                   'market': ['numpy==1.23.1', 'transitions==0.8.11'],
                   'mongo': ['pymongo==4.5.0'],
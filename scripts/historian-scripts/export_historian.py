@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*- {{{
+# ===----------------------------------------------------------------------===
+#
+#                 Component of Eclipse VOLTTRON
+#
+# ===----------------------------------------------------------------------===
+#
+# Copyright 2023 Battelle Memorial Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# ===----------------------------------------------------------------------===
+# }}}
+
+from argparse import ArgumentParser
+from datetime import timedelta
+
+import pytz
+
+from volttron.platform.agent.utils import load_config, parse_timestamp_string
+from volttron.platform.dbutils import sqlutils
+from volttron.platform.dbutils.exportutils import EXPORT_FORMATS, export_history
+
+
+def get_table_names(tables_def):
+    table_def = {"table_prefix": "",
+                 "data_table": "data",
+                 "topics_table": "topics",
+                 "meta_table": "meta"}
+    table_def.update(tables_def or {})
+    table_prefix = table_def["table_prefix"] + "_" if table_def["table_prefix"] else ""
+    table_names = {key: table_prefix + value for key, value in table_def.items()}
+    table_names["agg_topics_table"] = table_prefix + "aggregate_" + table_def["topics_table"]
+    table_names["agg_meta_table"] = table_prefix + "aggregate_" + table_def["meta_table"]
+    return table_names
+
+
+def parse_time(value):
+    timestamp = parse_timestamp_string(value)
+    return timestamp if timestamp.tzinfo else pytz.UTC.localize(timestamp)
+
+
+def main(args):
+    config = load_config(args.config)
+    connection = config["connection"]
+    dbfuncts_class = sqlutils.get_dbfuncts_class(connection["type"])
+    dbfuncts = dbfuncts_class(connection["params"], get_table_names(config.get("tables_def")))
+    try:
+        rows = export_history(dbfuncts, args.output, parse_time(args.start), parse_time(args.end),
+                              topics=args.topic or None,
+                              export_format=args.format, block=timedelta(seconds=args.block),
+                              blocks_per_file=args.blocks_per_file, page_size=args.page_size)
+    finally:
+        dbfuncts.close()
+    print("Exported", rows, "rows to", args.output)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Export raw data of a SQL historian to Parquet or Arrow IPC files for "
+                            "offline analysis. Data is read directly from the database configured in the historian's "
+                            "configuration file. Every time block is written as one row group. An interrupted "
+                            "export is resumed by running the script again with the same arguments. "
+                            "Requires the pyarrow package.")
+
+    parser.add_argument('config',
+                        help='The path to the configuration file of the historian.')
+    parser.add_argument('output',
+                        help='The directory to export to.')
+    parser.add_argument('--start', required=True,
+                        help='Start of the export. Timestamps without a timezone are UTC.')
+    parser.add_argument('--end', required=True,
+                        help='End of the export, exclusive.')
+    parser.add_argument('--topic', action='append',
+                        help='Topic to export. May be given several times. Defaults to all topics.')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='parquet',
+                        help='File format of the export.')
+    parser.add_argument('--block', type=int, default=3600,
+                        help='Length of a row group in seconds.')
+    parser.add_argument('--blocks-per-file', type=int, default=24,
+                        help='Number of row groups in each file.')
+    parser.add_argument('--page-size', type=int, default=10000,
+                        help='Number of rows read from the database at once.')
+
+    main(parser.parse_args())
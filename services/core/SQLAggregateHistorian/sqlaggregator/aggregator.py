@@ -116,6 +116,20 @@ class SQLAggregateHistorian(AggregateHistorian):
             start_time,
             end_time)
 
+    def collect_partial_aggregates(self, topic_ids, start_time, end_time,
+                                   count_only=False):
+        return self.dbfuncts_class.collect_partial_aggregates(
+            topic_ids,
+            start_time,
+            end_time,
+            count_only)
+
+    def get_last_aggregate_time(self, agg_type, agg_time_period,
+                                agg_topic_id):
+        return self.dbfuncts_class.get_last_aggregate_time(agg_type,
+                                                           agg_time_period,
+                                                           agg_topic_id)
+
     def insert_aggregate(self, topic_id, agg_type, period, end_time,
                          value, topic_ids):
         self.dbfuncts_class.insert_aggregate(topic_id,
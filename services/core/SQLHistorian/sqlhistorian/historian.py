@@ -27,7 +27,7 @@ import logging
 import sys
 import threading
 
-from volttron.platform.agent import utils
+from volttron.platform.agent import downsampling, utils
 from volttron.platform.agent.base_historian import BaseHistorian
 from volttron.platform.dbutils import sqlutils
 from volttron.utils.docs import doc_inherit
@@ -322,6 +322,57 @@ class SQLHistorian(BaseHistorian):
                 results = dict()
         return results
 
+    @doc_inherit
+    def query_historian_downsampled(self, topic, start, end, agg_type, agg_period, skip, count, order,
+                                    max_points, method):
+        topics_list = [topic] if isinstance(topic, str) else topic
+        topic_ids = []
+        id_name_map = {}
+        for name in topics_list:
+            topic_id = self.topic_id_map.get(name.lower())
+            if topic_id:
+                topic_ids.append(topic_id)
+                id_name_map[topic_id] = name
+        if agg_type or skip or count is not None or not topic_ids:
+            return super(SQLHistorian, self).query_historian_downsampled(topic, start, end, agg_type, agg_period,
+                                                                         skip, count, order, max_points, method)
+
+        # lttb is not expressible in SQL. It runs on a min/max preselection of
+        # about four times max_points rows instead of on every row.
+        buckets = max_points // 2 if method == 'minmax' else max_points * 2
+        try:
+            values = self.main_thread_dbutils.query_minmax(topic_ids, id_name_map, start=start, end=end,
+                                                           buckets=buckets, max_points=max_points, order=order)
+        except NotImplementedError:
+            return super(SQLHistorian, self).query_historian_downsampled(topic, start, end, agg_type, agg_period,
+                                                                         skip, count, order, max_points, method)
+        if method != 'minmax':
+            values = downsampling.downsample(values, max_points, method, start, end, order)
+
+        if len(topics_list) > 1:
+            return {'values': values, 'metadata': {}} if values else {}
+        values = list(values.values())[0]
+        return {'values': values, 'metadata': self.topic_meta.get(topic_ids[0], {})} if values else {}
+
+    @doc_inherit
+    def query_historian_page(self, topics, start, end, page_size, after, order):
+        topic_ids = []
+        id_name_map = {}
+        for topic in topics:
+            topic_id = self.topic_id_map.get(topic.lower())
+            if topic_id:
+                topic_ids.append(topic_id)
+                id_name_map[topic_id] = topic
+            else:
+                _log.warning('No such topic {}'.format(topic))
+
+        if not topic_ids:
+            _log.warning('No topic ids found for topics{}. Returning empty result'.format(topics))
+            return {}, None
+
+        return self.main_thread_dbutils.query_page(topic_ids, id_name_map, start=start, end=end, after=after,
+                                                   count=page_size, order=order)
+
     @doc_inherit
     def historian_setup(self):
         thread_name = threading.currentThread().getName()
@@ -50,7 +50,8 @@ from volttron.platform import jsonrpc
 
 from volttron.platform.agent.bacnet_proxy_reader import BACnetReader
 from volttron.platform.agent.known_identities import (
-    VOLTTRON_CENTRAL, VOLTTRON_CENTRAL_PLATFORM, CONTROL, CONFIGURATION_STORE)
+    VOLTTRON_CENTRAL, VOLTTRON_CENTRAL_PLATFORM, CONTROL, CONFIGURATION_STORE,
+    PLATFORM_HEALTH)
 from volttron.platform.agent.utils import (get_aware_utc_now)
 from volttron.platform.agent.utils import (get_utc_seconds_from_epoch,
                                            format_timestamp, normalize_identity)
@@ -499,8 +500,7 @@ class VolttronCentralPlatform(Agent):
 
         # First check to see if there is a peer with a volttron.central
         # identity, if there is use it as the manager of the platform.
-        peers = self.vip.peerlist().get(timeout=5)
-        if VOLTTRON_CENTRAL in peers:
+        if self.vip.peerlist.is_connected(VOLTTRON_CENTRAL):
             _log.debug('VC is a local peer, using {} as instance_id'.format(
                 self._instance_id))
             self._vc_connection = build_agent(
@@ -666,7 +666,7 @@ class VolttronCentralPlatform(Agent):
                                        serverkey=instance_serverkey)
 
         # Verify that we have a connection to the proxy we need to talk with.
-        if proxy_identity not in agent_to_use.vip.peerlist().get(timeout=5):
+        if not agent_to_use.vip.peerlist.is_connected(proxy_identity):
             self._iam_vc_response_topic = None
             raise Unreachable("Can't reach agent identity {}".format(
                 proxy_identity))
@@ -730,6 +730,14 @@ class VolttronCentralPlatform(Agent):
         agents = self.vip.rpc.call(CONTROL, "list_agents").get(timeout=5)
         versions = self.vip.rpc.call(CONTROL, "agent_versions").get(timeout=5)
         status_running = self.status_agents()
+        # The platform health service keeps the last status of every agent, so
+        # one call replaces asking each running agent for its status.
+        try:
+            statuses = self.vip.rpc.call(PLATFORM_HEALTH,
+                                         'get_agent_statuses').get(timeout=5)
+        except (gevent.Timeout, Unreachable, jsonrpc.RemoteError,
+                jsonrpc.Error):
+            statuses = {}
         uuid_to_status = {}
         # proc_info has a list of [startproc, endprox]
         for a in agents:
@@ -771,8 +779,15 @@ class VolttronCentralPlatform(Agent):
             }
 
             if is_running:
-                identity = self.vip.rpc.call(CONTROL, 'agent_vip_identity',
-                                             a['uuid']).get(timeout=30)
+                identity = a.get('identity')
+                if identity is None:
+                    identity = self.vip.rpc.call(CONTROL, 'agent_vip_identity',
+                                                 a['uuid']).get(timeout=30)
+                if identity in statuses:
+                    status = dict(statuses[identity])
+                    status.pop('last_heartbeat', None)
+                    uuid_to_status[a['uuid']]['health'] = status
+                    continue
                 try:
                     status = self.vip.rpc.call(identity,
                                                'health.get_status').get(
@@ -1067,7 +1082,7 @@ class VolttronCentralPlatform(Agent):
             fields = method.split('.')
 
             if fields[0] == 'historian':
-                if 'platform.historian' in self.vip.peerlist().get(timeout=30):
+                if self.vip.peerlist.is_connected('platform.historian'):
                     agent_method = fields[1]
                     result = self.vip.rpc.call('platform.historian',
                                                agent_method,
@@ -286,7 +286,7 @@ class VCConnection(Agent):
         return connected
 
     def is_peer_connected(self, peer=VOLTTRON_CENTRAL):
-        connected = peer in self.vip.peerlist().get(timeout=5)
+        connected = self.vip.peerlist.is_connected(peer)
         self._log.debug("is_connected returning {}".format(connected))
         return connected
 
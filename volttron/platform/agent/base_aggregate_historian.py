@@ -26,6 +26,9 @@
 
 import copy
 import logging
+import math
+import re
+from collections import deque
 from datetime import datetime, timedelta
 
 import pytz
@@ -39,6 +42,98 @@ from volttron.platform.vip.agent.subsystems import RPC
 _log = logging.getLogger(__name__)
 __version__ = '1.0'
 
+# Aggregations that can be computed from the partial aggregates of a period
+INCREMENTAL_AGGREGATIONS = ('avg', 'sum', 'total', 'count', 'min', 'max',
+                            'stddev_pop', 'stddev_samp', 'var_pop', 'var_samp')
+
+
+class PartialAggregate(object):
+    """
+    Count, sum, mean, sum of squared deviations from the mean (M2), minimum
+    and maximum of a set of values.
+    Partial aggregates of disjoint sets of values (different topics or
+    adjacent time ranges) are merged into the partial aggregate of their
+    union, from which any of the
+    :py:data:`INCREMENTAL_AGGREGATIONS` can be computed. Means and M2 are
+    merged with the parallel formula of Chan et al., which unlike a sum of
+    squares stays accurate for values with a large offset and little spread.
+    """
+
+    def __init__(self, count=0, total=None, m2=None, minimum=None,
+                 maximum=None):
+        self.count = count
+        self.total = total
+        self.mean = total / count if count and total is not None else None
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @staticmethod
+    def _combine(first, second, function):
+        if first is None:
+            return second
+        if second is None:
+            return first
+        return function(first, second)
+
+    def merge(self, other):
+        """
+        Add the values of other to this partial aggregate.
+
+        :param other: PartialAggregate or None
+        :return: self
+        """
+        if other is None:
+            return self
+        if self.mean is None:
+            self.mean, self.m2 = other.mean, other.m2
+        elif other.mean is not None:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + \
+                delta * delta * self.count * other.count / count
+            self.mean += delta * other.count / count
+        self.count += other.count
+        self.total = self._combine(self.total, other.total,
+                                   lambda x, y: x + y)
+        self.minimum = self._combine(self.minimum, other.minimum, min)
+        self.maximum = self._combine(self.maximum, other.maximum, max)
+        return self
+
+    def value(self, agg_type):
+        """
+        Compute an aggregate from the partial aggregate
+
+        :param agg_type: one of :py:data:`INCREMENTAL_AGGREGATIONS`
+        :return: aggregate value or None if it is undefined for the values
+        """
+        agg_type = agg_type.lower()
+        if agg_type not in INCREMENTAL_AGGREGATIONS:
+            raise ValueError("Aggregation type {} can not be computed "
+                             "incrementally".format(agg_type))
+        if agg_type == 'count':
+            return self.count
+        if agg_type == 'total':
+            return self.total or 0.0
+        if not self.count or self.total is None:
+            return None
+        if agg_type == 'sum':
+            return self.total
+        if agg_type == 'min':
+            return self.minimum
+        if agg_type == 'max':
+            return self.maximum
+        if agg_type == 'avg':
+            return self.mean
+        if agg_type.endswith('_pop'):
+            variance = self.m2 / self.count
+        elif self.count > 1:
+            variance = self.m2 / (self.count - 1)
+        else:
+            return None
+        return math.sqrt(variance) if agg_type.startswith('stddev') \
+            else variance
+
 
 class AggregateHistorian(Agent):
     """
@@ -69,6 +164,14 @@ class AggregateHistorian(Agent):
         config = utils.load_config(config_path)
         self.topic_id_map = None
         self.aggregate_topic_id_map = None
+        self.incremental_aggregation = True
+        self.incremental_interval = 300
+        self.late_data_periods = 1
+        self.max_backfill_periods = 100
+        self.backfill_chunk_size = 10
+        # Incremented on every configuration change so that collections
+        # scheduled for the previous configuration stop
+        self._aggregation_generation = 0
 
         self.vip.config.set_default("config", config)
         self.vip.config.subscribe(self.configure, actions=["NEW", "UPDATE"],
@@ -101,6 +204,24 @@ class AggregateHistorian(Agent):
         params = connection.get('params', None)
         assert params is not None
 
+        self.incremental_aggregation = config.get('incremental_aggregation',
+                                                  True)
+        self.incremental_interval = float(
+            config.get('incremental_interval', 300))
+        self.late_data_periods = int(config.get('late_data_periods', 1))
+        self.max_backfill_periods = int(
+            config.get('max_backfill_periods', 100))
+        self.backfill_chunk_size = int(config.get('backfill_chunk_size', 10))
+        if self.incremental_interval <= 0:
+            raise ValueError("incremental_interval should be a positive "
+                             "number of seconds")
+        if self.late_data_periods < 0 or self.max_backfill_periods < 0:
+            raise ValueError("late_data_periods and max_backfill_periods "
+                             "should not be negative")
+        if self.backfill_chunk_size < 1:
+            raise ValueError("backfill_chunk_size should be at least 1")
+        self._aggregation_generation += 1
+
         self.topic_id_map, name_map = self.get_topic_map()
         self.agg_topic_id_map = self.get_agg_topic_map()
         _log.debug("In start of aggregate historian. "
@@ -133,11 +254,18 @@ class AggregateHistorian(Agent):
             else:
                 utc_collection_start_time = datetime.utcnow().replace(
                     tzinfo=pytz.utc)
-            self.collect_aggregate_data(
-                utc_collection_start_time,
-                agg_time_period,
-                use_calendar_periods,
-                agg_group['points'])
+            if self.incremental_aggregation:
+                self.start_incremental_aggregation(
+                    utc_collection_start_time,
+                    agg_time_period,
+                    use_calendar_periods,
+                    agg_group['points'])
+            else:
+                self.collect_aggregate_data(
+                    utc_collection_start_time,
+                    agg_time_period,
+                    use_calendar_periods,
+                    agg_group['points'])
         _log.debug("End of onstart method - current time{}".format(
             datetime.utcnow()))
 
@@ -377,28 +505,9 @@ class AggregateHistorian(Agent):
                     data['aggregation_type'],
                     start_time,
                     end_time)
-                if count == 0:
-                    _log.warning("No records found for topic {topic} between {start_time} and {end_time}".format(
-                        topic=topic_pattern if topic_pattern else
-                        data['topic_names'],
-                        start_time=start_time,
-                        end_time=end_time))
-                elif count < data.get('min_count', 0):
-                    _log.warning("Skipping recording of aggregate data for {topic} between {start_time} and {end_time}"
-                                 " as number of records is less than minimum allowed({count})".format(
-                                    topic=topic_pattern if topic_pattern else data['topic_names'],
-                                    start_time=start_time,
-                                    end_time=end_time,
-                                    count=data.get('min_count', 0)))
-                else:
-                    _log.debug("data is {} aggg_time_period is {}".format(data, agg_time_period))
-                    _log.debug(" topic id map {}".format(self.agg_topic_id_map))
-                    self.insert_aggregate(aggregate_topic_id,
-                                          data['aggregation_type'],
-                                          agg_time_period,
-                                          end_time,
-                                          agg_value,
-                                          topic_ids)
+                self._record_aggregate(data, aggregate_topic_id,
+                                       agg_time_period, start_time, end_time,
+                                       agg_value, count, topic_ids)
 
         finally:
             if schedule_next:
@@ -414,6 +523,330 @@ class AggregateHistorian(Agent):
                                            points)
                 _log.debug("After Scheduling next collection.{}".format(event))
 
+    def _record_aggregate(self, data, aggregate_topic_id, agg_time_period,
+                          start_time, end_time, agg_value, count, topic_ids):
+        topic_pattern = data.get('topic_name_pattern', None)
+        if count == 0:
+            _log.warning("No records found for topic {topic} between {start_time} and {end_time}".format(
+                topic=topic_pattern if topic_pattern else
+                data['topic_names'],
+                start_time=start_time,
+                end_time=end_time))
+        elif count < data.get('min_count', 0):
+            _log.warning("Skipping recording of aggregate data for {topic} between {start_time} and {end_time}"
+                         " as number of records is less than minimum allowed({count})".format(
+                            topic=topic_pattern if topic_pattern else data['topic_names'],
+                            start_time=start_time,
+                            end_time=end_time,
+                            count=data.get('min_count', 0)))
+        elif agg_value is None:
+            _log.warning("Skipping recording of aggregate data for {topic} between {start_time} and {end_time}"
+                         " as {agg_type} is undefined for the records".format(
+                            topic=topic_pattern if topic_pattern else data['topic_names'],
+                            start_time=start_time,
+                            end_time=end_time,
+                            agg_type=data['aggregation_type']))
+        else:
+            _log.debug("data is {} aggg_time_period is {}".format(data, agg_time_period))
+            _log.debug(" topic id map {}".format(self.agg_topic_id_map))
+            self.insert_aggregate(aggregate_topic_id,
+                                  data['aggregation_type'],
+                                  agg_time_period,
+                                  end_time,
+                                  agg_value,
+                                  topic_ids)
+
+    def start_incremental_aggregation(self, collection_time, agg_time_period,
+                                      use_calendar_periods, points):
+        """
+        Incremental alternative to
+        :py:meth:`collect_aggregate_data() <AggregateHistorian.collect_aggregate_data>`.
+        Instead of aggregating all the raw data of a period when the period
+        ends, the partial aggregates of each topic are read every
+        incremental_interval seconds for the data that was added since the
+        previous read, so that closing a period only combines them.
+
+        Periods that were missed while the agent was not running are
+        backfilled first, starting after the last aggregate recorded for
+        the points and going back at most max_backfill_periods periods. They
+        are processed backfill_chunk_size periods at a time so that the agent
+        keeps serving other requests.
+
+        When a period is closed, the last late_data_periods closed periods
+        are checked for raw data that arrived late and their aggregates are
+        recorded again if it did.
+
+        Falls back to collect_aggregate_data if the historian does not
+        implement
+        :py:meth:`collect_partial_aggregates() <AggregateHistorian.collect_partial_aggregates>`.
+
+        :param collection_time:  time of the first aggregation collection
+        :param agg_time_period: time period of the aggregation
+        :param use_calendar_periods: flag that indicates if time periods
+                                     should be aligned to calendar times
+        :param points: list of points for which aggregate data needs to be
+                       collected, as for collect_aggregate_data
+        """
+        try:
+            last_times = [self.get_last_aggregate_time(
+                data['aggregation_type'],
+                agg_time_period,
+                self._get_agg_topic_id(data, agg_time_period))
+                for data in points]
+        except NotImplementedError:
+            _log.info("Historian does not support incremental aggregation. "
+                      "Aggregating each {} period when it ends".format(
+                        agg_time_period))
+            self.collect_aggregate_data(collection_time, agg_time_period,
+                                        use_calendar_periods, points)
+            return
+
+        state = dict(generation=self._aggregation_generation,
+                     agg_time_period=agg_time_period,
+                     use_calendar_periods=use_calendar_periods,
+                     points=points,
+                     closed=deque(maxlen=self.late_data_periods))
+        windows = []
+        if collection_time <= utils.get_aware_utc_now():
+            last_times = [t for t in last_times if t is not None]
+            if last_times:
+                windows = self._get_missed_windows(
+                    collection_time, agg_time_period, use_calendar_periods,
+                    min(last_times))
+            window = AggregateHistorian.compute_aggregation_time_slice(
+                collection_time, agg_time_period, use_calendar_periods)
+            if not windows or windows[-1] != window:
+                windows.append(window)
+            collection_time = AggregateHistorian.compute_next_collection_time(
+                collection_time, agg_time_period, use_calendar_periods)
+        self._open_window(state, collection_time)
+        self._backfill(state, windows)
+
+    def _get_missed_windows(self, collection_time, agg_time_period,
+                            use_calendar_periods, last_time):
+        step = AggregateHistorian.compute_next_collection_time(
+            collection_time, agg_time_period,
+            use_calendar_periods) - collection_time
+        windows = []
+        for index in range(1, self.max_backfill_periods + 1):
+            window = AggregateHistorian.compute_aggregation_time_slice(
+                collection_time - index * step, agg_time_period,
+                use_calendar_periods)
+            if window[1] <= last_time:
+                break
+            if not windows or windows[-1] != window:
+                windows.append(window)
+        else:
+            if self.max_backfill_periods:
+                _log.warning("Not backfilling {} aggregates older than {}"
+                             .format(agg_time_period,
+                                     windows[-1][0] if windows else
+                                     collection_time))
+        windows.reverse()
+        return windows
+
+    def _get_agg_topic_id(self, data, agg_time_period):
+        return self.agg_topic_id_map.get(
+            (data['aggregation_topic_name'].lower(),
+             data['aggregation_type'].lower(),
+             agg_time_period))
+
+    @staticmethod
+    def _get_topic_ids(points):
+        topic_ids = set()
+        for data in points:
+            topic_ids.update(data.get('topic_ids') or [])
+        return sorted(topic_ids)
+
+    def _refresh_pattern_topics(self, points):
+        # Match patterns against the topics table the same way the
+        # historian's get_topics_by_pattern does, without the rpc round trip
+        # for every point
+        pattern_points = [data for data in points
+                          if data.get('topic_name_pattern')]
+        if not pattern_points:
+            return
+        self.topic_id_map, name_map = self.get_topic_map()
+        for data in pattern_points:
+            regex = re.compile(data['topic_name_pattern'], re.IGNORECASE)
+            data['topic_ids'] = sorted(
+                {topic_id for name, topic_id in self.topic_id_map.items()
+                 if regex.search(name)})
+
+    def _read_partials(self, topic_ids, start_time, end_time):
+        if not topic_ids:
+            return {}
+        rows = self.collect_partial_aggregates(topic_ids, start_time,
+                                               end_time)
+        return {topic_id: PartialAggregate(*row)
+                for topic_id, row in rows.items()}
+
+    @staticmethod
+    def _get_fingerprints(partials):
+        return {topic_id: (partial.count, partial.total)
+                for topic_id, partial in partials.items()}
+
+    @staticmethod
+    def _fingerprint_changed(first, second):
+        if first[0] != second[0]:
+            return True
+        if first[1] is None or second[1] is None:
+            return first[1] is not second[1]
+        return not math.isclose(first[1], second[1], rel_tol=1e-9,
+                                abs_tol=1e-9)
+
+    def _get_changed_topics(self, topic_ids, start_time, end_time,
+                            fingerprints):
+        """
+        Find the topics whose raw data between start_time and end_time no
+        longer matches the (count, sum) fingerprints it was aggregated from.
+        Comparing the sum as well as the count catches records that were
+        overwritten with a different value, but not the unlikely overwrites
+        that leave the sum unchanged.
+        """
+        if not topic_ids:
+            return set()
+        current = self.collect_partial_aggregates(topic_ids, start_time,
+                                                  end_time, count_only=True)
+        return {topic_id for topic_id in topic_ids
+                if self._fingerprint_changed(
+                    current.get(topic_id, (0, None))[:2],
+                    fingerprints.get(topic_id, (0, None)))}
+
+    def _open_window(self, state, collection_time):
+        state['collection_time'] = collection_time
+        state['start'], state['end'] = \
+            AggregateHistorian.compute_aggregation_time_slice(
+                collection_time, state['agg_time_period'],
+                state['use_calendar_periods'])
+        state['watermark'] = state['start']
+        state['partials'] = {}
+
+    def _backfill(self, state, windows):
+        if state['generation'] != self._aggregation_generation:
+            return
+        chunk = windows[:self.backfill_chunk_size]
+        try:
+            for start_time, end_time in chunk:
+                _log.debug("Backfilling {} aggregates between {} and {}"
+                           .format(state['agg_time_period'], start_time,
+                                   end_time))
+                self._refresh_pattern_topics(state['points'])
+                partials = self._read_partials(
+                    self._get_topic_ids(state['points']), start_time,
+                    end_time)
+                self._emit_window(state, start_time, end_time, partials)
+                state['closed'].append(
+                    (start_time, end_time, self._get_fingerprints(partials)))
+        finally:
+            now = utils.get_aware_utc_now()
+            if windows[len(chunk):]:
+                self.core.schedule(now, self._backfill, state,
+                                   windows[len(chunk):])
+            else:
+                self.core.schedule(now, self._aggregate_incrementally, state)
+
+    def _aggregate_incrementally(self, state):
+        """
+        Read the partial aggregates of the raw data added to the open period
+        since the last call, and close the period once its collection time
+        has been reached.
+        """
+        if state['generation'] != self._aggregation_generation:
+            _log.debug("Stopping {} aggregation of the outdated "
+                       "configuration".format(state['agg_time_period']))
+            return
+        now = utils.get_aware_utc_now()
+        next_run = now + timedelta(seconds=self.incremental_interval)
+        try:
+            until = min(now, state['end'])
+            if until > state['watermark']:
+                partials = self._read_partials(
+                    self._get_topic_ids(state['points']),
+                    state['watermark'], until)
+                for topic_id, partial in partials.items():
+                    state['partials'].setdefault(
+                        topic_id, PartialAggregate()).merge(partial)
+                state['watermark'] = until
+            if now >= state['collection_time']:
+                self._close_window(state)
+            next_run = min(next_run, state['collection_time'])
+        finally:
+            self.core.schedule(next_run, self._aggregate_incrementally, state)
+
+    def _close_window(self, state):
+        start_time, end_time = state['start'], state['end']
+        partials = state['partials']
+        try:
+            self._refresh_pattern_topics(state['points'])
+            # Topics that only now match a pattern and raw data that was
+            # inserted after the time range it belongs to was read
+            topic_ids = self._get_topic_ids(state['points'])
+            stale = self._get_changed_topics(
+                topic_ids, start_time, end_time,
+                self._get_fingerprints(partials))
+            if stale:
+                for topic_id in stale:
+                    partials.pop(topic_id, None)
+                partials.update(self._read_partials(sorted(stale),
+                                                    start_time, end_time))
+            self._emit_window(state, start_time, end_time, partials)
+            self._check_late_data(state)
+            state['closed'].append(
+                (start_time, end_time, self._get_fingerprints(partials)))
+        finally:
+            self._open_window(
+                state, AggregateHistorian.compute_next_collection_time(
+                    state['collection_time'], state['agg_time_period'],
+                    state['use_calendar_periods']))
+
+    def _check_late_data(self, state):
+        topic_ids = self._get_topic_ids(state['points'])
+        for index, (start_time, end_time, fingerprints) in \
+                enumerate(list(state['closed'])):
+            changed = self._get_changed_topics(topic_ids, start_time,
+                                               end_time, fingerprints)
+            if not changed:
+                continue
+            _log.info("Late data for {} aggregates between {} and {}. "
+                      "Recording them again".format(
+                        state['agg_time_period'], start_time, end_time))
+            partials = self._read_partials(topic_ids, start_time, end_time)
+            self._emit_window(state, start_time, end_time, partials, changed)
+            state['closed'][index] = (
+                start_time, end_time, self._get_fingerprints(partials))
+
+    def _emit_window(self, state, start_time, end_time, partials,
+                     changed=None):
+        agg_time_period = state['agg_time_period']
+        for data in state['points']:
+            topic_ids = data.get('topic_ids') or []
+            if changed is not None and not changed.intersection(topic_ids):
+                continue
+            aggregate_topic_id = self._get_agg_topic_id(data, agg_time_period)
+            if not aggregate_topic_id:
+                _log.warning("Name:{} Type: {} Aggregation Period: {}    --"
+                             "No such aggregate topic found.".format(
+                                data['aggregation_topic_name'].lower(),
+                                data['aggregation_type'].lower(),
+                                agg_time_period))
+                continue
+            agg_type = data['aggregation_type'].lower()
+            if agg_type in INCREMENTAL_AGGREGATIONS:
+                merged = PartialAggregate()
+                for topic_id in topic_ids:
+                    merged.merge(partials.get(topic_id))
+                agg_value, count = merged.value(agg_type), merged.count
+            elif topic_ids:
+                agg_value, count = self.collect_aggregate(
+                    topic_ids, data['aggregation_type'], start_time,
+                    end_time)
+            else:
+                agg_value, count = None, 0
+            self._record_aggregate(data, aggregate_topic_id, agg_time_period,
+                                   start_time, end_time, agg_value, count,
+                                   topic_ids)
+
     @abstractmethod
     def get_topic_map(self):
         """
@@ -491,6 +924,37 @@ class AggregateHistorian(Agent):
         """
         pass
 
+    def collect_partial_aggregates(self, topic_ids, start_time, end_time,
+                                   count_only=False):
+        """
+        Collect the partial aggregates of each topic by querying the
+        historian's data store. Historians that implement this and
+        :py:meth:`get_last_aggregate_time() <AggregateHistorian.get_last_aggregate_time>`
+        support incremental aggregation.
+
+        :param topic_ids: list of topic ids
+        :param start_time: start time for query (inclusive)
+        :param end_time:  end time for query (exclusive)
+        :param count_only: only count and sum the records and return None
+                           for the other values
+        :return: dictionary of topic id to a tuple of (count, sum, sum of
+                 squared deviations from the mean, min, max). Topics
+                 without records are left out.
+        """
+        raise NotImplementedError()
+
+    def get_last_aggregate_time(self, agg_type, agg_time_period,
+                                agg_topic_id):
+        """
+        Return the end time of the most recent aggregate recorded for the
+        given aggregate topic, or None if none was recorded.
+
+        :param agg_type: type of aggregation
+        :param agg_time_period: The time period of aggregation
+        :param agg_topic_id: aggregation topic id
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     def insert_aggregate(self, agg_topic_id, agg_type, agg_time_period,
                          end_time, value, topic_ids):
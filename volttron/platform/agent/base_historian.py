@@ -201,7 +201,9 @@ the same date over again.
 
 
 from abc import abstractmethod
-from collections import defaultdict
+import base64
+import bisect
+from collections import defaultdict, OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
 import logging
@@ -218,6 +220,7 @@ import gevent
 from gevent import get_hub
 import pytz
 
+from volttron.platform.agent import downsampling
 from volttron.platform.agent.base_aggregate_historian import AggregateHistorian
 from volttron.platform.agent.utils import process_timestamp, \
     fix_sqlite3_datetime, get_aware_utc_now, parse_timestamp_string
@@ -230,6 +233,7 @@ from volttron.platform.messaging.health import (STATUS_BAD,
                                                 Status)
 from volttron.platform.vip.agent import Agent, compat
 from volttron.platform.vip.agent.core import Core
+from volttron.platform.vip.agent.inbox import BLOCK
 from volttron.platform.vip.agent.subsystems import RPC
 from volttron.platform.vip.agent.subsystems.query import Query
 
@@ -255,6 +259,8 @@ except ImportError:
 from volttron.platform.agent import utils
 
 _log = logging.getLogger(__name__)
+# Per-message logging
+_hot_log = utils.get_hot_path_logger(__name__)
 
 
 # Build the parser
@@ -336,6 +342,7 @@ class BaseHistorianAgent(Agent):
                  max_time_publishing=30.0,
                  backup_storage_limit_gb=None,
                  backup_storage_report=0.9,
+                 backup_eviction_policy="oldest_records",
                  topic_replace_list=[],
                  gather_timing_data=False,
                  readonly=False,
@@ -354,9 +361,14 @@ class BaseHistorianAgent(Agent):
                  time_tolerance=None,
                  time_tolerance_topics=None,
                  cache_only_enabled=False,
+                 query_cache_size=0,
+                 query_cache_settle_time=60.0,
                  **kwargs):
 
         super(BaseHistorianAgent, self).__init__(**kwargs)
+        # Hold up reading when the inbox budget is exhausted rather than
+        # dropping the oldest publishes, which would lose data.
+        self.core.inbox.declare('pubsub', BLOCK)
         # This should resemble a dictionary that has key's from and to which
         # will be replaced within the topics before it's stored in the
         # cache database
@@ -372,6 +384,7 @@ class BaseHistorianAgent(Agent):
 
         self._backup_storage_limit_gb = backup_storage_limit_gb
         self._backup_storage_report = backup_storage_report
+        self._backup_eviction_policy = backup_eviction_policy
         self._retry_period = float(retry_period)
         self._submit_size_limit = int(submit_size_limit)
         self._max_time_publishing = float(max_time_publishing)
@@ -412,6 +425,11 @@ class BaseHistorianAgent(Agent):
                 raise ValueError(f"time_tolerance_topic should a list of topics. Got value({time_tolerance_topics}) of "
                                  f"type {type(time_tolerance_topics)}")
         self._time_tolerance_topics = time_tolerance_topics
+        self._query_cache_size = int(query_cache_size)
+        self._query_cache_settle_time = float(query_cache_settle_time)
+        # Cache of query results, only used by historians that also derive from
+        # BaseQueryHistorianAgent. Created in _configure.
+        self._query_cache = None
         if str(cache_only_enabled) in ('True', 'False'):
             self._cache_only_enabled = cache_only_enabled
             self._current_status_context[STATUS_KEY_CACHE_ONLY] = cache_only_enabled
@@ -424,6 +442,7 @@ class BaseHistorianAgent(Agent):
                                 "max_time_publishing": self._max_time_publishing,
                                 "backup_storage_limit_gb": self._backup_storage_limit_gb,
                                 "backup_storage_report": self._backup_storage_report,
+                                "backup_eviction_policy": self._backup_eviction_policy,
                                 "topic_replace_list": self._topic_replace_list,
                                 "gather_timing_data": self.gather_timing_data,
                                 "readonly": self._readonly,
@@ -439,7 +458,9 @@ class BaseHistorianAgent(Agent):
                                 "all_platforms": self._all_platforms,
                                 "time_tolerance": self._time_tolerance,
                                 "time_tolerance_topics": self._time_tolerance_topics,
-                                "cache_only_enabled": self._cache_only_enabled
+                                "cache_only_enabled": self._cache_only_enabled,
+                                "query_cache_size": self._query_cache_size,
+                                "query_cache_settle_time": self._query_cache_settle_time
                                }
 
         self.vip.config.set_default("config", self._default_config)
@@ -519,6 +540,10 @@ class BaseHistorianAgent(Agent):
             else:
                 backup_storage_report = 0.9
 
+            backup_eviction_policy = config.get("backup_eviction_policy", "oldest_records")
+            if backup_eviction_policy not in BackupDatabase.EVICTION_POLICIES:
+                raise ValueError(f"backup_eviction_policy should be one of {BackupDatabase.EVICTION_POLICIES}")
+
             retry_period = float(config.get("retry_period", 300.0))
 
             storage_limit_gb = config.get("storage_limit_gb")
@@ -554,6 +579,11 @@ class BaseHistorianAgent(Agent):
             if str(cache_only_enabled) not in ('True', 'False'):
                 raise ValueError(f"cache_only_enabled should be either True or False")
 
+            query_cache_size = int(config.get("query_cache_size") or 0)
+            query_cache_settle_time = float(config.get("query_cache_settle_time", 60.0))
+            if query_cache_size < 0 or query_cache_settle_time < 0:
+                raise ValueError("query_cache_size and query_cache_settle_time should not be negative")
+
             self._cache_only_enabled = cache_only_enabled
             self._current_status_context[STATUS_KEY_CACHE_ONLY] = cache_only_enabled
             self._time_tolerance_topics = time_tolerance_topics
@@ -577,6 +607,7 @@ class BaseHistorianAgent(Agent):
         self.gather_timing_data = gather_timing_data
         self._backup_storage_limit_gb = backup_storage_limit_gb
         self._backup_storage_report = backup_storage_report
+        self._backup_eviction_policy = backup_eviction_policy
         self._retry_period = retry_period
         self._submit_size_limit = submit_size_limit
         self._max_time_publishing = max_time_publishing
@@ -587,6 +618,14 @@ class BaseHistorianAgent(Agent):
         self._message_publish_count = message_publish_count
         self._time_tolerance = time_tolerance
         self._time_tolerance_topics = time_tolerance_topics
+        self._query_cache_size = query_cache_size
+        self._query_cache_settle_time = query_cache_settle_time
+        # Without the publish loop of this agent late data would not invalidate
+        # the cache, so it is not used in readonly mode.
+        if query_cache_size and not readonly:
+            self._query_cache = QueryCache(query_cache_size, query_cache_settle_time)
+        else:
+            self._query_cache = None
 
         custom_topics_list = []
         for handler, topic_list in config.get("custom_topics", {}).items():
@@ -675,7 +714,7 @@ class BaseHistorianAgent(Agent):
             raise RuntimeError("Insert not supported by this historian.")
 
         rpc_peer = self.vip.rpc.context.vip_message.peer
-        _log.debug("insert called by {} with {} records".format(rpc_peer, len(records)))
+        _hot_log.debug("insert called by %s with %s records", rpc_peer, len(records))
 
         for r in records:
             topic = r['topic']
@@ -774,7 +813,7 @@ class BaseHistorianAgent(Agent):
                 for k, v in temptopics.items():
                     self._topic_replace_map[k] = v
                 output_topic = self._topic_replace_map[input_topic_lower]
-            _log.debug("Output topic after replacements {}".format(output_topic))
+            _hot_log.debug("Output topic after replacements %s", output_topic)
         return output_topic
 
     def does_time_exceed_tolerance(self, topic, utc_timestamp):
@@ -911,7 +950,7 @@ class BaseHistorianAgent(Agent):
                                     break
                 if (isinstance(msg, list) and not msg[0]) or \
                         (isinstance(msg, (float, int, str)) and msg is None):
-                    _log.debug("Topic: {} - is not in configured to be stored".format(topic))
+                    _hot_log.debug("Topic: %s - is not in configured to be stored", topic)
                     return
             else:
                 msg = message
@@ -1111,7 +1150,8 @@ class BaseHistorianAgent(Agent):
                 return
 
             backupdb = BackupDatabase(self, self._backup_storage_limit_gb,
-                                      self._backup_storage_report)
+                                      self._backup_storage_report,
+                                      eviction_policy=self._backup_eviction_policy)
             self._update_status({STATUS_KEY_CACHE_COUNT: backupdb.get_backlog_count()})
 
             # now that everything is setup we need to make sure that the topics
@@ -1212,8 +1252,19 @@ class BaseHistorianAgent(Agent):
                             _log.exception(
                                 f"An unhandled exception occurred while publishing: {e}")
 
+                        # Late data, even if only partially published, invalidates cached query results.
+                        if self._query_cache is not None and not cache_only_enabled:
+                            self._query_cache.invalidate(
+                                (record['topic'], record['timestamp']) for record in to_publish_list)
+
                         try:
                             self.manage_db_size(history_limit_timestamp, self._storage_limit_gb)
+                            # Cached query results must not outlive the data removed for retention.
+                            if self._query_cache is not None:
+                                if self._storage_limit_gb is not None:
+                                    self._query_cache.clear()
+                                elif history_limit_timestamp is not None:
+                                    self._query_cache.expire(history_limit_timestamp)
                             self._update_status({STATUS_KEY_ERROR_MANAGE_DB_SIZE: False})
                         except Exception as e:
                             _log.exception(
@@ -1446,8 +1497,15 @@ class BackupDatabase:
     use only.
     """
 
+    EVICTION_POLICIES = ("oldest_records", "oldest_segment")
+    # Share of backup_storage_limit_gb that is evicted at once by the
+    # oldest_segment policy
+    BACKUP_SEGMENT_FRACTION = 0.1
+    # Seconds between returning free pages to the file system
+    VACUUM_INTERVAL = 300
+
     def __init__(self, owner, backup_storage_limit_gb, backup_storage_report,
-                 check_same_thread=True):
+                 check_same_thread=True, eviction_policy="oldest_records"):
         # The topic cache is only meant as a local lookup and should not be
         # accessed via the implemented historians.
         self._backup_cache = {}
@@ -1458,6 +1516,10 @@ class BackupDatabase:
         self._owner = weakref.ref(owner)
         self._backup_storage_limit_gb = backup_storage_limit_gb
         self._backup_storage_report = backup_storage_report
+        if eviction_policy not in self.EVICTION_POLICIES:
+            raise ValueError(f"backup_eviction_policy should be one of {self.EVICTION_POLICIES}")
+        self._eviction_policy = eviction_policy
+        self._last_vacuum = None
         self._connection = None
         self._setupdb(check_same_thread)
         self._dupe_ids = []
@@ -1548,71 +1610,7 @@ class BackupDatabase:
         cache_full = False
         if self._backup_storage_limit_gb is not None:
             try:
-                def page_count():
-                    c.execute("PRAGMA page_count")
-                    return c.fetchone()[0]
-
-                def free_count():
-                    c.execute("PRAGMA freelist_count")
-                    return c.fetchone()[0]
-
-                p = page_count()
-                f = free_count()
-
-                # check if we are over the alert threshold.
-                if page_count() >= self.max_pages - int(self.max_pages * (1.0 - self._backup_storage_report)):
-                    cache_full = True
-
-                # Now check if we are above the limit, if so start deleting in batches of 100
-                # page count doesnt update even after deleting all records
-                # and record count becomes zero. If we have deleted all record
-                # exit.
-                # _log.debug(f"record count before check is {self._record_count} page count is {p}"
-                #            f" free count is {f}")
-                # max_pages  gets updated based on inserts but freelist_count doesn't
-                # enter delete loop based on page_count
-                min_free_pages = p - self.max_pages
-                error_record_count = 0
-                get_error_count_from_db = True
-                while p > self.max_pages:
-                    cache_full = True
-                    if time_tolerance_check and get_error_count_from_db:
-                        # if time_tolerance_check is enabled and this the first time
-                        # we get into this loop, get the count from db
-                        c.execute("SELECT count(ts) from time_error")
-                        error_record_count = c.fetchone()[0]
-                        get_error_count_from_db = False # after this we will reduce count as we delete
-                    if error_record_count > 0:
-                        # if time_error table has records, try deleting those first before outstanding table
-                        _log.info("cache size exceeded limit Deleting data from time_error")
-                        c.execute(
-                            '''DELETE FROM time_error
-                            WHERE ROWID IN
-                            (SELECT ROWID FROM time_error
-                            ORDER BY ROWID ASC LIMIT 100)''')
-                        error_record_count -= c.rowcount
-                    else:
-                        # error record count is 0, sp set time_error_records to False
-                        self.time_error_records = False
-                        _log.info("cache size exceeded limit Deleting data from outstanding")
-                        c.execute(
-                            '''DELETE FROM outstanding
-                            WHERE ROWID IN
-                            (SELECT ROWID FROM outstanding
-                            ORDER BY ROWID ASC LIMIT 100)''')
-                        if self._record_count < c.rowcount:
-                            self._record_count = 0
-                        else:
-                            self._record_count -= c.rowcount
-                    p = page_count()  # page count doesn't reflect delete without commit
-                    f = free_count()  # freelist count does. So using that to break from loop
-                    if f >= min_free_pages:
-                        break
-                    _log.debug(f" Cleaning cache since we are over the limit. "
-                               f"After delete of 100 records from cache"
-                               f" record count is {self._record_count} time_error record count is {error_record_count} "
-                               f"page count is {p} freelist count is{f}")
-
+                cache_full = self.manage_db_size(c, time_tolerance_check)
             except Exception:
                 _log.exception(f"Exception when checking page count and deleting")
 
@@ -1620,6 +1618,7 @@ class BackupDatabase:
             self._connection.commit()
         except Exception:
             _log.exception(f"Exception in committing after back db storage")
+        self._reclaim_space(c)
 
         if time_tolerance_check and not self.time_error_records:
             # No time error records in this batch. Check if there are records from earlier inserts
@@ -1629,6 +1628,100 @@ class BackupDatabase:
                 self.time_error_records = True
         return cache_full
 
+    def manage_db_size(self, cursor, time_tolerance_check=False):
+        """
+        Evict the oldest records if the cache is larger than
+        backup_storage_limit_gb. Records that failed the time tolerance check
+        are evicted first.
+
+        The size of the cache is the number of pages in use, which SQLite
+        keeps up to date in the database header, so it is read without
+        scanning any table. Records are evicted by deleting contiguous
+        ranges of ids, sized from the average number of records per page, so
+        that a few large deletes bring the cache back under the limit.
+
+        With the oldest_records policy only as many records as needed are
+        evicted. With the oldest_segment policy a segment of
+        BACKUP_SEGMENT_FRACTION of the limit is evicted on top of that, so
+        that a cache that is held at its limit evicts much less often.
+
+        :param cursor: cursor of the transaction that added the new records
+        :param time_tolerance_check: True if records may have been stored in
+                                     the time_error table
+        :returns: True if the cache is over the backup_storage_report
+                  threshold.
+        :rtype: bool
+        """
+        used_pages = self._used_pages(cursor)
+        cache_full = used_pages >= self.max_pages * self._backup_storage_report
+        excess_pages = used_pages - self.max_pages
+        if excess_pages <= 0:
+            return cache_full
+
+        if self._eviction_policy == "oldest_segment":
+            excess_pages += int(self.max_pages * self.BACKUP_SEGMENT_FRACTION)
+        _log.info(f"Cache size exceeded limit. Evicting about {excess_pages} pages of the oldest records")
+        tables = ["time_error", "outstanding"] if time_tolerance_check else ["outstanding"]
+        target_pages = used_pages - excess_pages
+        for table in tables:
+            while used_pages > target_pages:
+                cursor.execute(f"SELECT min(id), max(id) FROM {table}")
+                min_id, max_id = cursor.fetchone()
+                if min_id is None:
+                    break
+                # Estimate from the span of ids of all records, which
+                # overestimates the records per page if ids have gaps.
+                records_per_page = self._id_span(cursor) / max(used_pages, 1)
+                cursor.execute(f"DELETE FROM {table} WHERE id < ?",
+                               (min_id + int((used_pages - target_pages) * records_per_page) + 1,))
+                deleted = cursor.rowcount
+                if table == "outstanding":
+                    self._record_count = max(self._record_count - deleted, 0)
+                used_pages = self._used_pages(cursor)
+                _log.debug(f"Evicted {deleted} records from {table}. {used_pages} pages in use. "
+                           f"Record count is {self._record_count}")
+            if table == "time_error":
+                cursor.execute("SELECT ROWID FROM time_error LIMIT 1")
+                self.time_error_records = cursor.fetchone() is not None
+        return True
+
+    @staticmethod
+    def _used_pages(cursor):
+        # freelist_count is updated as soon as rows are deleted, page_count
+        # only when free pages are vacuumed.
+        cursor.execute("PRAGMA page_count")
+        page_count = cursor.fetchone()[0]
+        cursor.execute("PRAGMA freelist_count")
+        return page_count - cursor.fetchone()[0]
+
+    @staticmethod
+    def _id_span(cursor):
+        span = 0
+        for table in ("outstanding", "time_error"):
+            cursor.execute(f"SELECT max(id) - min(id) + 1 FROM {table}")
+            span += cursor.fetchone()[0] or 0
+        return span
+
+    def _reclaim_space(self, cursor):
+        """
+        Return free pages to the file system every VACUUM_INTERVAL seconds.
+        Pages freed in between are reused by new records first.
+        """
+        now = get_aware_utc_now()
+        if self._last_vacuum is not None and now - self._last_vacuum < timedelta(seconds=self.VACUUM_INTERVAL):
+            return
+        self._last_vacuum = now
+        try:
+            cursor.execute("PRAGMA freelist_count")
+            free_pages = cursor.fetchone()[0]
+            if free_pages:
+                _log.debug(f"Reclaiming {free_pages} free pages of the backup cache")
+                cursor.execute("PRAGMA incremental_vacuum")
+                cursor.fetchall()
+                self._connection.commit()
+        except Exception:
+            _log.exception("Exception when reclaiming free pages of the backup cache")
+
     def remove_successfully_published(self, successful_publishes,
                                       submit_size):
         """
@@ -1670,6 +1763,7 @@ class BackupDatabase:
             self._dupe_ids.clear()
 
         self._connection.commit()
+        self._reclaim_space(c)
 
     def get_outstanding_to_publish(self, size_limit):
         """
@@ -1767,7 +1861,7 @@ class BackupDatabase:
 
         if c.fetchone() is None:
             _log.debug("Configuring backup DB for the first time.")
-            self._connection.execute('''PRAGMA auto_vacuum = FULL''')
+            self._connection.execute('''PRAGMA auto_vacuum = INCREMENTAL''')
             self._connection.execute('''CREATE TABLE IF NOT EXISTS outstanding
                                         (id INTEGER PRIMARY KEY,
                                          ts timestamp NOT NULL,
@@ -1777,6 +1871,12 @@ class BackupDatabase:
                                          header_string TEXT)''')
             self._record_count = 0
         else:
+            # Caches created with auto_vacuum FULL move pages on every commit.
+            # Switching between FULL and INCREMENTAL does not need a VACUUM.
+            c.execute("PRAGMA auto_vacuum")
+            if c.fetchone()[0] == 1:
+                c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
             # Check to see if we have a header_string column.
             c.execute("pragma table_info(outstanding);")
             name_index = 0
@@ -1822,7 +1922,7 @@ class BackupDatabase:
 
         if c.fetchone() is None:
             _log.debug("Configuring backup DB for the first time.")
-            self._connection.execute('''PRAGMA auto_vacuum = FULL''')
+            self._connection.execute('''PRAGMA auto_vacuum = INCREMENTAL''')
             self._connection.execute('''CREATE TABLE IF NOT EXISTS time_error
                                                 (id INTEGER PRIMARY KEY,
                                                  ts timestamp NOT NULL,
@@ -1889,6 +1989,284 @@ for method in [BackupDatabase.get_outstanding_to_publish,
     setattr(AsyncBackupDatabase, method.__name__, _using_threadpool(method))
 
 
+class QueryCache:
+    """
+    In-process cache of raw data query results for
+    :py:meth:`BaseQueryHistorianAgent.query`.
+
+    Data older than `settle_time` seconds is considered closed. The closed
+    part of a query is read from the data store once and kept in memory,
+    keyed by the set of queried topics, so that repeated queries with a
+    sliding end time only read the open tail from the data store.
+
+    The publish loop of :py:class:`BaseHistorianAgent` passes every
+    published batch to :py:meth:`invalidate`, which truncates the cached
+    ranges that late data falls into. After the data store applied
+    history_limit_days the cached values older than the limit are dropped
+    with :py:meth:`expire`, while storage_limit_gb clears the cache.
+
+    Only queries with an explicit start and count and without aggregation
+    or skip are cached, as the default count differs between data stores. Topic sets
+    with more than `max_values` values per topic in the closed range are
+    not cached and are not read for caching again for `UNCACHEABLE_TTL`
+    seconds.
+    """
+
+    # Seconds during which a range that did not fit in the cache is not
+    # read for caching again
+    UNCACHEABLE_TTL = 600
+
+    def __init__(self, max_entries, settle_time=60.0, max_values=100000):
+        self.max_entries = int(max_entries)
+        self.settle_time = timedelta(seconds=float(settle_time))
+        self.max_values = int(max_values)
+        self._entries = OrderedDict()
+        # Topic sets whose range from start did not fit in the cache:
+        # key -> (start, expiry time)
+        self._uncacheable = OrderedDict()
+        # Incremented when late data is published so that a range read from
+        # the data store at the same time is not stored.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_cacheable(start, end, agg_type, skip, count):
+        if agg_type or skip or count is None:
+            return False
+        # A query without start would load the oldest values of the topics,
+        # which are rarely the ones asked for.
+        return start is not None and (end is None or start < end)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._uncacheable.clear()
+            self._generation += 1
+
+    def query(self, topics, start, end, count, order, fetch):
+        """
+        Query raw data for a list of topics through the cache.
+
+        :param topics: list of topic names
+        :param start: start of the query as an aware datetime
+        :param end: end of the query as an aware datetime or None
+        :param count: maximum number of values per topic
+        :param order: "FIRST_TO_LAST" or "LAST_TO_FIRST"
+        :param fetch: called as fetch(topics, start, end, count, order) to
+                      read from the data store, returns results in the
+                      format of :py:meth:`BaseQueryHistorianAgent.query_historian`
+        :return: tuple of a dictionary of topic name to values and the
+                 metadata, or None if the query is not served by the cache
+        """
+        count = int(count)
+        key = tuple(sorted(set(topic.lower() for topic in topics)))
+        now = get_aware_utc_now()
+        closed = now - self.settle_time
+        if end is not None and end < closed:
+            closed = end
+
+        with self._lock:
+            generation = self._generation
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            uncacheable = self._uncacheable.get(key)
+            if uncacheable is not None and uncacheable[1] <= now:
+                del self._uncacheable[key]
+                uncacheable = None
+
+        if entry is not None and not self._covers(entry, start):
+            entry = None
+        if entry is None:
+            if closed <= start:
+                return None
+            if uncacheable is not None and start <= uncacheable[0]:
+                # The range only grew since it did not fit in the cache
+                return None
+            entry = self._load(topics, start, closed, fetch)
+        elif closed - entry['end'] > self.settle_time:
+            # Move the end of the cached range along with a sliding end time
+            # so that the open tail stays short.
+            entry = self._extend(entry, topics, start, closed, fetch)
+        else:
+            generation = None
+
+        if generation is not None:
+            with self._lock:
+                if entry is None:
+                    self._entries.pop(key, None)
+                    self._uncacheable[key] = (start, now + timedelta(seconds=self.UNCACHEABLE_TTL))
+                    self._uncacheable.move_to_end(key)
+                    while len(self._uncacheable) > self.max_entries:
+                        self._uncacheable.popitem(last=False)
+                elif generation == self._generation:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        if entry is None:
+            return None
+        return self._compose(entry, topics, start, end, count, order, fetch)
+
+    def invalidate(self, records):
+        """
+        Truncate the cached ranges of the topics of published records at the
+        earliest published timestamp of each topic.
+
+        :param records: iterable of (topic, timestamp) of published records
+        """
+        earliest = {}
+        for topic, timestamp in records:
+            topic = topic.lower()
+            if topic not in earliest or timestamp < earliest[topic]:
+                earliest[topic] = timestamp
+        if not earliest:
+            return
+
+        late = get_aware_utc_now() - self.settle_time
+        with self._lock:
+            if min(earliest.values()) < late:
+                self._generation += 1
+            for key, entry in list(self._entries.items()):
+                cut = min((earliest[topic] for topic in key if topic in earliest), default=None)
+                if cut is None or cut >= entry['end']:
+                    continue
+                _hot_log.debug("Late data at %s invalidates cached query of %s", cut, key)
+                if cut <= entry['start']:
+                    del self._entries[key]
+                else:
+                    self._entries[key] = self._truncate(entry, cut)
+
+    def expire(self, cutoff):
+        """
+        Drop cached values older than cutoff, after the data store removed
+        them to apply its retention limit.
+
+        :param cutoff: aware datetime of the oldest value kept
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if cutoff <= entry['start']:
+                    continue
+                if cutoff >= entry['end']:
+                    del self._entries[key]
+                    continue
+                series = {}
+                for name, (times, values) in entry['series'].items():
+                    lo = bisect.bisect_left(times, cutoff)
+                    series[name] = (times[lo:], values[lo:])
+                self._entries[key] = {'start': cutoff, 'end': entry['end'], 'series': series,
+                                      'metadata': entry['metadata']}
+
+    @staticmethod
+    def _covers(entry, start):
+        return entry['start'] <= start < entry['end']
+
+    @staticmethod
+    def _by_topic(results, topics):
+        values = results.get('values') if results else None
+        if not values:
+            return {}
+        if isinstance(values, dict):
+            return {name.lower(): topic_values for name, topic_values in values.items()}
+        return {topics[0].lower(): values}
+
+    def _series(self, results, topics):
+        series = {}
+        for name, values in self._by_topic(results, topics).items():
+            if len(values) >= self.max_values:
+                return None
+            times = []
+            for value in values:
+                timestamp = parse_timestamp_string(value[0])
+                if timestamp.tzinfo is None:
+                    timestamp = timestamp.replace(tzinfo=pytz.UTC)
+                times.append(timestamp)
+            series[name] = (times, list(values))
+        return series
+
+    def _load(self, topics, start, end, fetch):
+        results = fetch(topics, start, end, self.max_values, "FIRST_TO_LAST")
+        series = self._series(results, topics)
+        if series is None:
+            return None
+        return {'start': start, 'end': end, 'series': series,
+                'metadata': results.get('metadata') or {} if results else {}}
+
+    def _extend(self, entry, topics, start, end, fetch):
+        results = fetch(topics, entry['end'], end, self.max_values, "FIRST_TO_LAST")
+        added = self._series(results, topics)
+        if added is None:
+            return None
+
+        # Values before the start of the current query are dropped, as the
+        # start of a sliding query moves forward too.
+        new_start = max(entry['start'], start)
+        series = {}
+        for name in set(entry['series']) | set(added):
+            times, values = entry['series'].get(name, ([], []))
+            lo = bisect.bisect_left(times, new_start)
+            added_times, added_values = added.get(name, ([], []))
+            if len(times) - lo + len(added_times) >= self.max_values:
+                return None
+            series[name] = (times[lo:] + added_times, values[lo:] + added_values)
+        metadata = entry['metadata'] or (results.get('metadata') or {} if results else {})
+        return {'start': new_start, 'end': end, 'series': series, 'metadata': metadata}
+
+    @staticmethod
+    def _truncate(entry, end):
+        series = {}
+        for name, (times, values) in entry['series'].items():
+            hi = bisect.bisect_left(times, end)
+            series[name] = (times[:hi], values[:hi])
+        return {'start': entry['start'], 'end': end, 'series': series, 'metadata': entry['metadata']}
+
+    def _compose(self, entry, topics, start, end, count, order, fetch):
+        split = entry['end']
+        tail_open = end is None or end > split
+        names = OrderedDict((topic.lower(), topic) for topic in topics)
+
+        cached = {}
+        for name, (times, values) in entry['series'].items():
+            lo = bisect.bisect_left(times, start)
+            hi = len(times) if tail_open else bisect.bisect_left(times, end)
+            cached[name] = values[lo:hi]
+
+        metadata = entry['metadata']
+        values = {}
+        if order == "LAST_TO_FIRST":
+            tail = {}
+            if tail_open:
+                results = fetch(topics, split, end, count, order)
+                tail = self._by_topic(results, topics)
+                if not metadata and results:
+                    metadata = results.get('metadata') or {}
+            for lower, name in names.items():
+                if lower not in cached and lower not in tail:
+                    continue
+                topic_values = list(tail.get(lower, [])[:count])
+                rest = count - len(topic_values)
+                if rest > 0:
+                    topic_values.extend(reversed(cached.get(lower, [])[-rest:]))
+                values[name] = topic_values
+        else:
+            for lower, name in names.items():
+                if lower in cached:
+                    values[name] = cached[lower][:count]
+            wanting = [name for name in names.values() if len(values.get(name, [])) < count]
+            if tail_open and wanting:
+                needed = count - min(len(values.get(name, [])) for name in wanting)
+                results = fetch(wanting, split, end, needed, order)
+                tail = self._by_topic(results, wanting)
+                for name in wanting:
+                    if name.lower() in tail:
+                        topic_values = values.get(name, [])
+                        values[name] = topic_values + list(tail[name.lower()][:count - len(topic_values)])
+                if not metadata and results:
+                    metadata = results.get('metadata') or {}
+        return values, metadata
+
+
 class BaseQueryHistorianAgent(Agent):
     """This is the base agent for historian Agents that support querying of
     their data stores.
@@ -1909,6 +2287,8 @@ class BaseQueryHistorianAgent(Agent):
                                         outputdir=agent_data_dir)
             else:
                 time_parser = yacc.yacc(write_tables=0)
+        # Set up by BaseHistorianAgent when query_cache_size is configured.
+        self._query_cache = None
         super(BaseQueryHistorianAgent, self).__init__(**kwargs)
 
     @RPC.export
@@ -2031,7 +2411,8 @@ class BaseQueryHistorianAgent(Agent):
 
     @RPC.export
     def query(self, topic=None, start=None, end=None, agg_type=None,
-              agg_period=None, skip=0, count=None, order="FIRST_TO_LAST"):
+              agg_period=None, skip=0, count=None, order="FIRST_TO_LAST",
+              max_points=None, downsample_method="minmax"):
         """RPC call to query an Historian for time series data.
 
         :param topic: Topic or topics to query for.
@@ -2043,6 +2424,12 @@ class BaseQueryHistorianAgent(Agent):
         :param count: Limit results to this value.
         :param order: How to order the results, either "FIRST_TO_LAST" or
                       "LAST_TO_FIRST"
+        :param max_points: If set, downsample the results to at most this
+                           many values per topic.
+        :param downsample_method: How to downsample the results, either
+                                  "minmax" to keep the smallest and largest
+                                  value of each time bucket or "lttb" for
+                                  Largest-Triangle-Three-Buckets.
         :type topic: str or list
         :type start: str
         :type end: str
@@ -2053,6 +2440,8 @@ class BaseQueryHistorianAgent(Agent):
         :type skip: int
         :type count: int
         :type order: str
+        :type max_points: int
+        :type downsample_method: str
 
         :return: Results of the query
         :rtype: dict
@@ -2094,29 +2483,33 @@ class BaseQueryHistorianAgent(Agent):
                             "(agg_type) and aggregation time period"
                             "(agg_period) to query aggregate data")
 
+        if max_points is not None:
+            max_points = int(max_points)
+            if max_points < 2:
+                raise ValueError("max_points should be at least 2")
+            if downsample_method not in downsampling.METHODS:
+                raise ValueError("downsample_method should be one of {}".format(
+                    ", ".join(downsampling.METHODS)))
+
         if agg_period:
             agg_period = AggregateHistorian.normalize_aggregation_time_period(
                 agg_period)
-        if start is not None:
-            try:
-                start = parse_timestamp_string(start)
-            except (ValueError, TypeError):
-                start = time_parser.parse(start)
-            if start and start.tzinfo is None:
-                start = start.replace(tzinfo=pytz.UTC)
-        if end is not None:
-            try:
-                end = parse_timestamp_string(end)
-            except (ValueError, TypeError):
-                end = time_parser.parse(end)
-            if end and end.tzinfo is None:
-                end = end.replace(tzinfo=pytz.UTC)
+        start = self._parse_query_time(start)
+        end = self._parse_query_time(end)
 
         if start:
-            _log.debug("start={}".format(start))
-
-        results = self.query_historian(topic, start, end, agg_type,
-                                       agg_period, skip, count, order)
+            _hot_log.debug("start=%s", start)
+
+        results = None
+        if max_points is not None:
+            results = self.query_historian_downsampled(topic, start, end, agg_type, agg_period, skip, count, order,
+                                                       max_points, downsample_method)
+        elif self._query_cache is not None and \
+                self._query_cache.is_cacheable(start, end, agg_type, skip, count):
+            results = self._query_through_cache(topic, start, end, count, order)
+        if results is None:
+            results = self.query_historian(topic, start, end, agg_type,
+                                           agg_period, skip, count, order)
         metadata = results.get("metadata", None)
         values = results.get("values", None)
         if values and metadata is None:
@@ -2124,6 +2517,146 @@ class BaseQueryHistorianAgent(Agent):
 
         return results
 
+    def _query_through_cache(self, topic, start, end, count, order):
+        topics = [topic] if isinstance(topic, str) else list(topic)
+
+        def fetch(fetch_topics, fetch_start, fetch_end, fetch_count, fetch_order):
+            return self.query_historian(fetch_topics, fetch_start, fetch_end, None, None, 0,
+                                        fetch_count, fetch_order)
+
+        cached = self._query_cache.query(topics, start, end, count, order, fetch)
+        if cached is None:
+            return None
+        values, metadata = cached
+        # Same form as query_historian: a single topic has a list of values
+        # and its metadata, multiple topics a dictionary of lists.
+        if len(topics) == 1:
+            values = values.get(topics[0])
+            return {'values': values, 'metadata': metadata} if values else {}
+        return {'values': values, 'metadata': {}} if values else {}
+
+    @staticmethod
+    def _parse_query_time(time_string):
+        if time_string is None:
+            return None
+        try:
+            parsed = parse_timestamp_string(time_string)
+        except (ValueError, TypeError):
+            parsed = time_parser.parse(time_string)
+        if parsed and parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=pytz.UTC)
+        return parsed
+
+    @RPC.export
+    def query_paged(self, topic=None, start=None, end=None, page_size=1000,
+                    token=None, order="FIRST_TO_LAST"):
+        """RPC call to query an Historian for one page of raw time series
+        data.
+
+        Unlike skip and count in :py:meth:`query`, each page continues
+        directly after the last row of the previous page, so the cost of a
+        page does not grow with the number of pages already read.
+
+        :param topic: Topic or topics to query for.
+        :param start: Start time of the query, as for :py:meth:`query`.
+        :param end: End time of the query, as for :py:meth:`query`.
+        :param page_size: Maximum number of values in the page, across all
+                          topics.
+        :param token: The "next" token returned with the previous page, or
+                      None for the first page. The other arguments must be
+                      the same as for the previous page.
+        :param order: How to order the results, either "FIRST_TO_LAST" or
+                      "LAST_TO_FIRST"
+        :type topic: str or list
+        :type start: str
+        :type end: str
+        :type page_size: int
+        :type token: str
+        :type order: str
+
+        :return: Values of the page and the token of the next page, which is
+                 None after the last page.
+        :rtype: dict
+
+        .. code-block:: python
+
+            {
+                "values": {topic_name: [(<timestamp string1>, value1),
+                                        ...],
+                           ...},
+                "next": <token>
+            }
+
+        """
+        if topic is None:
+            raise TypeError('"Topic" required')
+        if not isinstance(page_size, int) or page_size < 1:
+            raise ValueError("page_size must be a positive integer")
+        if isinstance(topic, str):
+            topic = [topic]
+
+        after = None
+        if token is not None:
+            try:
+                after = loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+            except (ValueError, TypeError, AttributeError):
+                after = None
+            if not isinstance(after, list) or len(after) != 2:
+                raise ValueError("Invalid query token {}".format(token))
+
+        values, last = self.query_historian_page(topic, self._parse_query_time(start), self._parse_query_time(end),
+                                                 page_size, after, order)
+        next_token = None
+        if last is not None:
+            next_token = base64.urlsafe_b64encode(dumps(last).encode('utf-8')).decode('ascii')
+        return {'values': values, 'next': next_token}
+
+    def query_historian_page(self, topics, start, end, page_size, after, order):
+        """
+        This function is called by :py:meth:`BaseQueryHistorianAgent.query_paged`
+        to query one page of raw data. Historians that support paged queries
+        override it.
+
+        :param topics: list of topics to query for.
+        :param start: Start of query timestamp as a datetime.
+        :param end: End of query timestamp as a datetime.
+        :param page_size: maximum number of values in the page
+        :param after: key of the last row of the previous page as returned by
+                      this method, None for the first page
+        :param order: "FIRST_TO_LAST" or "LAST_TO_FIRST"
+        :return: tuple of the values, as a dictionary of topic name to list of
+                 (timestamp, value), and the JSON serializable key of the last
+                 row, which is None if this is the last page.
+        """
+        raise NotImplementedError("Paged queries are not supported by this historian")
+
+    def query_historian_downsampled(self, topic, start, end, agg_type, agg_period, skip, count, order,
+                                    max_points, method):
+        """
+        This function is called by :py:meth:`BaseQueryHistorianAgent.query`
+        when max_points is set. It returns results in the same format as
+        :py:meth:`query_historian`, with at most max_points values per topic.
+
+        The default implementation downsamples the results of
+        :py:meth:`query_historian`. Historians that can downsample in their
+        data store override it.
+
+        :param max_points: maximum number of values per topic
+        :param method: one of :py:data:`volttron.platform.agent.downsampling.METHODS`
+
+        The other parameters are the same as for :py:meth:`query_historian`.
+        """
+        results = self.query_historian(topic, start, end, agg_type, agg_period, skip, count, order)
+        values = results.get('values') if results else None
+        if not values:
+            return results
+        single = not isinstance(values, dict)
+        if single:
+            values = {None: values}
+        values = downsampling.downsample(values, max_points, method, start, end, order)
+        results['values'] = values[None] if single else values
+        return results
+
     @abstractmethod
     def query_historian(self, topic, start=None, end=None, agg_type=None,
                         agg_period=None, skip=0, count=None, order=None):
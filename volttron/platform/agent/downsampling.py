@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*- {{{
+# ===----------------------------------------------------------------------===
+#
+#                 Component of Eclipse VOLTTRON
+#
+# ===----------------------------------------------------------------------===
+#
+# Copyright 2023 Battelle Memorial Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# ===----------------------------------------------------------------------===
+# }}}
+
+'''Downsampling of historian query results.
+
+Used by :py:meth:`volttron.platform.agent.base_historian.BaseQueryHistorianAgent.query`
+when a query asks for at most max_points values per topic.
+
+minmax splits the time range of the query into max_points // 2 buckets and
+keeps the rows with the smallest and largest value of each bucket, which
+preserves spikes. lttb keeps the rows selected by the Largest-Triangle-
+Three-Buckets algorithm, which preserves the visual shape of a series.
+
+A series with no more than max_points values is returned as it is.
+Otherwise only its numeric values are considered.
+'''
+
+from datetime import timezone
+import math
+
+from volttron.platform.agent.utils import parse_timestamp_string
+
+__all__ = ['METHODS', 'downsample', 'minmax', 'lttb']
+
+METHODS = ('minmax', 'lttb')
+
+
+def _seconds(timestamp):
+    if isinstance(timestamp, str):
+        timestamp = parse_timestamp_string(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def minmax(points, buckets, t0, t1):
+    '''Keep the rows with the smallest and the largest value of each bucket.
+
+    :param points: list of (seconds, value, row) in ascending time order
+    :param buckets: number of buckets between t0 and t1
+    :param t0: start of the first bucket in seconds
+    :param t1: end of the last bucket in seconds
+    :returns: selected rows in ascending time order
+    '''
+    width = max(t1 - t0, 1e-6) / buckets
+    low = {}
+    high = {}
+    for index, (seconds, value, row) in enumerate(points):
+        bucket = min(max(int((seconds - t0) // width), 0), buckets - 1)
+        # Ties keep the earliest row
+        if bucket not in low or value < points[low[bucket]][1]:
+            low[bucket] = index
+        if bucket not in high or value > points[high[bucket]][1]:
+            high[bucket] = index
+    return [points[index][2] for index in sorted(set(low.values()) | set(high.values()))]
+
+
+def lttb(points, threshold):
+    '''Keep threshold rows selected by the Largest-Triangle-Three-Buckets
+    algorithm.
+
+    :param points: list of (seconds, value, row) in ascending time order
+    :param threshold: number of rows to keep
+    :returns: selected rows in ascending time order
+    '''
+    length = len(points)
+    if threshold >= length:
+        return [row for _, _, row in points]
+    if threshold < 3:
+        return [points[0][2], points[-1][2]][:threshold]
+
+    sampled = [points[0][2]]
+    every = (length - 2) / (threshold - 2)
+    selected = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third point of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, length)
+        next_points = points[next_start:next_end]
+        avg_x = sum(point[0] for point in next_points) / len(next_points)
+        avg_y = sum(point[1] for point in next_points) / len(next_points)
+
+        ax, ay = points[selected][0], points[selected][1]
+        max_area = -1
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                candidate = j
+        sampled.append(points[candidate][2])
+        selected = candidate
+    sampled.append(points[-1][2])
+    return sampled
+
+
+def downsample(values, max_points, method='minmax', start=None, end=None, order='FIRST_TO_LAST'):
+    '''Downsample query results to at most max_points values per topic.
+
+    :param values: dictionary of topic name to list of (timestamp, value)
+                   as returned by a historian query
+    :param max_points: maximum number of values per topic
+    :param method: one of :py:data:`METHODS`
+    :param start: start of the query as a datetime, defaults to the first
+                  timestamp of the results
+    :param end: end of the query as a datetime, defaults to the last
+                timestamp of the results
+    :param order: order of the values, "FIRST_TO_LAST" or "LAST_TO_FIRST"
+    :returns: dictionary of topic name to the downsampled values, in the same
+              order
+    '''
+    if method not in METHODS:
+        raise ValueError('Unknown downsampling method {}'.format(method))
+    reverse = order == 'LAST_TO_FIRST'
+    series = {}
+    for name, rows in values.items():
+        if len(rows) <= max_points:
+            continue
+        if reverse:
+            rows = rows[::-1]
+        series[name] = [(_seconds(row[0]), row[1], row) for row in rows if _is_number(row[1])]
+    if not series:
+        return values
+
+    # Buckets span the same range, from the first to the last row of the
+    # query unless start and end are given, for every topic.
+    times = [_seconds(rows[index][0]) for rows in values.values() if rows for index in (0, -1)]
+    t0 = _seconds(start) if start is not None else min(times)
+    t1 = _seconds(end) if end is not None else max(times)
+
+    result = {}
+    for name, rows in values.items():
+        if name not in series:
+            result[name] = rows
+            continue
+        if method == 'minmax':
+            rows = minmax(series[name], max(max_points // 2, 1), t0, t1)
+        else:
+            rows = lttb(series[name], max_points)
+        result[name] = rows[::-1] if reverse else rows
+    return result
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*- {{{
+# ===----------------------------------------------------------------------===
+#
+#                 Component of Eclipse VOLTTRON
+#
+# ===----------------------------------------------------------------------===
+#
+# Copyright 2023 Battelle Memorial Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# ===----------------------------------------------------------------------===
+# }}}
+
+"""Startup trace for agents.
+
+Enabled through :py:func:`volttron.platform.agent.utils.vip_main`, the
+trace records the time spent importing modules and constructing each
+subsystem while the agent is created, and the time at which the agent
+connected to the platform and finished starting.  The report is logged
+once the agent has started.
+
+Only imports performed after the trace is started are measured; imports
+made by the agent module itself before ``vip_main`` is called are
+reported as a single figure measured from process creation.  Import
+times are cumulative, i.e. include the modules imported in turn.
+"""
+
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+__all__ = ['StartupTrace', 'measure']
+
+_log = logging.getLogger(__name__)
+
+_active = None
+
+
+class _TimedLoader:
+    """Loader wrapper recording the time taken to execute a module."""
+
+    def __init__(self, loader, trace):
+        self._loader = loader
+        self._trace = trace
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._trace.record('import', module.__name__, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _ImportTimer:
+    """Meta path finder wrapping the loaders found by the other finders."""
+
+    def __init__(self, trace):
+        self._trace = trace
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, self._trace)
+                return spec
+        return None
+
+
+class StartupTrace:
+    """Collects startup timings of one agent process."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.timings = []
+        self.phases = []
+        self._finder = _ImportTimer(self)
+
+    def start(self):
+        global _active
+        _active = self
+        sys.meta_path.insert(0, self._finder)
+        try:
+            import psutil
+            before = time.time() - psutil.Process().create_time()
+            self.record('phase', 'process start to vip_main', before)
+        except Exception:
+            pass
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+        try:
+            sys.meta_path.remove(self._finder)
+        except ValueError:
+            pass
+
+    def record(self, kind, name, elapsed):
+        self.timings.append((kind, name, elapsed))
+
+    def phase(self, name):
+        """Record the time elapsed since the trace was started."""
+        self.phases.append((name, time.perf_counter() - self.started))
+
+    def report(self, limit=15):
+        """Return the trace as text, listing the slowest imports first."""
+        lines = ['Startup trace for {}'.format(self.name)]
+        for kind, name, elapsed in self.timings:
+            if kind == 'phase':
+                lines.append('  {:>9.1f} ms  {}'.format(elapsed * 1000, name))
+        for name, elapsed in self.phases:
+            lines.append('  {:>9.1f} ms  {}'.format(elapsed * 1000, name))
+        subsystems = [(name, elapsed) for kind, name, elapsed in self.timings if kind == 'subsystem']
+        if subsystems:
+            lines.append('  subsystems:')
+            for name, elapsed in subsystems:
+                lines.append('  {:>9.1f} ms  {}'.format(elapsed * 1000, name))
+        imports = sorted(((elapsed, name) for kind, name, elapsed in self.timings if kind == 'import'),
+                         reverse=True)
+        if imports:
+            lines.append('  imports ({} modules, slowest {}):'.format(len(imports), min(limit, len(imports))))
+            for elapsed, name in imports[:limit]:
+                lines.append('  {:>9.1f} ms  {}'.format(elapsed * 1000, name))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def measure(kind, name):
+    """Record the time spent in the block if a startup trace is active."""
+    trace = _active
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.record(kind, name, time.perf_counter() - start)
@@ -30,6 +30,7 @@ import logging
 import os
 import subprocess
 import sys
+import time
 import warnings
 from pathlib import Path
 from typing import Callable
@@ -62,7 +63,8 @@ from volttron.utils.prompt import prompt_response
 __all__ = [
     'load_config', 'run_agent', 'start_agent_thread', 'is_valid_identity', 'load_platform_config',
     'get_messagebus', 'get_fq_identity', 'execute_command', 'get_aware_utc_now', 'is_secure_mode',
-    'is_web_enabled', 'is_auth_enabled', 'wait_for_volttron_shutdown', 'is_volttron_running'
+    'is_web_enabled', 'is_auth_enabled', 'wait_for_volttron_shutdown', 'is_volttron_running',
+    'get_hot_path_logger', 'configure_hot_path_loggers'
 ]
 
 __author__ = 'Brandon Carpenter <brandon.carpenter@pnnl.gov>'
@@ -425,9 +427,23 @@ def default_main(agent_class,
         pass
 
 
-def vip_main(agent_class, identity=None, version='0.1', **kwargs):
-    """Default main entry point implementation for VIP agents."""
+def vip_main(agent_class, identity=None, version='0.1', startup_trace=None, **kwargs):
+    """Default main entry point implementation for VIP agents.
+
+    If startup_trace is True, or it is None and the AGENT_STARTUP_TRACE
+    environment variable is set to a true value, the time spent in imports,
+    subsystem construction, connecting and starting is logged once the
+    agent has started.
+    """
     try:
+        if startup_trace is None:
+            startup_trace = os.environ.get('AGENT_STARTUP_TRACE', '').lower() in ('1', 'true', 'yes')
+        trace = None
+        if startup_trace:
+            from volttron.platform.agent.startuptrace import StartupTrace
+            trace = StartupTrace(os.environ.get('AGENT_VIP_IDENTITY', identity) or agent_class.__name__)
+            trace.start()
+
         # If stdout is a pipe, re-open it line buffered
         if isapipe(sys.stdout):
             # Hold a reference to the previous file object so it doesn't
@@ -487,6 +503,21 @@ def vip_main(agent_class, identity=None, version='0.1', **kwargs):
                             serverkey=serverkey,
                             **kwargs)
 
+        if trace is not None:
+            trace.phase('agent constructed')
+
+            def onconnected(sender, **kw):
+                trace.phase('connected')
+
+            def onstart(sender, **kw):
+                trace.phase('started')
+                trace.stop()
+                _log.info(trace.report())
+                agent.core.onconnected.disconnect(onconnected)
+
+            agent.core.onconnected.connect(onconnected)
+            agent.core.onstart.connect(onstart)
+
         try:
             run = agent.run
         except AttributeError:
@@ -557,13 +588,161 @@ class AgentFormatter(logging.Formatter):
         return super(AgentFormatter, self).format(record)
 
 
+class FastJsonFormatter(logging.Formatter):
+    """Structured formatter that only serializes the record fields the
+    platform uses when it reads an agent's log from stderr (see
+    :func:`volttron.platform.aip.log_entries`), along with any extra
+    attributes of the record.
+
+    Unlike :class:`JsonFormatter` the record dictionary is not copied.
+    """
+    fields = ('name', 'levelno', 'levelname', 'pathname', 'filename', 'module', 'lineno', 'funcName',
+              'created', 'msecs', 'relativeCreated', 'thread', 'threadName')
+    # Attributes of every record, which are either in fields or left out.
+    record_attributes = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime', 'taskName'}
+
+    def format(self, record):
+        dct = {field: getattr(record, field, None) for field in self.fields}
+        for key in record.__dict__.keys() - self.record_attributes:
+            dct[key] = record.__dict__[key]
+        dct['msg'] = record.getMessage()
+        if record.exc_info:
+            dct['exc_text'] = ''.join(traceback.format_exception(*record.exc_info))
+        elif record.exc_text:
+            dct['exc_text'] = record.exc_text
+        if record.stack_info:
+            dct['stack_info'] = record.stack_info
+        return jsonapi.dumps(dct)
+
+
+class HotPathLogger:
+    """Logger wrapper for code that runs once per message.
+
+    Nothing is formatted unless the underlying logger is enabled for the
+    level.  Of the enabled records only one in every `sample_every` is
+    passed on, and at most `max_per_second` are passed on in any second.
+    The number of records left out is appended to the next record that is
+    passed on.
+
+    :param logger: logger or logger name
+    :param sample_every: pass on one in this many records
+    :param max_per_second: maximum records passed on per second, None for no limit
+    """
+
+    def __init__(self, logger, sample_every=1, max_per_second=None):
+        if isinstance(logger, str):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.configure(sample_every, max_per_second)
+
+    def configure(self, sample_every=1, max_per_second=None):
+        if sample_every < 1:
+            raise ValueError('sample_every must be at least 1')
+        if max_per_second is not None and max_per_second < 1:
+            raise ValueError('max_per_second must be at least 1')
+        self.sample_every = sample_every
+        self.max_per_second = max_per_second
+        self.suppressed = 0
+        self._count = 0
+        self._second = None
+        self._in_second = 0
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def _admit(self):
+        count = self._count
+        self._count = count + 1
+        if count % self.sample_every:
+            self.suppressed += 1
+            return False
+        if self.max_per_second is not None:
+            second = int(time.monotonic())
+            if second != self._second:
+                self._second = second
+                self._in_second = 0
+            if self._in_second >= self.max_per_second:
+                self.suppressed += 1
+                return False
+            self._in_second += 1
+        return True
+
+    def _log(self, level, msg, args, kwargs):
+        if not self.logger.isEnabledFor(level) or not self._admit():
+            return
+        if self.suppressed:
+            msg = msg + ' (%d similar messages suppressed)'
+            args = args + (self.suppressed,)
+            self.suppressed = 0
+        # Attribute the record to the caller of debug()/info()/... rather than to this class.
+        kwargs.setdefault('stacklevel', 3)
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def log(self, level, msg, *args, **kwargs):
+        self._log(level, msg, args, kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self._log(logging.DEBUG, msg, args, kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self._log(logging.INFO, msg, args, kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self._log(logging.WARNING, msg, args, kwargs)
+
+
+def _hot_path_settings_from_env():
+    # Set by the platform for the agents it starts, see configure_hot_path_loggers.
+    try:
+        return dict(sample_every=int(os.environ.get('HOT_LOG_SAMPLE_EVERY') or 1),
+                    max_per_second=int(os.environ.get('HOT_LOG_MAX_PER_SECOND') or 0) or None)
+    except ValueError:
+        _log.warning("Ignoring invalid HOT_LOG_SAMPLE_EVERY or HOT_LOG_MAX_PER_SECOND")
+        return dict(sample_every=1, max_per_second=None)
+
+
+_hot_path_loggers = {}
+_hot_path_settings = _hot_path_settings_from_env()
+
+
+def get_hot_path_logger(name, sample_every=None, max_per_second=None):
+    """Return the :class:`HotPathLogger` for the named logger.
+
+    Loggers are shared by name, so sampling configured in one place (e.g.
+    at agent startup) applies to every hot path using that logger.  New
+    loggers use the sampling of :func:`configure_hot_path_loggers`, which
+    defaults to the HOT_LOG_SAMPLE_EVERY and HOT_LOG_MAX_PER_SECOND
+    environment variables.  The sampling is only changed when
+    sample_every or max_per_second is given.
+    """
+    try:
+        hot_log = _hot_path_loggers[name]
+    except KeyError:
+        hot_log = _hot_path_loggers[name] = HotPathLogger(name, **_hot_path_settings)
+    if sample_every is not None or max_per_second is not None:
+        hot_log.configure(sample_every or 1, max_per_second)
+    return hot_log
+
+
+def configure_hot_path_loggers(sample_every=1, max_per_second=None):
+    """Set the sampling of every hot path logger, including those created
+    later, and pass it on to agents started from this process through the
+    HOT_LOG_SAMPLE_EVERY and HOT_LOG_MAX_PER_SECOND environment variables.
+    """
+    for hot_log in _hot_path_loggers.values():
+        hot_log.configure(sample_every, max_per_second)
+    _hot_path_settings.update(sample_every=sample_every, max_per_second=max_per_second)
+    os.environ['HOT_LOG_SAMPLE_EVERY'] = str(sample_every)
+    os.environ['HOT_LOG_MAX_PER_SECOND'] = str(max_per_second or '')
+
+
 def setup_logging(level=logging.DEBUG, console=False):
     root = logging.getLogger()
     if not root.handlers:
         handler = logging.StreamHandler()
 
         if isapipe(sys.stderr) and '_LAUNCHED_BY_PLATFORM' in os.environ:
-            handler.setFormatter(JsonFormatter())
+            handler.setFormatter(FastJsonFormatter())
         elif console:
             # Below format is more readable for console
             handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
@@ -25,6 +25,7 @@
 import copy
 import logging
 import os
+import uuid
 
 import gevent
 import gevent.core
@@ -77,6 +78,13 @@ class AuthService(Agent):
         self._auth_approved = []
         self.authentication_server = None
         self.authorization_server = None
+        # Capabilities last propagated to peers and the version of that
+        # state.  Peers receive versioned deltas against it.  Versions
+        # restart with every start of the service, so they are paired with
+        # an epoch that identifies the start.
+        self._propagated_capabilities = {}
+        self._capabilities_version = 0
+        self._capabilities_epoch = uuid.uuid4().hex
 
     def export_auth_file(self):
         """
@@ -490,16 +498,46 @@ class AuthService(Agent):
         :type modified_entries: list
         """
         user_to_caps = self.get_user_to_capabilities()
+        changed = {user: caps for user, caps in user_to_caps.items()
+                   if self._propagated_capabilities.get(user) != caps}
+        removed = [user for user in self._propagated_capabilities
+                   if user not in user_to_caps]
+        if changed or removed:
+            self._capabilities_version += 1
+            self._propagated_capabilities = user_to_caps
+            self._send_capabilities_delta(changed, removed)
+
+        # Update RPC method authorizations on agents
+        if modified_entries:
+            try:
+                gevent.spawn(self.update_rpc_authorizations,
+                             modified_entries).join(timeout=15)
+            except gevent.Timeout:
+                _log.error("Timed out updating methods from auth file!")
+        self.authorization_server.update_user_capabilites(user_to_caps)
+
+    def _send_capabilities_delta(self, changed, removed):
+        """
+        Send the users whose capabilities changed or were removed to every
+        peer as version self._capabilities_version of
+        self._capabilities_epoch.  A peer that detects a gap in versions or
+        a new epoch requests the full state through
+        get_capabilities_snapshot.
+
+        :param changed: mapping of changed or added users to capabilities
+        :type changed: dict
+        :param removed: users that no longer have an auth entry
+        :type removed: list
+        """
         i = 0
         peers = None
-        # peerlist times out lots of times when running test suite. This
-        # happens even with higher timeout in get()
-        # but if we retry peerlist succeeds by second attempt most of the
-        # time!!!
+        # peers() asks the router while the peer list is not seeded, right
+        # after start or a reconnect, and that request can time out.  Retry
+        # and fall back to the membership known so far.
         while not peers and i < 3:
             try:
                 i = i + 1
-                peers = self.vip.peerlist().get(timeout=0.5)
+                peers = self.vip.peerlist.peers()
             except BaseException as err:
                 _log.warning(
                     "Attempt %i to get peerlist failed with "
@@ -515,20 +553,12 @@ class AuthService(Agent):
 
         _log.debug("after getting peerlist to send auth updates")
 
+        version = self._capabilities_version
         for peer in peers:
             if peer not in [self.core.identity, CONTROL_CONNECTION]:
-                _log.debug(f"Sending auth update to peers {peer}")
-                self.vip.rpc.call(peer, "auth.update", user_to_caps)
-
-        # Update RPC method authorizations on agents
-        if modified_entries:
-            try:
-                gevent.spawn(self.update_rpc_authorizations,
-                             modified_entries).join(timeout=15)
-            except gevent.Timeout:
-                _log.error("Timed out updating methods from auth file!")
-        self.authorization_server.update_user_capabilites(
-            self.get_user_to_capabilities())
+                _log.debug("Sending auth update %s to peer %s", version, peer)
+                self.vip.rpc.call(peer, "auth.update_delta", version, changed,
+                                  removed, self._capabilities_epoch)
 
     @RPC.export
     def get_user_to_capabilities(self):
@@ -544,6 +574,21 @@ class AuthService(Agent):
             user_to_caps[entry.user_id] = entry.capabilities
         return user_to_caps
 
+    @RPC.export
+    def get_capabilities_snapshot(self):
+        """RPC method
+
+        Gets the mapping of all users to their capabilities together with
+        the version and epoch of the last update sent to peers.  Used by
+        peers to resynchronize after missing an auth.update_delta.
+
+        :returns: dictionary with version, epoch and capabilities keys
+        :rtype: dict
+        """
+        return dict(version=self._capabilities_version,
+                    epoch=self._capabilities_epoch,
+                    capabilities=self.get_user_to_capabilities())
+
     @RPC.export
     def get_authorizations(self, user_id):
         """RPC method
@@ -24,7 +24,9 @@
 
 
 import contextlib
+import heapq
 import importlib
+from itertools import islice
 import logging
 import threading
 import sqlite3
@@ -39,6 +41,21 @@ utils.setup_logging()
 _log = logging.getLogger(__name__)
 
 
+# Number of topics fetched by a single statement in DbDriver.query implementations
+MAX_TOPICS_PER_QUERY = 500
+
+
+def merge_pages(pages, count, descending=False):
+    """
+    Merge the pages of rows that DbDriver.query_page fetched for chunks of topics into the page for all topics.
+    Each page is sorted by its first two columns (ts, topic_id) and holds at most count rows.
+    :return: first count rows of the merged pages
+    """
+    if len(pages) == 1:
+        return pages[0]
+    return list(islice(heapq.merge(*pages, key=lambda row: (row[0], row[1]), reverse=descending), count))
+
+
 class ConnectionError(Exception):
     """
     Custom class for connection errors
@@ -492,6 +509,41 @@ class DbDriver:
         """
         pass
 
+    def query_page(self, topic_ids, id_name_map, start=None, end=None, after=None, count=1000,
+                   order="FIRST_TO_LAST"):
+        """
+        Queries one page of raw historian data for all topic_ids. Rows are ordered by (ts, topic_id) and a page
+        starts right after the key of the last row of the previous page, so fetching a page costs the same no
+        matter how far into the result it is.
+        :param topic_ids: list of topic ids to query for.
+        :param id_name_map: dictionary that maps topic id to topic name
+        :param start: Start of query timestamp as a datetime.
+        :param end: End of query timestamp as a datetime.
+        :param after: key returned with the previous page, None for the first page
+        :param count: maximum number of rows in the page, across all topics
+        :param order: How to order the results, either "FIRST_TO_LAST" or "LAST_TO_FIRST"
+        :return: tuple of the values in the format returned by query() and the key of the last row, which is None
+            if this is the last page. The key is a JSON serializable list of [ts, topic_id].
+        """
+        raise NotImplementedError("Paged queries are not supported by {}".format(self.__class__.__name__))
+
+    def query_minmax(self, topic_ids, id_name_map, start=None, end=None, buckets=100, max_points=200,
+                     order="FIRST_TO_LAST"):
+        """
+        Downsamples raw historian data in the database. The time range from start (or the first row) to end (or the
+        last row) is split into buckets of equal length and for each topic and bucket the rows with the smallest and
+        the largest numeric value are returned. Rows of topics with no more than max_points rows are all returned.
+        :param topic_ids: list of topic ids to query for.
+        :param id_name_map: dictionary that maps topic id to topic name
+        :param start: Start of query timestamp as a datetime.
+        :param end: End of query timestamp as a datetime.
+        :param buckets: number of time buckets
+        :param max_points: topics with no more than this number of rows are not downsampled
+        :param order: How to order the results, either "FIRST_TO_LAST" or "LAST_TO_FIRST"
+        :return: result of the query in the format returned by query()
+        """
+        raise NotImplementedError("Downsampling is not supported by {}".format(self.__class__.__name__))
+
     @abstractmethod
     def create_aggregate_store(self, agg_type, period):
         """
@@ -543,3 +595,25 @@ class DbDriver:
         :return: a tuple of (aggregated value, count of records over which this aggregation was computed)
         """
         pass
+
+    def collect_partial_aggregates(self, topic_ids, start=None, end=None, count_only=False):
+        """
+        Collect, per topic, the partial aggregates from which count, sum, avg, min, max and the population and
+        sample variance and standard deviation of any set of topics and adjacent time ranges can be combined.
+        :param topic_ids: list of topic ids
+        :param start: start time for query (inclusive)
+        :param end:  end time for query (exclusive)
+        :param count_only: only count and sum the records, which is cheaper, and return None for the other values
+        :return: dictionary of topic id to a tuple of (count, sum, sum of squared deviations from the mean, min,
+            max). Topics without records are left out.
+        """
+        raise NotImplementedError("Partial aggregates are not supported by {}".format(self.__class__.__name__))
+
+    def get_last_aggregate_time(self, agg_type, agg_time_period, agg_topic_id):
+        """
+        Return the timestamp of the most recent aggregate recorded for agg_topic_id, or None if there is none.
+        :param agg_type: type of aggregation
+        :param agg_time_period: period of aggregation
+        :param agg_topic_id: aggregate topic id
+        """
+        raise NotImplementedError("Looking up aggregates is not supported by {}".format(self.__class__.__name__))
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*- {{{
+# ===----------------------------------------------------------------------===
+#
+#                 Component of Eclipse VOLTTRON
+#
+# ===----------------------------------------------------------------------===
+#
+# Copyright 2023 Battelle Memorial Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# ===----------------------------------------------------------------------===
+# }}}
+"""
+Export of raw historian data into columnar Parquet or Arrow IPC files.
+
+Data is read straight from the database with the keyset paginated
+:py:meth:`DbDriver.query_page` of a :py:mod:`volttron.platform.dbutils`
+driver, so the export does not go through the platform. The time range is
+split into blocks and every block is written as one row group (one record
+batch for Arrow IPC) with the columns:
+
+    topic, ts, value, value_string
+
+value holds numeric values, value_string the JSON of any other value.
+Integers beyond 2**53, which a float64 can not hold exactly, are written to
+value_string as well.
+A file holds blocks_per_file blocks and is written to a temporary name that
+is renamed once the file is complete. An interrupted export is resumed by
+running it again with the same arguments, which skips the complete files.
+"""
+from datetime import timedelta
+import logging
+import os
+
+import pytz
+
+from volttron.platform import jsonapi
+from volttron.platform.agent import utils
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+_log = logging.getLogger(__name__)
+
+# Integers a float64 holds exactly
+MAX_EXACT_INT = 2 ** 53
+EXPORT_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+MANIFEST = 'export.json'
+
+
+def export_history(dbfuncts, output_dir, start, end, topics=None, export_format='parquet',
+                   block=timedelta(hours=1), blocks_per_file=24, page_size=10000, compression='snappy'):
+    """
+    Export the raw data of topics between start and end to files in output_dir.
+
+    :param dbfuncts: DbDriver instance of the historian database
+    :param output_dir: directory of the export, created if needed
+    :param start: start of the export as a timezone aware datetime, inclusive
+    :param end: end of the export as a timezone aware datetime, exclusive
+    :param topics: list of topic names to export, None to export all topics
+    :param export_format: "parquet" or "arrow"
+    :param block: time period of one row group
+    :param blocks_per_file: number of blocks in each file
+    :param page_size: number of rows read from the database at once
+    :param compression: compression codec of Parquet files
+    :type start: datetime
+    :type end: datetime
+    :type block: timedelta
+    :return: number of rows exported by this run
+    :rtype: int
+    """
+    if not HAS_PYARROW:
+        raise RuntimeError("Historian export needs the pyarrow package")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("export_format should be one of {}".format(list(EXPORT_FORMATS)))
+    if start.tzinfo is None or end.tzinfo is None:
+        raise ValueError("start and end must be timezone aware")
+    if block <= timedelta(0) or blocks_per_file < 1:
+        raise ValueError("block and blocks_per_file must be positive")
+
+    topic_ids, id_name_map = _resolve_topics(dbfuncts, topics)
+    start = start.astimezone(pytz.UTC)
+    end = end.astimezone(pytz.UTC)
+    os.makedirs(output_dir, exist_ok=True)
+    _check_manifest(output_dir, dict(topics=sorted(id_name_map.values()),
+                                     start=utils.format_timestamp(start),
+                                     end=utils.format_timestamp(end),
+                                     block=block.total_seconds(),
+                                     blocks_per_file=blocks_per_file,
+                                     format=export_format))
+
+    schema = pyarrow.schema([('topic', pyarrow.string()),
+                             ('ts', pyarrow.timestamp('us', tz='UTC')),
+                             ('value', pyarrow.float64()),
+                             ('value_string', pyarrow.string())])
+    rows = 0
+    file_start = start
+    while file_start < end:
+        file_end = min(file_start + block * blocks_per_file, end)
+        path = os.path.join(output_dir, file_start.strftime('%Y%m%dT%H%M%SZ') + EXPORT_FORMATS[export_format])
+        if os.path.exists(path):
+            _log.debug("Skipping complete export file {}".format(path))
+        else:
+            rows += _write_file(dbfuncts, path, schema, topic_ids, id_name_map, file_start, file_end,
+                                export_format, block, page_size, compression)
+        file_start = file_end
+    return rows
+
+
+def _resolve_topics(dbfuncts, topics):
+    topic_id_map, topic_name_map = dbfuncts.get_topic_map()
+    if topics is None:
+        topics = list(topic_name_map.values())
+    topic_ids = []
+    id_name_map = {}
+    for topic in topics:
+        topic_id = topic_id_map.get(topic.lower())
+        if topic_id is None:
+            raise ValueError("Unknown topic {}".format(topic))
+        topic_ids.append(topic_id)
+        id_name_map[topic_id] = topic_name_map[topic.lower()]
+    return topic_ids, id_name_map
+
+
+def _check_manifest(output_dir, manifest):
+    # Resuming with different arguments would mix exports in one directory.
+    path = os.path.join(output_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            if jsonapi.load(f) != manifest:
+                raise ValueError("{} holds an export with different arguments".format(output_dir))
+    else:
+        with open(path, 'w') as f:
+            jsonapi.dump(manifest, f)
+
+
+def _write_file(dbfuncts, path, schema, topic_ids, id_name_map, start, end, export_format, block, page_size,
+                compression):
+    tmp_path = path + '.tmp'
+    rows = 0
+    if export_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(tmp_path, schema, compression=compression)
+    else:
+        writer = pyarrow.ipc.new_file(tmp_path, schema)
+    try:
+        block_start = start
+        while block_start < end:
+            block_end = min(block_start + block, end)
+            table = _read_block(dbfuncts, schema, topic_ids, id_name_map, block_start, block_end, page_size)
+            if table.num_rows:
+                if export_format == 'parquet':
+                    writer.write_table(table, row_group_size=table.num_rows)
+                else:
+                    writer.write_table(table)
+                rows += table.num_rows
+            block_start = block_end
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    _log.info("Exported {} rows to {}".format(rows, path))
+    return rows
+
+
+def _read_block(dbfuncts, schema, topic_ids, id_name_map, start, end, page_size):
+    # Rows are grouped by topic and ordered by time within a topic, which
+    # compresses better than the (ts, topic_id) order of the pages.
+    block_values = {}
+    after = None
+    while True:
+        values, after = dbfuncts.query_page(topic_ids, id_name_map, start=start, end=end, after=after,
+                                            count=page_size)
+        for topic, topic_values in values.items():
+            block_values.setdefault(topic, []).extend(topic_values)
+        if after is None:
+            break
+
+    columns = dict(topic=[], ts=[], value=[], value_string=[])
+    for topic, topic_values in block_values.items():
+        for ts, value in topic_values:
+            columns['topic'].append(topic)
+            columns['ts'].append(utils.parse_timestamp_string(ts))
+            if isinstance(value, float) or (isinstance(value, int) and not isinstance(value, bool) and
+                                            abs(value) <= MAX_EXACT_INT):
+                columns['value'].append(value)
+                columns['value_string'].append(None)
+            else:
+                columns['value'].append(None)
+                columns['value_string'].append(jsonapi.dumps(value))
+    return pyarrow.Table.from_pydict(columns, schema=schema)
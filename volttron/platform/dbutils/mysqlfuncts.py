@@ -28,7 +28,7 @@ from collections import defaultdict
 
 import pytz
 import re
-from .basedb import DbDriver
+from .basedb import DbDriver, MAX_TOPICS_PER_QUERY, closing, merge_pages
 from mysql.connector import Error as MysqlError
 from mysql.connector import errorcode as mysql_errorcodes
 from volttron.platform.agent import utils
@@ -37,6 +37,9 @@ from volttron.platform import jsonapi
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 
+# Bytes of max_allowed_packet kept free for the statement text and protocol overhead
+PACKET_HEADROOM = 1024
+
 """
 Implementation of Mysql database operation for
 :py:class:`sqlhistorian.historian.SQLHistorian` and
@@ -48,7 +51,9 @@ class MySqlFuncts(DbDriver):
     def __init__(self, connect_params, table_names):
         # kwargs['dbapimodule'] = 'mysql.connector'
         self.MICROSECOND_SUPPORT = None
+        self.WINDOW_FUNCTION_SUPPORT = None
         self.db_name = connect_params.get('database')
+        self.max_packet_size = None
 
         self.data_table = None
         self.topics_table = None
@@ -84,6 +89,51 @@ class MySqlFuncts(DbDriver):
             elif int(version_nums[1]) == 6:
                 if int(version_nums[2]) < 4:
                     self.MICROSECOND_SUPPORT = False
+        # ROW_NUMBER() is available from MySQL 8.0 and MariaDB 10.2
+        version = tuple(int(num) for num in version_nums[:2])
+        if 'mariadb' in rows[0][0].lower():
+            self.WINDOW_FUNCTION_SUPPORT = version >= (10, 2)
+        else:
+            self.WINDOW_FUNCTION_SUPPORT = version >= (8, 0)
+
+    def init_max_packet_size(self):
+        rows = self.select("SELECT @@max_allowed_packet", None)
+        self.max_packet_size = int(rows[0][0])
+        _log.debug(f"MYSQL max_allowed_packet is {self.max_packet_size}")
+
+    def insert_rows(self, insert, update, records):
+        """
+        Inserts records with multi-row INSERT statements, each sized to fit in max_allowed_packet
+
+        :param insert: statement up to and including VALUES
+        :param update: ON DUPLICATE KEY UPDATE clause
+        :param records: list of tuples of values
+        :return: number of statements executed
+        """
+        if self.max_packet_size is None:
+            self.init_max_packet_size()
+        placeholders = '(' + ', '.join(['%s'] * len(records[0])) + ')'
+        budget = self.max_packet_size - len(insert) - len(update) - PACKET_HEADROOM
+        statements = 0
+        with closing(self.cursor()) as cursor:
+            batch = []
+            size = 0
+            for record in records:
+                # Escaping can double a value, plus quotes and separator
+                record_size = sum([2 * len(str(value)) + 4 for value in record])
+                if batch and size + record_size > budget:
+                    cursor.execute(insert + ', '.join([placeholders] * len(batch)) + update,
+                                   [value for row in batch for value in row])
+                    statements += 1
+                    batch = []
+                    size = 0
+                batch.append(record)
+                size += record_size
+            if batch:
+                cursor.execute(insert + ', '.join([placeholders] * len(batch)) + update,
+                               [value for row in batch for value in row])
+                statements += 1
+        return statements
 
     def setup_historian_tables(self):
         if self.MICROSECOND_SUPPORT is None:
@@ -182,17 +232,11 @@ class MySqlFuncts(DbDriver):
             table_name = agg_type + "_" + agg_period
             value_col = 'agg_value'
 
-        query = '''SELECT topic_id, ts, ''' + value_col + ''' FROM ''' + table_name + '''
-                {where}
-                {order_by}
-                {limit}
-                {offset}'''
-
         if self.MICROSECOND_SUPPORT is None:
             self.init_microsecond_support()
 
-        where_clauses = ["WHERE topic_id = %s"]
-        args = [topic_ids[0]]
+        where_clauses = []
+        args = []
 
         if start is not None:
             if start.tzinfo != pytz.UTC:
@@ -219,47 +263,56 @@ class MySqlFuncts(DbDriver):
                 where_clauses.append("ts < %s")
                 args.append(end)
 
-        where_statement = ' AND '.join(where_clauses)
-
-        order_by = 'ORDER BY ts ASC'
-        if order == 'LAST_TO_FIRST':
-            order_by = ' ORDER BY topic_id DESC, ts DESC'
+        ts_order = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
 
-        # can't have an offset without a limit
-        # -1 = no limit and allows the user to
-        # provide just an offset
         if count is None:
             count = 100
+        count = int(count)
 
-        limit_statement = 'LIMIT %s'
-        args.append(int(count))
-
-        offset_statement = ''
-        if skip > 0:
-            offset_statement = 'OFFSET %s'
-            args.append(skip)
+        # All topics of a chunk are fetched by one statement. count and skip apply to each topic, which needs
+        # ROW_NUMBER() when a statement covers more than one topic.
+        chunk_size = MAX_TOPICS_PER_QUERY if self.WINDOW_FUNCTION_SUPPORT else 1
 
-        _log.debug("About to do real_query")
         values = defaultdict(list)
         for topic_id in topic_ids:
-            args[0] = topic_id
             values[id_name_map[topic_id]] = []
-            real_query = query.format(where=where_statement,
-                                      limit=limit_statement,
-                                      offset=offset_statement,
-                                      order_by=order_by)
+        for i in range(0, len(topic_ids), chunk_size):
+            chunk = topic_ids[i:i + chunk_size]
+            where_statement = ' AND '.join(
+                ["WHERE topic_id IN ({})".format(', '.join(['%s'] * len(chunk)))] + where_clauses)
+            chunk_args = list(chunk) + args
+            if len(chunk) > 1:
+                real_query = '''SELECT topic_id, ts, {value_col} FROM
+                    (SELECT topic_id, ts, {value_col},
+                     ROW_NUMBER() OVER (PARTITION BY topic_id ORDER BY ts {ts_order}) AS row_num
+                     FROM {table_name} {where}) AS windowed
+                    WHERE row_num > %s AND row_num <= %s
+                    ORDER BY topic_id, ts {ts_order}'''.format(value_col=value_col,
+                                                              table_name=table_name,
+                                                              where=where_statement,
+                                                              ts_order=ts_order)
+                chunk_args.extend([skip, skip + count])
+            else:
+                real_query = '''SELECT topic_id, ts, {value_col} FROM {table_name}
+                    {where}
+                    ORDER BY ts {ts_order}
+                    LIMIT %s OFFSET %s'''.format(value_col=value_col,
+                                                  table_name=table_name,
+                                                  where=where_statement,
+                                                  ts_order=ts_order)
+                chunk_args.extend([count, skip])
             _log.debug("Real Query: " + real_query)
-            _log.debug("args: " + str(args))
+            _log.debug("args: " + str(chunk_args))
 
-            cursor = self.select(real_query, args, fetch_all=False)
+            cursor = self.select(real_query, chunk_args, fetch_all=False)
             if cursor:
                 if value_col == 'agg_value':
-                    for _id, ts, value in cursor:
+                    for topic_id, ts, value in cursor:
                         values[id_name_map[topic_id]].append(
                             (utils.format_timestamp(ts.replace(tzinfo=pytz.UTC)),
                              value))
                 else:
-                    for _id, ts, value in cursor:
+                    for topic_id, ts, value in cursor:
                         values[id_name_map[topic_id]].append(
                             (utils.format_timestamp(ts.replace(tzinfo=pytz.UTC)),
                              jsonapi.loads(value)))
@@ -268,6 +321,125 @@ class MySqlFuncts(DbDriver):
                 cursor.close()
         return values
 
+    def query_page(self, topic_ids, id_name_map, start=None, end=None, after=None, count=1000,
+                   order="FIRST_TO_LAST"):
+        if self.MICROSECOND_SUPPORT is None:
+            self.init_microsecond_support()
+
+        op, direction = ('<', 'DESC') if order == 'LAST_TO_FIRST' else ('>', 'ASC')
+        where_clauses = []
+        args = []
+        # Timestamps are stored in UTC without time zone
+        if start:
+            where_clauses.append("ts >= %s")
+            args.append(start.astimezone(pytz.UTC).replace(tzinfo=None))
+        if end:
+            where_clauses.append("ts < %s")
+            args.append(end.astimezone(pytz.UTC).replace(tzinfo=None))
+        if after:
+            after_ts, after_id = after
+            where_clauses.append(f"(ts {op} %s OR (ts = %s AND topic_id {op} %s))")
+            args.extend([after_ts, after_ts, after_id])
+        args.append(int(count))
+
+        # Every chunk of topics is paged separately and the chunk pages are merged
+        pages = []
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            chunk = topic_ids[i:i + MAX_TOPICS_PER_QUERY]
+            chunk_where = ["topic_id IN ({})".format(', '.join(['%s'] * len(chunk)))] + where_clauses
+            real_query = f"""SELECT ts, topic_id, value_string FROM {self.data_table}
+                WHERE {' AND '.join(chunk_where)}
+                ORDER BY ts {direction}, topic_id {direction}
+                LIMIT %s"""
+            _log.debug("Real Query: " + real_query)
+            _log.debug("args: " + str(args))
+            rows = self.select(real_query, list(chunk) + args)
+            pages.append(list(rows) if rows else [])
+        page = merge_pages(pages, count, direction == 'DESC')
+
+        values = defaultdict(list)
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        last = None
+        for ts, topic_id, value in page:
+            values[id_name_map[topic_id]].append(
+                (utils.format_timestamp(ts.replace(tzinfo=pytz.UTC)), jsonapi.loads(value)))
+            last = [str(ts), topic_id]
+        return values, last if len(page) == count else None
+
+    def query_minmax(self, topic_ids, id_name_map, start=None, end=None, buckets=100, max_points=200,
+                     order="FIRST_TO_LAST"):
+        if self.MICROSECOND_SUPPORT is None:
+            self.init_microsecond_support()
+        if not self.WINDOW_FUNCTION_SUPPORT:
+            raise NotImplementedError("Downsampling needs window functions (MySQL 8.0 or MariaDB 10.2)")
+
+        where_clauses = []
+        args = []
+        # Timestamps are stored in UTC without time zone
+        if start:
+            where_clauses.append("ts >= %s")
+            args.append(start.astimezone(pytz.UTC).replace(tzinfo=None))
+        if end:
+            where_clauses.append("ts < %s")
+            args.append(end.astimezone(pytz.UTC).replace(tzinfo=None))
+        seconds = "TIMESTAMPDIFF(MICROSECOND, '1970-01-01', ts) / 1000000"
+        direction = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
+        chunks = [topic_ids[i:i + MAX_TOPICS_PER_QUERY] for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY)]
+
+        def chunk_where(chunk):
+            return ' AND '.join(["topic_id IN ({})".format(', '.join(['%s'] * len(chunk)))] + where_clauses)
+
+        t0 = start.timestamp() if start else None
+        t1 = end.timestamp() if end else None
+        if len(chunks) > 1 and (t0 is None or t1 is None):
+            # Every chunk of topics is split into the same buckets, so the range of the rows of all chunks is needed
+            bounds = [self.select(f"SELECT MIN({seconds}), MAX({seconds}) FROM {self.data_table} "
+                                  f"WHERE {chunk_where(chunk)}", list(chunk) + args)[0]
+                      for chunk in chunks]
+            bounds = [row for row in bounds if row[0] is not None]
+            if not bounds:
+                return {id_name_map[topic_id]: [] for topic_id in topic_ids}
+            t0 = float(min(row[0] for row in bounds)) if t0 is None else t0
+            t1 = float(max(row[1] for row in bounds)) if t1 is None else t1
+
+        values = defaultdict(list)
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        for chunk in chunks:
+            # Values are stored as JSON, so numbers are the values that start with a digit or a minus sign.
+            real_query = f"""WITH source AS (
+                    SELECT topic_id, ts, value_string, {seconds} AS seconds,
+                           CASE WHEN value_string REGEXP '^-?[0-9]' THEN value_string + 0.0 END AS v
+                    FROM {self.data_table}
+                    WHERE {chunk_where(chunk)}),
+                bounds AS (
+                    SELECT COALESCE(%s, MIN(seconds)) AS t0, COALESCE(%s, MAX(seconds)) AS t1 FROM source),
+                bucketed AS (
+                    SELECT topic_id, ts, value_string, v,
+                           LEAST(GREATEST(FLOOR((seconds - t0) * %s / GREATEST(t1 - t0, 0.000001)), 0), %s - 1)
+                               AS bucket,
+                           COUNT(*) OVER (PARTITION BY topic_id) AS total
+                    FROM source, bounds),
+                ranked AS (
+                    SELECT topic_id, ts, value_string, v, total,
+                           ROW_NUMBER() OVER (PARTITION BY topic_id, bucket ORDER BY v IS NULL, v ASC, ts ASC) AS low,
+                           ROW_NUMBER() OVER (PARTITION BY topic_id, bucket ORDER BY v IS NULL, v DESC, ts ASC) AS high
+                    FROM bucketed)
+                SELECT topic_id, ts, value_string FROM ranked
+                WHERE total <= %s OR (v IS NOT NULL AND (low = 1 OR high = 1))
+                ORDER BY topic_id, ts {direction}"""
+            chunk_args = list(chunk) + args + [t0, t1, int(buckets), int(buckets), int(max_points)]
+            _log.debug("Real Query: " + real_query)
+            _log.debug("args: " + str(chunk_args))
+            cursor = self.select(real_query, chunk_args, fetch_all=False)
+            if cursor:
+                for topic_id, ts, value in cursor:
+                    values[id_name_map[topic_id]].append(
+                        (utils.format_timestamp(ts.replace(tzinfo=pytz.UTC)), jsonapi.loads(value)))
+                cursor.close()
+        return values
+
     @contextlib.contextmanager
     def bulk_insert(self):
         """
@@ -289,21 +461,17 @@ class MySqlFuncts(DbDriver):
             :return: Returns True after insert
             :rtype: bool
             """
-#            _log.info("appended record")
             value = jsonapi.dumps(data)
             records.append((ts, topic_id, value))
-#            records.append(SQL('({}, {}, {})').format(Literal(ts), Literal(topic_id), Literal(value)))
             return True
 
         yield insert_data
 
         if records:
-            query = f"""
-INSERT INTO {self.data_table} (ts, topic_id, value_string) VALUES(%s, %s, %s)
-ON DUPLICATE KEY UPDATE value_string=VALUES(value_string);
-"""
-            _log.debug(f"calling execute many with records {len(records)}")
-            self.execute_many(query, records)
+            statements = self.insert_rows(f"INSERT INTO {self.data_table} (ts, topic_id, value_string) VALUES ",
+                                          " ON DUPLICATE KEY UPDATE value_string=VALUES(value_string)",
+                                          records)
+            _log.debug(f"inserted {len(records)} records with {statements} statements")
 
     @contextlib.contextmanager
     def bulk_insert_meta(self):
@@ -330,12 +498,9 @@ ON DUPLICATE KEY UPDATE value_string=VALUES(value_string);
         yield insert_meta
 
         if meta:
-            query = f"""
-            INSERT INTO {self.meta_table} (topic_id, metadata) VALUES(%s, %s)
-            ON DUPLICATE KEY UPDATE metadata=VALUES(metadata);
-            """
-            _log.debug(f"###DEBUG calling execute many with meta len {len(meta)}")
-            self.execute_many(query, meta)
+            self.insert_rows(f"INSERT INTO {self.meta_table} (topic_id, metadata) VALUES ",
+                             " ON DUPLICATE KEY UPDATE metadata=VALUES(metadata)",
+                             meta)
 
     def insert_meta_query(self):
         return '''REPLACE INTO ''' + self.meta_table + ''' (topic_id, metadata) ''' + ''' VALUES(%s, %s)'''
@@ -540,3 +705,37 @@ ON DUPLICATE KEY UPDATE value_string=VALUES(value_string);
             return rows[0][0], rows[0][1]
         else:
             return 0, 0
+
+    def collect_partial_aggregates(self, topic_ids, start=None, end=None, count_only=False):
+        if count_only:
+            columns = "COUNT(*), SUM(v), NULL, NULL, NULL"
+        else:
+            columns = "COUNT(value_string), SUM(v), VAR_POP(v) * COUNT(v), MIN(v), MAX(v)"
+        where_clauses = []
+        args = []
+        # Timestamps are stored in UTC without time zone
+        if start:
+            where_clauses.append("ts >= %s")
+            args.append(start.astimezone(pytz.UTC).replace(tzinfo=None))
+        if end:
+            where_clauses.append("ts < %s")
+            args.append(end.astimezone(pytz.UTC).replace(tzinfo=None))
+        partials = {}
+        # Topics are aggregated separately, so every chunk of topics is queried on its own
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            chunk = topic_ids[i:i + MAX_TOPICS_PER_QUERY]
+            where = ' AND '.join(["topic_id IN ({})".format(', '.join(['%s'] * len(chunk)))] + where_clauses)
+            real_query = f"""SELECT topic_id, {columns}
+                FROM (SELECT topic_id, value_string, value_string + 0.0 AS v FROM {self.data_table}
+                      WHERE {where}) AS source
+                GROUP BY topic_id"""
+            _log.debug("Real Query: " + real_query)
+            _log.debug("args: " + str(args))
+            partials.update((row[0], tuple(row[1:])) for row in self.select(real_query, list(chunk) + args))
+        return partials
+
+    def get_last_aggregate_time(self, agg_type, agg_time_period, agg_topic_id):
+        table_name = agg_type + '_' + agg_time_period
+        rows = self.select("SELECT ts FROM " + table_name + " WHERE topic_id = %s ORDER BY ts DESC LIMIT 1",
+                           [agg_topic_id])
+        return rows[0][0].replace(tzinfo=pytz.UTC) if rows else None
@@ -30,12 +30,157 @@ from psycopg2.extras import execute_values
 from volttron.platform.agent import utils
 from volttron.platform import jsonapi
 
-from .basedb import DbDriver
+from .basedb import DbDriver, MAX_TOPICS_PER_QUERY, merge_pages
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 
 
+def windowed_query(table_name, value_col, topic_ids, where, order, skip, count, distinct=False):
+    """
+    Build a query for the values of several topics in one statement. skip and count apply to each topic
+    and rows are ordered by topic_id and then by ts.
+
+    :param where: additional conditions, each starting with AND
+    :type where: psycopg2.sql.Composable
+    :param order: ASC or DESC
+    :param distinct: only return distinct rows
+    """
+    skip = skip if skip and skip > 0 else 0
+    rows = [SQL('row_num > {}').format(Literal(skip))]
+    if count and count > 0:
+        rows.append(SQL('row_num <= {}').format(Literal(skip + count)))
+    source = SQL('SELECT {}topic_id, ts, {} FROM {} WHERE topic_id IN ({}){}').format(
+        SQL('DISTINCT ' if distinct else ''), Identifier(value_col), Identifier(table_name),
+        SQL(', ').join([Literal(topic_id) for topic_id in topic_ids]), where)
+    return SQL(
+        '''SELECT topic_id, to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.USOF:00'), {value_col}\n'''
+        'FROM (SELECT topic_id, ts, {value_col}, '
+        'ROW_NUMBER() OVER (PARTITION BY topic_id ORDER BY ts {order}) AS row_num\n'
+        'FROM ({source}) AS source) AS windowed\n'
+        'WHERE {rows}\n'
+        'ORDER BY topic_id, ts {order}'
+    ).format(value_col=Identifier(value_col), order=SQL(order), source=source, rows=SQL(' AND ').join(rows))
+
+
+def keyset_query(table_name, topic_ids, start, end, after, count, order):
+    """
+    Build a query for one page of values of several topics, ordered by (ts, topic_id) and starting after the
+    key [ts, topic_id] of the last row of the previous page. The key is returned as the first two columns.
+
+    :param order: ASC or DESC
+    """
+    op = SQL('<' if order == 'DESC' else '>')
+    where = [SQL('topic_id IN ({})').format(SQL(', ').join([Literal(topic_id) for topic_id in topic_ids]))]
+    if start:
+        where.append(SQL('ts >= {}').format(Literal(start.astimezone(pytz.UTC))))
+    if end:
+        where.append(SQL('ts < {}').format(Literal(end.astimezone(pytz.UTC))))
+    if after:
+        after_ts, after_id = after
+        where.append(SQL('(ts {op} {ts} OR (ts = {ts} AND topic_id {op} {topic_id}))').format(
+            op=op, ts=Literal(after_ts), topic_id=Literal(after_id)))
+    return SQL(
+        '''SELECT CAST(ts AS VARCHAR), topic_id, to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.USOF:00'), value_string\n'''
+        'FROM {table}\n'
+        'WHERE {where}\n'
+        'ORDER BY ts {order}, topic_id {order}\n'
+        'LIMIT {count}'
+    ).format(table=Identifier(table_name), where=SQL(' AND ').join(where), order=SQL(order),
+             count=Literal(int(count)))
+
+
+def minmax_bounds_query(table_name, topic_ids, start, end):
+    """
+    Build a query for the seconds since the epoch of the first and the last row of the topics.
+    """
+    where = [SQL('topic_id IN ({})').format(SQL(', ').join([Literal(topic_id) for topic_id in topic_ids]))]
+    if start:
+        where.append(SQL('ts >= {}').format(Literal(start.astimezone(pytz.UTC))))
+    if end:
+        where.append(SQL('ts < {}').format(Literal(end.astimezone(pytz.UTC))))
+    return SQL(
+        'SELECT MIN(EXTRACT(EPOCH FROM ts)), MAX(EXTRACT(EPOCH FROM ts))\n'
+        'FROM {table}\n'
+        'WHERE {where}'
+    ).format(table=Identifier(table_name), where=SQL(' AND ').join(where))
+
+
+def minmax_query(table_name, topic_ids, start, end, buckets, max_points, order, t0=None, t1=None):
+    """
+    Build a query that splits the time range from start (or the first row) to end (or the last row) into buckets
+    and keeps the rows with the smallest and the largest numeric value of each topic and bucket. Topics with no
+    more than max_points rows keep all rows. Rows are ordered by topic_id and then by ts.
+
+    :param order: ASC or DESC
+    :param t0: start of the buckets in seconds since the epoch, instead of start or the first row
+    :param t1: end of the buckets in seconds since the epoch, instead of end or the last row
+    """
+    where = [SQL('topic_id IN ({})').format(SQL(', ').join([Literal(topic_id) for topic_id in topic_ids]))]
+    if start:
+        where.append(SQL('ts >= {}').format(Literal(start.astimezone(pytz.UTC))))
+    if end:
+        where.append(SQL('ts < {}').format(Literal(end.astimezone(pytz.UTC))))
+    if t0 is None and start:
+        t0 = start.timestamp()
+    if t1 is None and end:
+        t1 = end.timestamp()
+    # Values are stored as JSON, so numbers are the values that start with a digit or a minus sign.
+    return SQL(
+        'WITH source AS (SELECT topic_id, ts, value_string, EXTRACT(EPOCH FROM ts) AS seconds, '
+        "CASE WHEN value_string ~ '^-?[0-9]' THEN CAST(value_string AS DOUBLE PRECISION) END AS v\n"
+        'FROM {table} WHERE {where}),\n'
+        'bounds AS (SELECT COALESCE({t0}, MIN(seconds)) AS t0, COALESCE({t1}, MAX(seconds)) AS t1 FROM source),\n'
+        'bucketed AS (SELECT topic_id, ts, value_string, v, '
+        'LEAST(GREATEST(FLOOR((seconds - t0) * {buckets} / GREATEST(t1 - t0, 0.000001)), 0), {buckets} - 1) AS bucket, '
+        'COUNT(*) OVER (PARTITION BY topic_id) AS total\n'
+        'FROM source, bounds),\n'
+        'ranked AS (SELECT topic_id, ts, value_string, v, total, '
+        'ROW_NUMBER() OVER (PARTITION BY topic_id, bucket ORDER BY v IS NULL, v ASC, ts ASC) AS low, '
+        'ROW_NUMBER() OVER (PARTITION BY topic_id, bucket ORDER BY v IS NULL, v DESC, ts ASC) AS high\n'
+        'FROM bucketed)\n'
+        '''SELECT topic_id, to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.USOF:00'), value_string\n'''
+        'FROM ranked\n'
+        'WHERE total <= {max_points} OR (v IS NOT NULL AND (low = 1 OR high = 1))\n'
+        'ORDER BY topic_id, ts {order}'
+    ).format(table=Identifier(table_name), where=SQL(' AND ').join(where),
+             t0=Literal(t0) if t0 is not None else SQL('NULL'),
+             t1=Literal(t1) if t1 is not None else SQL('NULL'),
+             buckets=Literal(int(buckets)), max_points=Literal(int(max_points)), order=SQL(order))
+
+
+def partial_aggregates_query(table_name, topic_ids, start, end, count_only):
+    """
+    Build a query for the count, sum, sum of squared deviations from the mean, min and max of the values of each
+    topic.
+    """
+    where = [SQL('topic_id IN ({})').format(SQL(', ').join([Literal(topic_id) for topic_id in topic_ids]))]
+    if start:
+        where.append(SQL('ts >= {}').format(Literal(start.astimezone(pytz.UTC))))
+    if end:
+        where.append(SQL('ts < {}').format(Literal(end.astimezone(pytz.UTC))))
+    if count_only:
+        columns = SQL('COUNT(*), SUM(CAST(value_string AS FLOAT)), NULL, NULL, NULL')
+    else:
+        columns = SQL('COUNT(value_string), SUM(CAST(value_string AS FLOAT)), '
+                      'VAR_POP(CAST(value_string AS FLOAT)) * COUNT(value_string), '
+                      'MIN(CAST(value_string AS FLOAT)), MAX(CAST(value_string AS FLOAT))')
+    return SQL(
+        'SELECT topic_id, {columns}\n'
+        'FROM {table}\n'
+        'WHERE {where}\n'
+        'GROUP BY topic_id'
+    ).format(columns=columns, table=Identifier(table_name), where=SQL(' AND ').join(where))
+
+
+def last_aggregate_query(agg_type, agg_time_period, agg_topic_id):
+    """
+    Build a query for the timestamp of the most recent aggregate of agg_topic_id.
+    """
+    return SQL('SELECT ts FROM {} WHERE topic_id = {} ORDER BY ts DESC LIMIT 1').format(
+        Identifier(agg_type + '_' + agg_time_period), Literal(agg_topic_id))
+
+
 """
 Implementation of PostgreSQL database operation for
 :py:class:`sqlhistorian.historian.SQLHistorian` and
@@ -220,43 +365,77 @@ class PostgreSqlFuncts(DbDriver):
             table_name = self.data_table
             value_col = 'value_string'
 
-        topic_id = Literal(0)
-        query = [SQL(
-            '''SELECT to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.USOF:00'), ''' + value_col + ' \n'
-            'FROM {}\n'
-            'WHERE topic_id = {}'
-        ).format(Identifier(table_name), topic_id)]
+        where = []
         if start and start.tzinfo != pytz.UTC:
             start = start.astimezone(pytz.UTC)
         if end and end.tzinfo != pytz.UTC:
             end = end.astimezone(pytz.UTC)
         if start and start == end:
-            query.append(SQL(' AND ts = {}').format(Literal(start)))
+            where.append(SQL(' AND ts = {}').format(Literal(start)))
         else:
             if start:
-                query.append(SQL(' AND ts >= {}').format(Literal(start)))
+                where.append(SQL(' AND ts >= {}').format(Literal(start)))
             if end:
-                query.append(SQL(' AND ts < {}').format(Literal(end)))
-        query.append(SQL('ORDER BY ts {}'.format(
-            'DESC' if order == 'LAST_TO_FIRST' else 'ASC')))
-        if skip or count:
-            query.append(SQL('LIMIT {} OFFSET {}').format(
-                Literal(None if not count or count < 0 else count),
-                Literal(None if not skip or skip < 0 else skip)))
-        query = SQL('\n').join(query)
+                where.append(SQL(' AND ts < {}').format(Literal(end)))
+        where = SQL('').join(where)
+        order = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
+
         values = {}
-        if value_col == 'agg_value':
-            for topic_id._wrapped in topic_ids:
-                name = id_name_map[topic_id.wrapped]
-                with self.select(query, fetch_all=False) as cursor:
-                    values[name] = [(ts, value)
-                                    for ts, value in cursor]
-        else:
-            for topic_id._wrapped in topic_ids:
-                name = id_name_map[topic_id.wrapped]
-                with self.select(query, fetch_all=False) as cursor:
-                    values[name] = [(ts, jsonapi.loads(value))
-                                    for ts, value in cursor]
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        # All topics of a chunk are fetched by one statement
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            chunk = topic_ids[i:i + MAX_TOPICS_PER_QUERY]
+            query = windowed_query(table_name, value_col, chunk, where, order, skip, count)
+            with self.select(query, fetch_all=False) as cursor:
+                if value_col == 'agg_value':
+                    for topic_id, ts, value in cursor:
+                        values[id_name_map[topic_id]].append((ts, value))
+                else:
+                    for topic_id, ts, value in cursor:
+                        values[id_name_map[topic_id]].append((ts, jsonapi.loads(value)))
+        return values
+
+    def query_page(self, topic_ids, id_name_map, start=None, end=None, after=None, count=1000,
+                   order='FIRST_TO_LAST'):
+        direction = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
+        # Every chunk of topics is paged separately and the chunk pages are merged
+        pages = []
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            query = keyset_query(self.data_table, topic_ids[i:i + MAX_TOPICS_PER_QUERY], start, end, after, count,
+                                 direction)
+            pages.append(self.select(query))
+        page = merge_pages(pages, count, direction == 'DESC')
+        values = {}
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        last = None
+        for ts_key, topic_id, ts, value in page:
+            values[id_name_map[topic_id]].append((ts, jsonapi.loads(value)))
+            last = [ts_key, topic_id]
+        return values, last if len(page) == count else None
+
+    def query_minmax(self, topic_ids, id_name_map, start=None, end=None, buckets=100, max_points=200,
+                     order='FIRST_TO_LAST'):
+        chunks = [topic_ids[i:i + MAX_TOPICS_PER_QUERY] for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY)]
+        t0 = t1 = None
+        if len(chunks) > 1 and (start is None or end is None):
+            # Every chunk of topics is split into the same buckets, so the range of the rows of all chunks is needed
+            bounds = [self.select(minmax_bounds_query(self.data_table, chunk, start, end))[0] for chunk in chunks]
+            bounds = [row for row in bounds if row[0] is not None]
+            if not bounds:
+                return {id_name_map[topic_id]: [] for topic_id in topic_ids}
+            t0 = start.timestamp() if start else float(min(row[0] for row in bounds))
+            t1 = end.timestamp() if end else float(max(row[1] for row in bounds))
+        values = {}
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        for chunk in chunks:
+            query = minmax_query(self.data_table, chunk, start, end, buckets, max_points,
+                                 'DESC' if order == 'LAST_TO_FIRST' else 'ASC', t0, t1)
+            with self.select(query, fetch_all=False) as cursor:
+                for topic_id, ts, value in cursor:
+                    values[id_name_map[topic_id]].append((ts, jsonapi.loads(value)))
         return values
 
     def insert_topic(self, topic, **kwargs):
@@ -440,3 +619,19 @@ class PostgreSqlFuncts(DbDriver):
             query.append(SQL(' AND ts < {}').format(Literal(end)))
         rows = self.select(SQL('\n').join(query))
         return rows[0] if rows else (0, 0)
+
+    def collect_partial_aggregates(self, topic_ids, start=None, end=None, count_only=False):
+        partials = {}
+        # Topics are aggregated separately, so every chunk of topics is queried on its own
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            rows = self.select(partial_aggregates_query(self.data_table, topic_ids[i:i + MAX_TOPICS_PER_QUERY], start,
+                                                        end, count_only))
+            partials.update((row[0], tuple(row[1:])) for row in rows)
+        return partials
+
+    def get_last_aggregate_time(self, agg_type, agg_time_period, agg_topic_id):
+        rows = self.select(last_aggregate_query(agg_type, agg_time_period, agg_topic_id))
+        if not rows:
+            return None
+        ts = rows[0][0]
+        return ts.replace(tzinfo=pytz.UTC) if ts.tzinfo is None else ts
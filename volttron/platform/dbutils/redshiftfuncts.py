@@ -28,7 +28,9 @@ from psycopg2.sql import Identifier, Literal, SQL
 from volttron.platform.agent import utils
 from volttron.platform import jsonapi
 
-from .basedb import DbDriver
+from .basedb import DbDriver, MAX_TOPICS_PER_QUERY, merge_pages
+from .postgresqlfuncts import (keyset_query, last_aggregate_query, minmax_bounds_query, minmax_query,
+                               partial_aggregates_query, windowed_query)
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
@@ -150,37 +152,74 @@ class RedshiftFuncts(DbDriver):
             table_name = agg_type + '_' + agg_period
         else:
             table_name = self.data_table
-        topic_id = Literal(0)
-        query = [SQL(
-            '''SELECT DISTINCT to_char(ts, 'YYYY-MM-DD"T"HH24:MI:SS.USOF:00'), '''
-            'value_string\n'
-            'FROM {}\n'
-            'WHERE topic_id = {}'
-        ).format(Identifier(table_name), topic_id)]
+        where = []
         if start and start.tzinfo != pytz.UTC:
             start = start.astimezone(pytz.UTC)
         if end and end.tzinfo != pytz.UTC:
             end = end.astimezone(pytz.UTC)
         if start and start == end:
-            query.append(SQL(' AND ts = {}').format(Literal(start)))
+            where.append(SQL(' AND ts = {}').format(Literal(start)))
         else:
             if start:
-                query.append(SQL(' AND ts >= {}').format(Literal(start)))
+                where.append(SQL(' AND ts >= {}').format(Literal(start)))
             if end:
-                query.append(SQL(' AND ts < {}').format(Literal(end)))
-        query.append(SQL('ORDER BY ts {}'.format(
-            'DESC' if order == 'LAST_TO_FIRST' else 'ASC')))
-        if skip or count:
-            query.append(SQL('LIMIT {} OFFSET {}').format(
-                Literal(None if not count or count < 0 else count),
-                Literal(None if not skip or skip < 0 else skip)))
-        query = SQL('\n').join(query)
+                where.append(SQL(' AND ts < {}').format(Literal(end)))
+        where = SQL('').join(where)
+        order = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
+
         values = {}
-        for topic_id._wrapped in topic_ids:
-            name = id_name_map[topic_id.wrapped]
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        # All topics of a chunk are fetched by one statement
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            chunk = topic_ids[i:i + MAX_TOPICS_PER_QUERY]
+            query = windowed_query(table_name, 'value_string', chunk, where, order, skip, count,
+                                   distinct=True)
             with self.select(query, fetch_all=False) as cursor:
-                values[name] = [(ts, jsonapi.loads(value))
-                                for ts, value in cursor]
+                for topic_id, ts, value in cursor:
+                    values[id_name_map[topic_id]].append((ts, jsonapi.loads(value)))
+        return values
+
+    def query_page(self, topic_ids, id_name_map, start=None, end=None, after=None, count=1000,
+                   order='FIRST_TO_LAST'):
+        direction = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
+        # Every chunk of topics is paged separately and the chunk pages are merged
+        pages = []
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            query = keyset_query(self.data_table, topic_ids[i:i + MAX_TOPICS_PER_QUERY], start, end, after, count,
+                                 direction)
+            pages.append(self.select(query))
+        page = merge_pages(pages, count, direction == 'DESC')
+        values = {}
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        last = None
+        for ts_key, topic_id, ts, value in page:
+            values[id_name_map[topic_id]].append((ts, jsonapi.loads(value)))
+            last = [ts_key, topic_id]
+        return values, last if len(page) == count else None
+
+    def query_minmax(self, topic_ids, id_name_map, start=None, end=None, buckets=100, max_points=200,
+                     order='FIRST_TO_LAST'):
+        chunks = [topic_ids[i:i + MAX_TOPICS_PER_QUERY] for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY)]
+        t0 = t1 = None
+        if len(chunks) > 1 and (start is None or end is None):
+            # Every chunk of topics is split into the same buckets, so the range of the rows of all chunks is needed
+            bounds = [self.select(minmax_bounds_query(self.data_table, chunk, start, end))[0] for chunk in chunks]
+            bounds = [row for row in bounds if row[0] is not None]
+            if not bounds:
+                return {id_name_map[topic_id]: [] for topic_id in topic_ids}
+            t0 = start.timestamp() if start else float(min(row[0] for row in bounds))
+            t1 = end.timestamp() if end else float(max(row[1] for row in bounds))
+        values = {}
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        for chunk in chunks:
+            query = minmax_query(self.data_table, chunk, start, end, buckets, max_points,
+                                 'DESC' if order == 'LAST_TO_FIRST' else 'ASC', t0, t1)
+            with self.select(query, fetch_all=False) as cursor:
+                for topic_id, ts, value in cursor:
+                    values[id_name_map[topic_id]].append((ts, jsonapi.loads(value)))
         return values
 
     def insert_topic(self, topic, **kwargs):
@@ -339,3 +378,19 @@ class RedshiftFuncts(DbDriver):
             query.append(SQL(' AND ts < {}').format(Literal(end)))
         rows = self.select(SQL('\n').join(query))
         return rows[0] if rows else (0, 0)
+
+    def collect_partial_aggregates(self, topic_ids, start=None, end=None, count_only=False):
+        partials = {}
+        # Topics are aggregated separately, so every chunk of topics is queried on its own
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            rows = self.select(partial_aggregates_query(self.data_table, topic_ids[i:i + MAX_TOPICS_PER_QUERY], start,
+                                                        end, count_only))
+            partials.update((row[0], tuple(row[1:])) for row in rows)
+        return partials
+
+    def get_last_aggregate_time(self, agg_type, agg_time_period, agg_topic_id):
+        rows = self.select(last_aggregate_query(agg_type, agg_time_period, agg_topic_id))
+        if not rows:
+            return None
+        ts = rows[0][0]
+        return ts.replace(tzinfo=pytz.UTC) if ts.tzinfo is None else ts
@@ -23,6 +23,7 @@
 # }}}
 
 import ast
+import contextlib
 import errno
 import logging
 import sqlite3
@@ -30,9 +31,9 @@ import pytz
 import threading
 import os
 import re
-from .basedb import DbDriver
+from .basedb import DbDriver, MAX_TOPICS_PER_QUERY, merge_pages
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta
 from math import ceil
 
 from volttron.platform.agent import utils
@@ -45,6 +46,123 @@ _log = logging.getLogger(__name__)
 # Make sure sqlite3 datetime adapters are updated.
 fix_sqlite3_datetime()
 
+# Connection parameters that are applied as PRAGMAs on every new connection
+# instead of being passed to sqlite3.connect, with their defaults.
+# None leaves the SQLite default in place.
+PRAGMA_PARAMS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': None
+}
+_PRAGMA_VALUES = {
+    'journal_mode': {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA', '0', '1', '2', '3'}
+}
+
+
+# With the partition_period connection parameter, data is stored in one table per time bucket instead of in the
+# data table. The partitions are named after the data table and the start of their bucket, and are listed in the
+# catalog table <data_table>_partitions. Rows written before partitioning was enabled stay in the data table.
+_PARTITION_UNITS = {'h': 'hours', 'd': 'days', 'w': 'weeks'}
+# Buckets are aligned to a Monday midnight so that weekly partitions start on Mondays
+_PARTITION_ORIGIN = datetime(1970, 1, 5, tzinfo=pytz.UTC)
+# Tables read by one statement. SQLite allows at most 500 terms in a compound SELECT, so the partitions of a longer
+# time range are read in batches whose results are merged.
+MAX_PARTITIONS_PER_QUERY = 250
+
+
+def _parse_partition_period(value):
+    """
+    Return the timedelta for a partition period given as a number of hours, days or weeks, e.g. 1d or 1w,
+    raising ValueError if it is invalid.
+    """
+    try:
+        period = timedelta(**{_PARTITION_UNITS[value[-1]]: int(value[:-1])})
+    except (KeyError, ValueError, TypeError, IndexError):
+        period = None
+    if not period or period < timedelta(0):
+        raise ValueError("Invalid value {} for sqlite connection parameter partition_period. "
+                         "Use a number of hours, days or weeks, e.g. 1d".format(value))
+    return period
+
+
+def _minmax_rows(rows):
+    """
+    Return the rows with the lowest and the highest number of every bucket, choosing the earliest of equal values,
+    like the downsampling query of SqlLiteFuncts.query_minmax does.
+    :param rows: (ts, value_string, number or None, bucket) rows of one topic
+    """
+    low = {}
+    high = {}
+    for row in rows:
+        ts, value, v, bucket = row
+        if v is None:
+            continue
+        if bucket not in low or (v, ts) < (low[bucket][2], low[bucket][0]):
+            low[bucket] = row
+        if bucket not in high or (-v, ts) < (-high[bucket][2], high[bucket][0]):
+            high[bucket] = row
+    return list(set(low.values()) | set(high.values()))
+
+
+def _merge_aggregates(agg_type, results):
+    """
+    Merge the (value, count) results of an AVG, MIN, MAX, COUNT or SUM aggregation over batches of partitions.
+    """
+    count = sum(row[1] for row in results)
+    values = [row for row in results if row[0] is not None]
+    if not values:
+        return None, count
+    agg_type = agg_type.upper()
+    if agg_type == 'MIN':
+        return min(row[0] for row in values), count
+    if agg_type == 'MAX':
+        return max(row[0] for row in values), count
+    if agg_type == 'AVG':
+        return sum(row[0] * row[1] for row in values) / sum(row[1] for row in values), count
+    return sum(row[0] for row in values), count
+
+
+def _merge_partials(first, second):
+    """
+    Merge the (count, sum, sum of squared deviations from the mean, min, max) partial aggregates of one topic in two
+    batches of partitions. Values that were not collected are None.
+    """
+    count = first[0] + second[0]
+    if first[1] is None or second[1] is None:
+        total = first[1] if second[1] is None else second[1]
+    else:
+        total = first[1] + second[1]
+    if first[2] is None or second[2] is None:
+        m2 = first[2] if second[2] is None else second[2]
+    else:
+        # Chan et al.'s parallel formula, like PartialAggregate.merge
+        delta = second[1] / second[0] - first[1] / first[0]
+        m2 = first[2] + second[2] + delta * delta * first[0] * second[0] / count
+    minimum = min((value for value in (first[3], second[3]) if value is not None), default=None)
+    maximum = max((value for value in (first[4], second[4]) if value is not None), default=None)
+    return count, total, m2, minimum, maximum
+
+
+def _pragma_statements(connect_params):
+    """
+    Return the PRAGMA statements configured by connect_params, raising ValueError for invalid values.
+    cache_size follows the SQLite convention: positive values are pages, negative values are KiB.
+    """
+    statements = []
+    for name, default in PRAGMA_PARAMS.items():
+        value = connect_params.get(name, default)
+        if value is None:
+            continue
+        if name == 'cache_size':
+            value = int(value)
+        else:
+            value = str(value).upper()
+            if value not in _PRAGMA_VALUES[name]:
+                raise ValueError("Invalid value {} for sqlite connection parameter {}".format(value, name))
+        statements.append("PRAGMA {}={}".format(name, value))
+    return statements
+
 
 class SqlLiteFuncts(DbDriver):
     """
@@ -101,7 +219,88 @@ class SqlLiteFuncts(DbDriver):
             self.agg_topics_table = table_names['agg_topics_table']
             self.agg_meta_table = table_names['agg_meta_table']
         _log.debug("In sqlitefuncts connect params {}".format(connect_params))
-        super(SqlLiteFuncts, self).__init__('sqlite3', **connect_params)
+        pragmas = _pragma_statements(connect_params)
+        partition_period = connect_params.get('partition_period')
+        self.partition_period = _parse_partition_period(partition_period) if partition_period else None
+        self.partitions_table = self.data_table + '_partitions' if self.data_table else None
+        # None until the catalog of partitions is found, then True
+        self._partitioned = None
+        # Partitions that are known to exist, so inserts do not have to create them
+        self._known_partitions = set()
+        sqlite_params = {k: v for k, v in connect_params.items()
+                         if k not in PRAGMA_PARAMS and k != 'partition_period'}
+
+        def connect():
+            connection = sqlite3.connect(**sqlite_params)
+            for pragma in pragmas:
+                connection.execute(pragma)
+            return connection
+        connect.__name__ = 'sqlite3'
+        super(SqlLiteFuncts, self).__init__(connect)
+
+    @contextlib.contextmanager
+    def bulk_insert(self):
+        """
+        This function implements the bulk insert requirements for sqlite historian by overriding the
+        DbDriver::bulk_insert() in basedb.py. Records are collected and written with a single executemany
+        when the context exits, in the transaction the caller commits.
+
+        :yields: insert method
+        """
+        records = []
+
+        def insert_data(ts, topic_id, data):
+            """
+            Inserts data records to the list
+
+            :param ts: time stamp
+            :type string
+            :param topic_id: topic ID
+            :type string
+            :param data: data value
+            :type any valid JSON serializable value
+            :return: Returns True after insert
+            :rtype: bool
+            """
+            records.append((ts, topic_id, jsonapi.dumps(data)))
+            return True
+
+        yield insert_data
+
+        if records:
+            if self.partition_period:
+                self._insert_partitioned(records)
+            else:
+                self.execute_many(self.insert_data_query(), records)
+
+    @contextlib.contextmanager
+    def bulk_insert_meta(self):
+        """
+        This function implements the bulk insert requirements for sqlite historian by overriding the
+        DbDriver::bulk_insert_meta() in basedb.py and yields necessary data insertion method needed for bulk inserts
+
+        :yields: insert method
+        """
+        records = []
+
+        def insert_meta(topic_id, metadata):
+            """
+            Inserts metadata records to the list
+
+            :param topic_id: topic ID
+            :type string
+            :param metadata: metadata dictionary
+            :type dict
+            :return: Returns True after insert
+            :rtype: bool
+            """
+            records.append((topic_id, jsonapi.dumps(metadata)))
+            return True
+
+        yield insert_meta
+
+        if records:
+            self.execute_many(self.insert_meta_query(), records)
 
     def setup_historian_tables(self):
 
@@ -145,6 +344,102 @@ class SqlLiteFuncts(DbDriver):
             self.meta_table = self.topics_table
             _log.debug("Created new schema. data and topics tables")
 
+        if self.partition_period:
+            self.execute_stmt(
+                '''CREATE TABLE IF NOT EXISTS ''' + self.partitions_table +
+                ''' (name TEXT PRIMARY KEY,
+                     start_ts timestamp NOT NULL,
+                     end_ts timestamp NOT NULL)''', commit=True)
+            self._partitioned = True
+            _log.debug("Storing data in {} partitions".format(self.partition_period))
+
+    def is_partitioned(self):
+        """
+        Return True if data is stored in time partitions. This is detected from the database, so that readers
+        such as the aggregate historian do not need the partition_period parameter.
+        """
+        if not self._partitioned and self.partitions_table:
+            self._partitioned = bool(self.select(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name=?", [self.partitions_table]))
+        return bool(self._partitioned)
+
+    def get_partitions(self, start=None, end=None):
+        """
+        Return the names of the partitions that may hold data between start (inclusive) and end (exclusive),
+        oldest first. If start and end are equal the partition holding that time is returned.
+        """
+        where_clauses = []
+        args = []
+        if start:
+            where_clauses.append("end_ts > ?")
+            args.append(start.astimezone(pytz.UTC))
+        if end:
+            where_clauses.append("start_ts <= ?" if start == end else "start_ts < ?")
+            args.append(end.astimezone(pytz.UTC))
+        query = "SELECT name FROM " + self.partitions_table
+        if where_clauses:
+            query += " WHERE " + " AND ".join(where_clauses)
+        return [row[0] for row in self.select(query + " ORDER BY start_ts", args)]
+
+    def _data_sources(self, start=None, end=None):
+        # FROM clauses for the raw data between start and end. With partitions they only read the overlapping
+        # partitions, at most MAX_PARTITIONS_PER_QUERY each; SQLite pushes the WHERE clause of the outer query down
+        # into each of them. Callers merge the results of the FROM clauses when there is more than one.
+        if not self.is_partitioned():
+            return [self.data_table]
+        tables = [self.data_table] + self.get_partitions(start, end)
+        return ['(' + ' UNION ALL '.join('SELECT ts, topic_id, value_string FROM ' + table
+                                         for table in tables[i:i + MAX_PARTITIONS_PER_QUERY]) + ')'
+                for i in range(0, len(tables), MAX_PARTITIONS_PER_QUERY)]
+
+    def _get_partition(self, ts):
+        if isinstance(ts, str):
+            ts = utils.parse_timestamp_string(ts)
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=pytz.UTC)
+        start = _PARTITION_ORIGIN + ((ts - _PARTITION_ORIGIN) // self.partition_period) * self.partition_period
+        return self.data_table + start.strftime('_%Y%m%d%H'), start, start + self.partition_period
+
+    def _create_partition(self, name, start, end):
+        if name in self._known_partitions:
+            return
+        self.execute_stmt(
+            '''CREATE TABLE IF NOT EXISTS ''' + name +
+            ''' (ts timestamp NOT NULL,
+                 topic_id INTEGER NOT NULL,
+                 value_string TEXT NOT NULL,
+                 UNIQUE(topic_id, ts))''')
+        self.execute_stmt('''CREATE INDEX IF NOT EXISTS idx_''' + name + ''' ON ''' + name + ''' (ts ASC)''')
+        self.execute_stmt('''INSERT OR IGNORE INTO ''' + self.partitions_table + ''' values(?, ?, ?)''',
+                          (name, start, end))
+        self._known_partitions.add(name)
+
+    def _drop_partition(self, name):
+        self.execute_stmt('''DROP TABLE IF EXISTS ''' + name)
+        self.execute_stmt('''DELETE FROM ''' + self.partitions_table + ''' WHERE name = ?''', (name,))
+        self._known_partitions.discard(name)
+
+    def _insert_partitioned(self, records):
+        by_partition = defaultdict(list)
+        for record in records:
+            by_partition[self._get_partition(record[0])].append(record)
+        for partition, rows in by_partition.items():
+            query = '''INSERT OR REPLACE INTO ''' + partition[0] + ''' values(?, ?, ?)'''
+            try:
+                self._create_partition(*partition)
+                self.execute_many(query, rows)
+            except sqlite3.OperationalError:
+                # The partition was rolled back or dropped through another connection since it was created
+                self._known_partitions.discard(partition[0])
+                self._create_partition(*partition)
+                self.execute_many(query, rows)
+
+    def insert_data(self, ts, topic_id, data):
+        if not self.partition_period:
+            return super(SqlLiteFuncts, self).insert_data(ts, topic_id, data)
+        self._insert_partitioned([(ts, topic_id, jsonapi.dumps(data))])
+        return True
+
     def setup_aggregate_historian_tables(self):
 
         self.execute_stmt(
@@ -182,21 +477,15 @@ class SqlLiteFuncts(DbDriver):
         @param count:
         @param order:
         """
-        table_name = self.data_table
         value_col = 'value_string'
         if agg_type and agg_period:
-            table_name = agg_type + "_" + agg_period
+            sources = [agg_type + "_" + agg_period]
             value_col = 'agg_value'
+        else:
+            sources = self._data_sources(start, end)
 
-        query = '''SELECT topic_id, ts, ''' + value_col + '''
-                   FROM ''' + table_name + '''
-                   {where}
-                   {order_by}
-                   {limit}
-                   {offset}'''
-
-        where_clauses = ["WHERE topic_id = ?"]
-        args = [topic_ids[0]]
+        where_clauses = []
+        args = []
 
         # base historian converts naive timestamps to UTC, but if the start and end had explicit timezone info then they
         # need to get converted to UTC since sqlite3 only store naive timestamp
@@ -216,51 +505,228 @@ class SqlLiteFuncts(DbDriver):
                 where_clauses.append("ts < ?")
                 args.append(end)
 
-        where_statement = ' AND '.join(where_clauses)
-
-        order_by = 'ORDER BY topic_id ASC, ts ASC'
-        if order == 'LAST_TO_FIRST':
-            order_by = ' ORDER BY topic_id DESC, ts DESC'
+        ts_order = 'DESC' if order == 'LAST_TO_FIRST' else 'ASC'
 
-        # can't have an offset without a limit
         # -1 = no limit and allows the user to provide just an offset
         if count is None:
             count = -1
+        limited = count >= 0 or skip > 0
 
-        limit_statement = 'LIMIT ?'
-        args.append(count)
-
-        offset_statement = ''
-        if skip > 0:
-            offset_statement = 'OFFSET ?'
-            args.append(skip)
+        # All topics of a chunk are fetched by one statement. skip and count apply to each topic, which needs
+        # a window function (sqlite 3.25) when a statement covers more than one topic.
+        chunk_size = MAX_TOPICS_PER_QUERY
+        if limited and sqlite3.sqlite_version_info < (3, 25, 0):
+            chunk_size = 1
 
-        real_query = query.format(where=where_statement,
-                                  limit=limit_statement,
-                                  offset=offset_statement,
-                                  order_by=order_by)
-        _log.debug("Real Query: " + real_query)
-        _log.debug("args: " + str(args))
+        # With more than one batch of partitions, the first skip + count rows of each topic are read from every
+        # batch, and the rows of each topic are sorted and sliced once all batches have been read.
+        merged = len(sources) > 1
+        query_skip, query_count = (0, skip + count if count >= 0 else -1) if merged else (skip, count)
 
-        values = defaultdict(list)
+        rows = defaultdict(list)
         start_t = datetime.utcnow()
-        for topic_id in topic_ids:
-            args[0] = topic_id
-            values[id_name_map[topic_id]] = []
-            cursor = self.select(real_query, args, fetch_all=False)
-            if cursor:
-                if value_col == 'agg_value':
-                    for _id, ts, value in cursor:
-                        values[id_name_map[topic_id]].append((utils.format_timestamp(ts), value))
-                    cursor.close()
+        for i in range(0, len(topic_ids), chunk_size):
+            chunk = topic_ids[i:i + chunk_size]
+            where_statement = ' AND '.join(
+                ["WHERE topic_id IN ({})".format(', '.join(['?'] * len(chunk)))] + where_clauses)
+            for table_name in sources:
+                chunk_args = list(chunk) + args
+                if limited and len(chunk) > 1:
+                    row_clauses = ["row_num > ?"]
+                    chunk_args.append(query_skip)
+                    if query_count >= 0:
+                        row_clauses.append("row_num <= ?")
+                        chunk_args.append(query_skip + query_count)
+                    real_query = '''SELECT topic_id, ts, {value_col} FROM
+                                   (SELECT topic_id, ts, {value_col},
+                                    ROW_NUMBER() OVER (PARTITION BY topic_id ORDER BY ts {ts_order}) AS row_num
+                                    FROM {table_name} {where}) AS windowed
+                                   WHERE {row_filter}
+                                   ORDER BY topic_id, ts {ts_order}'''.format(value_col=value_col,
+                                                                             table_name=table_name,
+                                                                             where=where_statement,
+                                                                             ts_order=ts_order,
+                                                                             row_filter=' AND '.join(row_clauses))
                 else:
-                    for _id, ts, value in cursor:
-                        values[id_name_map[topic_id]].append((utils.format_timestamp(ts), jsonapi.loads(value)))
+                    real_query = '''SELECT topic_id, ts, {value_col}
+                                   FROM {table_name}
+                                   {where}
+                                   ORDER BY topic_id, ts {ts_order}'''.format(value_col=value_col,
+                                                                             table_name=table_name,
+                                                                             where=where_statement,
+                                                                             ts_order=ts_order)
+                    if limited:
+                        # can't have an offset without a limit
+                        real_query += ' LIMIT ? OFFSET ?'
+                        chunk_args.extend([query_count, query_skip])
+                _log.debug("Real Query: " + real_query)
+                _log.debug("args: " + str(chunk_args))
+
+                cursor = self.select(real_query, chunk_args, fetch_all=False)
+                if cursor:
+                    for topic_id, ts, value in cursor:
+                        rows[topic_id].append((ts, value))
                     cursor.close()
 
+        values = defaultdict(list)
+        for topic_id in topic_ids:
+            topic_rows = rows[topic_id]
+            if merged:
+                topic_rows.sort(key=lambda row: row[0], reverse=ts_order == 'DESC')
+                topic_rows = topic_rows[skip:skip + count if count >= 0 else None]
+            if value_col == 'agg_value':
+                values[id_name_map[topic_id]] = [(utils.format_timestamp(ts), value) for ts, value in topic_rows]
+            else:
+                values[id_name_map[topic_id]] = [(utils.format_timestamp(ts), jsonapi.loads(value))
+                                                 for ts, value in topic_rows]
+
         _log.debug("Time taken to load results from db:{}".format(datetime.utcnow()-start_t))
         return values
 
+    def query_page(self, topic_ids, id_name_map, start=None, end=None, after=None, count=1000,
+                   order="FIRST_TO_LAST"):
+        op, direction = ('<', 'DESC') if order == 'LAST_TO_FIRST' else ('>', 'ASC')
+        where_clauses = []
+        args = []
+        if start:
+            where_clauses.append("ts >= ?")
+            args.append(start.astimezone(pytz.UTC))
+        if end:
+            where_clauses.append("ts < ?")
+            args.append(end.astimezone(pytz.UTC))
+        if after:
+            # The key holds ts as stored, so it compares exactly like the column
+            after_ts, after_id = after
+            where_clauses.append("(ts {op} ? OR (ts = ? AND topic_id {op} ?))".format(op=op))
+            args.extend([after_ts, after_ts, after_id])
+        args.append(count)
+        sources = self._data_sources(start, end)
+
+        # Every chunk of topics and batch of partitions is paged separately, within the bound variable and compound
+        # SELECT limits, and the pages are merged. The rows are sorted by ts as stored, like the ORDER BY of the
+        # statement.
+        pages = []
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            chunk = topic_ids[i:i + MAX_TOPICS_PER_QUERY]
+            for table_name in sources:
+                real_query = '''SELECT CAST(ts AS TEXT), topic_id, ts, value_string
+                               FROM {table_name}
+                               WHERE {where}
+                               ORDER BY ts {direction}, topic_id {direction}
+                               LIMIT ?'''.format(table_name=table_name,
+                                                  where=' AND '.join(
+                                                      ["topic_id IN ({})".format(', '.join(['?'] * len(chunk)))] +
+                                                      where_clauses),
+                                                  direction=direction)
+                _log.debug("Real Query: " + real_query)
+                _log.debug("args: " + str(args))
+                rows = self.select(real_query, list(chunk) + args)
+                pages.append(rows if rows else [])
+        page = merge_pages(pages, count, direction == 'DESC')
+
+        values = defaultdict(list)
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        last = None
+        for ts_key, topic_id, ts, value in page:
+            values[id_name_map[topic_id]].append((utils.format_timestamp(ts), jsonapi.loads(value)))
+            last = [ts_key, topic_id]
+        return values, last if len(page) == count else None
+
+    def query_minmax(self, topic_ids, id_name_map, start=None, end=None, buckets=100, max_points=200,
+                     order="FIRST_TO_LAST"):
+        if sqlite3.sqlite_version_info < (3, 25, 0):
+            raise NotImplementedError("Downsampling needs window functions (sqlite 3.25)")
+        where_clauses = []
+        args = []
+        if start:
+            where_clauses.append("ts >= ?")
+            args.append(start.astimezone(pytz.UTC))
+        if end:
+            where_clauses.append("ts < ?")
+            args.append(end.astimezone(pytz.UTC))
+        sources = self._data_sources(start, end)
+        seconds = "(julianday(ts) - 2440587.5) * 86400.0"
+        chunks = [topic_ids[i:i + MAX_TOPICS_PER_QUERY] for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY)]
+
+        def chunk_where(chunk):
+            return ' AND '.join(["topic_id IN ({})".format(', '.join(['?'] * len(chunk)))] + where_clauses)
+
+        t0 = start.timestamp() if start else None
+        t1 = end.timestamp() if end else None
+        if (len(chunks) > 1 or len(sources) > 1) and (t0 is None or t1 is None):
+            # Every chunk of topics and batch of partitions is split into the same buckets, so the range of the rows
+            # of all of them is needed
+            bounds = [self.select("SELECT MIN({seconds}), MAX({seconds}) FROM {table_name} WHERE {where}".format(
+                seconds=seconds, table_name=table_name, where=chunk_where(chunk)), list(chunk) + args)[0]
+                for chunk in chunks for table_name in sources]
+            bounds = [row for row in bounds if row[0] is not None]
+            if not bounds:
+                return {id_name_map[topic_id]: [] for topic_id in topic_ids}
+            t0 = min(row[0] for row in bounds) if t0 is None else t0
+            t1 = max(row[1] for row in bounds) if t1 is None else t1
+
+        values = defaultdict(list)
+        for topic_id in topic_ids:
+            values[id_name_map[topic_id]] = []
+        descending = order == 'LAST_TO_FIRST'
+        for chunk in chunks:
+            # Each batch of partitions keeps all rows of a topic, or the first rows of every bucket by value, which
+            # carry the count of rows of the topic in the batch. The lowest and highest numbers are selected from
+            # them once the total count of each topic is known.
+            candidates = defaultdict(list)
+            totals = defaultdict(int)
+            for table_name in sources:
+                # Values are stored as JSON, so numbers are the values that start with a digit or a minus sign.
+                real_query = '''WITH source AS (
+                                   SELECT topic_id, ts, value_string, {seconds} AS seconds,
+                                          CASE WHEN value_string GLOB '[0-9]*' OR value_string GLOB '-[0-9]*'
+                                               THEN CAST(value_string AS REAL) END AS v
+                                   FROM {table_name}
+                                   WHERE {where}),
+                               bounds AS (
+                                   SELECT COALESCE(?, MIN(seconds)) AS t0, COALESCE(?, MAX(seconds)) AS t1
+                                   FROM source),
+                               bucketed AS (
+                                   SELECT topic_id, ts, value_string, v,
+                                          MIN(MAX(CAST((seconds - t0) * ? / MAX(t1 - t0, 1e-6) AS INTEGER), 0), ? - 1)
+                                              AS bucket,
+                                          COUNT(*) OVER (PARTITION BY topic_id) AS total
+                                   FROM source, bounds),
+                               ranked AS (
+                                   SELECT topic_id, ts, value_string, v, bucket, total,
+                                          ROW_NUMBER() OVER (PARTITION BY topic_id, bucket
+                                                             ORDER BY v IS NULL, v ASC, ts ASC) AS low,
+                                          ROW_NUMBER() OVER (PARTITION BY topic_id, bucket
+                                                             ORDER BY v IS NULL, v DESC, ts ASC) AS high
+                                   FROM bucketed)
+                               SELECT topic_id, ts, value_string, v, bucket, total
+                               FROM ranked
+                               WHERE total <= ? OR low = 1 OR high = 1
+                               ORDER BY topic_id, ts {direction}'''.format(seconds=seconds, table_name=table_name,
+                                                                           where=chunk_where(chunk),
+                                                                           direction='DESC' if descending else 'ASC')
+                chunk_args = list(chunk) + args + [t0, t1, buckets, buckets, max_points]
+                _log.debug("Real Query: " + real_query)
+                _log.debug("args: " + str(chunk_args))
+                cursor = self.select(real_query, chunk_args, fetch_all=False)
+                if cursor:
+                    batch_totals = {}
+                    for topic_id, ts, value, v, bucket, total in cursor:
+                        candidates[topic_id].append((ts, value, v, bucket))
+                        batch_totals[topic_id] = total
+                    for topic_id, total in batch_totals.items():
+                        totals[topic_id] += total
+                    cursor.close()
+            for topic_id, rows in candidates.items():
+                if totals[topic_id] > max_points:
+                    rows = sorted(_minmax_rows(rows), key=lambda row: row[0], reverse=descending)
+                elif len(sources) > 1:
+                    rows.sort(key=lambda row: row[0], reverse=descending)
+                values[id_name_map[topic_id]] = [(utils.format_timestamp(ts), jsonapi.loads(value))
+                                                 for ts, value, v, bucket in rows]
+        return values
+
     def manage_db_size(self, history_limit_timestamp, storage_limit_gb):
         """
         Manage database size.
@@ -271,6 +737,10 @@ class SqlLiteFuncts(DbDriver):
         _log.debug("Managing store - timestamp limit: {}  GB size limit: {}".format(
             history_limit_timestamp, storage_limit_gb))
 
+        if self.is_partitioned():
+            self._manage_partitioned_db_size(history_limit_timestamp, storage_limit_gb)
+            return
+
         commit = False
 
         if history_limit_timestamp is not None:
@@ -308,6 +778,53 @@ class SqlLiteFuncts(DbDriver):
             _log.debug("Committing changes for manage_db_size.")
             self.commit()
 
+    def _manage_partitioned_db_size(self, history_limit_timestamp, storage_limit_gb):
+        # Old data is removed by dropping whole partitions, which is quick and, with auto_vacuum, returns the
+        # space to the file system. Rows are only deleted from the data table (rows written before partitioning
+        # was enabled) and from the partition that holds the history limit.
+        if history_limit_timestamp is not None:
+            if isinstance(history_limit_timestamp, str):
+                history_limit_timestamp = utils.parse_timestamp_string(history_limit_timestamp)
+            if history_limit_timestamp.tzinfo is None:
+                history_limit_timestamp = history_limit_timestamp.replace(tzinfo=pytz.UTC)
+            history_limit_timestamp = history_limit_timestamp.astimezone(pytz.UTC)
+            expired = [row[0] for row in self.select(
+                '''SELECT name FROM ''' + self.partitions_table + ''' WHERE end_ts <= ?''',
+                [history_limit_timestamp])]
+            for name in expired:
+                self._drop_partition(name)
+            count = 0
+            for table in [self.data_table] + self.get_partitions(end=history_limit_timestamp):
+                count += self.execute_stmt('''DELETE FROM ''' + table + ''' WHERE ts < ?''',
+                                           (history_limit_timestamp,))
+            _log.debug("Dropped {} partitions and deleted {} old items from historian. (TTL exceeded)".format(
+                len(expired), count))
+            self.commit()
+
+        if storage_limit_gb is not None:
+            page_size = self.select('''PRAGMA page_size''')[0][0]
+            max_pages = int(ceil(storage_limit_gb * 1024 ** 3 / page_size))
+
+            while self.select("PRAGMA page_count")[0][0] >= max_pages:
+                partitions = self.get_partitions()
+                if self.select('''SELECT 1 FROM ''' + self.data_table + ''' LIMIT 1'''):
+                    table = self.data_table
+                elif len(partitions) > 1:
+                    _log.debug("Dropping partition {}. (Managing store size)".format(partitions[0]))
+                    self._drop_partition(partitions[0])
+                    self.commit()
+                    continue
+                elif partitions:
+                    table = partitions[0]
+                else:
+                    break
+                count = self.execute_stmt('''DELETE FROM ''' + table + ''' WHERE ts IN
+                                             (SELECT ts FROM ''' + table + ''' ORDER BY ts ASC LIMIT 100)''')
+                self.commit()
+                if not count:
+                    break
+                _log.debug("Deleted {} old items from historian. (Managing store size)".format(count))
+
     def insert_meta_query(self):
         return '''INSERT OR REPLACE INTO ''' + self.meta_table + \
                ''' values(?, ?)'''
@@ -496,8 +1013,7 @@ class SqlLiteFuncts(DbDriver):
         if isinstance(agg_type, str):
             if agg_type.upper() not in ['AVG', 'MIN', 'MAX', 'COUNT', 'SUM']:
                 raise ValueError("Invalid aggregation type {}".format(agg_type))
-        query = '''SELECT ''' + agg_type + '''(value_string), count(value_string) FROM ''' + \
-                self.data_table + ''' {where}'''
+        query = '''SELECT ''' + agg_type + '''(value_string), count(value_string) FROM {table_name} {where}'''
 
         where_clauses = ["WHERE topic_id = ?"]
         args = [topic_ids[0]]
@@ -530,17 +1046,73 @@ class SqlLiteFuncts(DbDriver):
 
         where_statement = ' AND '.join(where_clauses)
 
-        real_query = query.format(where=where_statement)
-        _log.debug("Real Query: " + real_query)
-        _log.debug("args: " + str(args))
-
-        results = self.select(real_query, args)
+        results = []
+        for table_name in self._data_sources(start, end):
+            real_query = query.format(table_name=table_name, where=where_statement)
+            _log.debug("Real Query: " + real_query)
+            _log.debug("args: " + str(args))
+            rows = self.select(real_query, args)
+            if rows:
+                results.append(rows[0])
         if results:
-            _log.debug("results got {}, {}".format(results[0][0], results[0][1]))
-            return results[0][0], results[0][1]
+            value, count = _merge_aggregates(agg_type, results)
+            _log.debug("results got {}, {}".format(value, count))
+            return value, count
         else:
             return 0, 0
 
+    def collect_partial_aggregates(self, topic_ids, start=None, end=None, count_only=False):
+        # SQLite has no VAR_POP, so the squared deviations are summed over a join with the mean of each topic
+        if count_only:
+            columns = "COUNT(*), SUM(v), NULL, NULL, NULL"
+            topic_mean = ""
+        else:
+            columns = "COUNT(value_string), SUM(v), SUM((v - mean) * (v - mean)), MIN(v), MAX(v)"
+            topic_mean = '''JOIN (SELECT topic_id, AVG(v) AS mean FROM source GROUP BY topic_id) AS topic_mean
+                              ON topic_mean.topic_id = source.topic_id'''
+        where_clauses = []
+        args = []
+        if start:
+            where_clauses.append("ts >= ?")
+            args.append(start.astimezone(pytz.UTC))
+        if end:
+            where_clauses.append("ts < ?")
+            args.append(end.astimezone(pytz.UTC))
+        sources = self._data_sources(start, end)
+        partials = {}
+        # Topics are aggregated separately, so every chunk of topics is queried on its own. The partial aggregates
+        # of every batch of partitions are merged.
+        for i in range(0, len(topic_ids), MAX_TOPICS_PER_QUERY):
+            chunk = topic_ids[i:i + MAX_TOPICS_PER_QUERY]
+            for table_name in sources:
+                real_query = '''WITH source AS (SELECT topic_id, value_string, CAST(value_string AS REAL) AS v
+                                                FROM {table_name}
+                                                WHERE {where})
+                                SELECT source.topic_id, {columns}
+                                FROM source {topic_mean}
+                                GROUP BY source.topic_id'''.format(
+                    columns=columns, table_name=table_name, topic_mean=topic_mean,
+                    where=' AND '.join(["topic_id IN ({})".format(', '.join(['?'] * len(chunk)))] + where_clauses))
+                _log.debug("Real Query: " + real_query)
+                _log.debug("args: " + str(args))
+                for row in self.select(real_query, list(chunk) + args):
+                    partial = tuple(row[1:])
+                    partials[row[0]] = _merge_partials(partials[row[0]], partial) if row[0] in partials else partial
+        return partials
+
+    def get_last_aggregate_time(self, agg_type, agg_time_period, agg_topic_id):
+        table_name = agg_type + '_' + agg_time_period
+        rows = self.select('''SELECT ts FROM ''' + table_name + ''' WHERE topic_id = ? ORDER BY ts DESC LIMIT 1''',
+                           [agg_topic_id])
+        if not rows:
+            return None
+        ts = rows[0][0]
+        if isinstance(ts, str):
+            ts = utils.parse_timestamp_string(ts)
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=pytz.UTC)
+        return ts
+
     @staticmethod
     def get_tagging_query_from_ast(topic_tags_table, tup, tag_refs):
         """
@@ -50,6 +50,7 @@ DISCOVERY_ERROR = -32003
 UNABLE_TO_UNREGISTER_INSTANCE = -32004
 UNAVAILABLE_PLATFORM = -32005
 UNAVAILABLE_AGENT = -32006
+AGENT_BUSY = -32007
 
 
 def json_validate_request(jsonrequest):
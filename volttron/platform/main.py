@@ -57,7 +57,7 @@ import gevent
 import zmq
 from zmq import ZMQError, green, NOBLOCK
 
-from volttron.platform.agent.utils import get_platform_instance_name
+from volttron.platform.agent.utils import get_platform_instance_name, get_hot_path_logger, configure_hot_path_loggers
 # Create a context common to the green and non-green zmq modules.
 from volttron.platform.instance_setup import _update_config_file
 from volttron.platform.vip.healthservice import HealthService
@@ -308,7 +308,10 @@ class Router(BaseRouter):
                  external_address_file='',
                  msgdebug=None,
                  agent_monitor_frequency=600,
-                 service_notifier=Optional[ServicePeerNotifier]):
+                 service_notifier=Optional[ServicePeerNotifier],
+                 external_batch_size=0,
+                 external_batch_interval=0.1,
+                 external_compression='none'):
 
         super(Router, self).__init__(context=context,
                                      default_user_id=default_user_id,
@@ -321,6 +324,7 @@ class Router(BaseRouter):
         self.logger = logging.getLogger('vip.router')
         if self.logger.level == logging.NOTSET:
             self.logger.setLevel(logging.WARNING)
+        self._hot_log = get_hot_path_logger('vip.router')
         self._monitor = monitor
         self._tracker = tracker
         self._volttron_central_address = volttron_central_address
@@ -343,6 +347,9 @@ class Router(BaseRouter):
         self._message_debugger_socket = None
         self._instance_name = instance_name
         self._agent_monitor_frequency = agent_monitor_frequency
+        self._external_batch_size = external_batch_size
+        self._external_batch_interval = external_batch_interval
+        self._external_compression = external_compression
 
     def setup(self):
         sock = self.socket
@@ -383,7 +390,10 @@ class Router(BaseRouter):
 
         self._ext_routing = RoutingService(self.socket, self.context,
                                            self._socket_class, self._poller,
-                                           self._addr, self._instance_name)
+                                           self._addr, self._instance_name,
+                                           batch_size=self._external_batch_size,
+                                           batch_interval=self._external_batch_interval,
+                                           compression=self._external_compression)
 
         self.pubsub = PubSubService(self.socket, self._protected_topics,
                                     self._ext_routing)
@@ -392,16 +402,17 @@ class Router(BaseRouter):
         _log.debug("ZMQ version: {}".format(zmq.zmq_version()))
 
     def issue(self, topic, frames, extra=None):
-        log = self.logger.debug
-        formatter = FramesFormatter(frames)
-        if topic == ERROR:
-            errnum, errmsg = extra
-            log('%s (%s): %s', errmsg, errnum, formatter)
-        elif topic == UNROUTABLE:
-            log('unroutable: %s: %s', extra, formatter)
-        else:
-            log('%s: %s', ('incoming' if topic == INCOMING else 'outgoing'),
-                formatter)
+        log = self._hot_log
+        if log.isEnabledFor(logging.DEBUG):
+            formatter = FramesFormatter(frames)
+            if topic == ERROR:
+                errnum, errmsg = extra
+                log.debug('%s (%s): %s', errmsg, errnum, formatter)
+            elif topic == UNROUTABLE:
+                log.debug('unroutable: %s: %s', extra, formatter)
+            else:
+                log.debug('%s: %s', ('incoming' if topic == INCOMING else 'outgoing'),
+                          formatter)
         if self._tracker:
             self._tracker.hit(topic, frames, extra)
         if self._msgdebug:
@@ -523,15 +534,14 @@ class Router(BaseRouter):
         Poll for incoming messages through router socket or other external socket connections
         """
         try:
-            sockets = dict(self._poller.poll())
+            sockets = dict(self._poller.poll(self._poll_timeout()))
         except ZMQError as ex:
             _log.error("ZMQ Error while polling: {}".format(ex))
 
         for sock in sockets:
             if sock == self.socket:
                 if sockets[sock] == zmq.POLLIN:
-                    frames = sock.recv_multipart(copy=False)
-                    self.route(deserialize_frames(frames))
+                    self._read_backlog(sock)
             elif sock in self._ext_routing._vip_sockets:
                 if sockets[sock] == zmq.POLLIN:
                     # _log.debug("From Ext Socket: ")
@@ -541,6 +551,34 @@ class Router(BaseRouter):
             else:
                 # _log.debug("External ")
                 frames = sock.recv_multipart(copy=False)
+        self.route_queued()
+        self.pubsub.flush_conflated()
+        self._ext_routing.flush_batches()
+
+    def _poll_timeout(self):
+        """
+        Poll timeout in milliseconds: until the next conflated message or external batch is due, None to block.
+        Does not block while subscription snapshots are waiting to be admitted.
+        """
+        if self.admission_pending():
+            return 0
+        timeouts = [timeout for timeout in (self.pubsub.conflation_timeout(), self._ext_routing.batch_timeout())
+                    if timeout is not None]
+        return min(timeouts) if timeouts else None
+
+    def _read_backlog(self, sock):
+        """
+        Read the messages waiting on the router socket, up to backlog_batch_size, and queue them
+        on the priority or bulk lane so that control traffic is not stuck behind bulk publishes.
+        """
+        for _ in range(self.backlog_batch_size):
+            try:
+                frames = sock.recv_multipart(flags=NOBLOCK, copy=False)
+            except ZMQError as exc:
+                if exc.errno == zmq.EAGAIN:
+                    break
+                raise
+            self.enqueue(deserialize_frames(frames))
 
     def ext_route(self, socket):
         """
@@ -730,6 +768,7 @@ def start_volttron_process(opts):
     # Removed the check for opts.web_ca_cert to be the same cert that was used to create web_ssl_key
     # and opts.web_ssl_cert
 
+    configure_hot_path_loggers(opts.hot_log_sample_every, opts.hot_log_max_per_second)
     os.environ['MESSAGEBUS'] = opts.message_bus
     os.environ['AGENT_ISOLATION_MODE'] = opts.agent_isolation_mode
     os.environ['AUTH_ENABLED'] = opts.allow_auth
@@ -914,7 +953,10 @@ def start_volttron_process(opts):
                    protected_topics=protected_topics,
                    external_address_file=external_address_file,
                    msgdebug=opts.msgdebug,
-                   service_notifier=notifier).run()
+                   service_notifier=notifier,
+                   external_batch_size=opts.external_batch_size,
+                   external_batch_interval=opts.external_batch_interval,
+                   external_compression=opts.external_compression).run()
         except Exception:
             _log.exception('Unhandled exception in router loop')
             raise
@@ -1335,6 +1377,16 @@ def main(argv=sys.argv):
                         metavar='LOGGER:LEVEL',
                         action=LogLevelAction,
                         help='override default logger logging level')
+    parser.add_argument('--hot-log-sample-every',
+                        type=int,
+                        default=1,
+                        help='log only one in this many records of per-message code paths, '
+                        'in the platform and the agents it starts. Default=1')
+    parser.add_argument('--hot-log-max-per-second',
+                        type=int,
+                        default=None,
+                        help='maximum records logged per second by each per-message code path, '
+                        'in the platform and the agents it starts. Default: no limit')
     parser.add_argument('--monitor',
                         action='store_true',
                         help='monitor and log connections (implies -v)')
@@ -1459,6 +1511,22 @@ def main(argv=sys.argv):
         default=600,
         help='How often should the platform check for crashed agents and '
         'attempt to restart. Units=seconds. Default=600')
+    agents.add_argument(
+        '--external-batch-size',
+        type=int,
+        default=0,
+        help='Number of publishes to coalesce into one message per remote platform. '
+        'Values below 2 send every publish on its own. Default=0')
+    agents.add_argument(
+        '--external-batch-interval',
+        type=float,
+        default=0.1,
+        help='Maximum time a publish to a remote platform waits to be batched. Units=seconds. Default=0.1')
+    agents.add_argument(
+        '--external-compression',
+        default='none',
+        choices=['none', 'zlib', 'zstd'],
+        help='Compression applied to batches sent to remote platforms. Default=none')
     agents.add_argument(
         '--agent-isolation-mode',
         default=False,
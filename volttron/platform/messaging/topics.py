@@ -74,6 +74,7 @@ PLATFORM_BASE = _('platform')
 PLATFORM_SEND_EMAIL = _('platform/send_email')
 PLATFORM = _('platform/{subtopic}')
 PLATFORM_SHUTDOWN = PLATFORM(subtopic='shutdown')
+PLATFORM_HEALTH_STATUS = _('platform/health/status/{identity}')
 PLATFORM_VCP_DEVICES = _('platforms/{platform_uuid}/devices/{topic}')
 
 RECORD_BASE = _('record')
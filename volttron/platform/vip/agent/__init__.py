@@ -25,14 +25,13 @@
 import os
 import logging as _log
 
-from volttron.platform.vip.agent.subsystems.web import WebSubSystem
-
 from .core import *
 from .errors import *
 from .decorators import *
 from .subsystems import *
 from .... import platform
 from .... platform.agent.utils import is_valid_identity, is_auth_enabled
+from .... platform.agent.startuptrace import measure
 
 
 class Agent:
@@ -40,28 +39,37 @@ class Agent:
         def __init__(self, owner, core, heartbeat_autostart,
                      heartbeat_period, enable_store, enable_web,
                      enable_channel, enable_fncs, enable_auth, message_bus):
-            self.peerlist = PeerList(core)
-            self.ping = Ping(core)
-            self.rpc = RPC(core, owner, self.peerlist)
-            self.hello = Hello(core)
+            # Optional subsystems, and the dependencies they pull in, are
+            # only imported when they are enabled.
+            self._create('peerlist', PeerList, core)
+            self._create('ping', Ping, core)
+            self._create('rpc', RPC, core, owner, self.peerlist)
+            self._create('hello', Hello, core)
             if message_bus == 'rmq':
-                self.pubsub = RMQPubSub(core, self.rpc, self.peerlist, owner)
+                from .subsystems.rmq_pubsub import RMQPubSub
+                self._create('pubsub', RMQPubSub, core, self.rpc, self.peerlist, owner)
             else:
-                self.pubsub = PubSub(core, self.rpc, self.peerlist, owner)
+                self._create('pubsub', PubSub, core, self.rpc, self.peerlist, owner)
                 # Available only for ZMQ agents
                 if enable_channel:
-                    self.channel = Channel(core)
-            self.health = Health(owner, core, self.rpc)
-            self.heartbeat = Heartbeat(owner, core, self.rpc, self.pubsub,
-                                       heartbeat_autostart, heartbeat_period)
+                    self._create('channel', Channel, core)
+            self._create('health', Health, owner, core, self.rpc)
+            self._create('heartbeat', Heartbeat, owner, core, self.rpc, self.pubsub,
+                         heartbeat_autostart, heartbeat_period)
             if enable_store:
-                self.config = ConfigStore(owner, core, self.rpc)
+                self._create('config', ConfigStore, owner, core, self.rpc)
             if enable_web:
-                self.web = WebSubSystem(owner, core, self.rpc)
+                from .subsystems.web import WebSubSystem
+                self._create('web', WebSubSystem, owner, core, self.rpc)
             if enable_auth:
-                self.auth = Auth(owner, core, self.rpc)
+                self._create('auth', Auth, owner, core, self.rpc)
             if enable_fncs:
-                self.fncs = FNCS(owner, core, self.pubsub)
+                from .subsystems.volttronfncs import FNCS
+                self._create('fncs', FNCS, owner, core, self.pubsub)
+
+        def _create(self, name, factory, *args):
+            with measure('subsystem', name):
+                setattr(self, name, factory(*args))
 
     def __init__(self, identity=None, address=None, context=None,
                  publickey=None, secretkey=None, serverkey=None,
@@ -73,7 +81,8 @@ class Agent:
                  enable_web=False, enable_channel=False,
                  reconnect_interval=None, version='0.1', enable_fncs=False,
                  instance_name=None, message_bus=None,
-                 volttron_central_address=None, volttron_central_instance_name=None, enable_auth=is_auth_enabled()):
+                 volttron_central_address=None, volttron_central_instance_name=None, enable_auth=is_auth_enabled(),
+                 inbox_max_messages=None, inbox_max_bytes=None):
 
         if volttron_home is None:
             volttron_home = os.path.abspath(platform.get_home())
@@ -112,6 +121,7 @@ class Agent:
             self.vip = Agent.Subsystems(self, self.core, heartbeat_autostart,
                                         heartbeat_period, enable_store, enable_web,
                                         enable_channel, enable_fncs, enable_auth, message_bus)
+            self.core.inbox.configure(inbox_max_messages, inbox_max_bytes)
             self.core.setup()
             self.vip.rpc.export(self.core.version, 'agent.version')
         except Exception as e:
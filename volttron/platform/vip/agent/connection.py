@@ -154,12 +154,15 @@ class Connection:
 
             self._connected_since = get_aware_utc_now()
             if self.peer:
-                if self.peer not in self._server.vip.peerlist().get(timeout=2):
+                if not self._server.vip.peerlist.is_connected(self.peer):
                     self._log.warning('peer {} not found connected to router.'.format(self.peer))
         return self._server
 
     def peers(self, timeout=DEFAULT_TIMEOUT):
-        return self.server.vip.peerlist().get(timeout=timeout)
+        peerlist = self.server.vip.peerlist
+        if peerlist.seeded:
+            return peerlist.peers()
+        return peerlist().get(timeout=timeout)
 
     def is_connected(self, timeout=DEFAULT_TIMEOUT):
         return self.server.core.connected and self.is_peer_connected(timeout)
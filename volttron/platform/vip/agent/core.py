@@ -27,6 +27,7 @@ import inspect
 import logging
 import os
 import platform as python_platform
+import random
 import signal
 import threading
 import time
@@ -64,6 +65,7 @@ from ..zmq_connection import ZMQConnection
 from .decorators import annotate, annotations, dualmethod
 from .dispatch import Signal
 from .errors import VIPError
+from .inbox import Inbox
 
 if is_rabbitmq_available():
     import pika
@@ -72,6 +74,15 @@ __all__ = ['BasicCore', 'Core', 'RMQCore', 'ZMQCore', 'killing']
 
 _log = logging.getLogger(__name__)
 
+# Reconnection to the router backs off exponentially from a per-agent
+# random base interval (milliseconds) up to RECONNECT_INTERVAL_MAX, and
+# the hello that triggers resynchronization after a reconnect is delayed
+# by up to RESYNC_JITTER seconds, so agents do not all resynchronize at
+# the same instant after a platform restart.
+RECONNECT_INTERVAL_RANGE = (100, 300)
+RECONNECT_INTERVAL_MAX = 5000
+RESYNC_JITTER = 2.0
+
 
 class Periodic:  # pylint: disable=invalid-name
     ''' Decorator to set a method up as a periodic callback.
@@ -512,6 +523,8 @@ class Core(BasicCore):
         self.instance_name = instance_name
         self.messagebus = messagebus
         self.subsystems = {'error': self.handle_error}
+        # Budget and accounting of the messages waiting to be handled
+        self.inbox = Inbox()
         self.__connected = False
         self._version = version
         self.socket = None
@@ -706,7 +719,9 @@ class ZMQCore(Core):
                                         self.instance_name,
                                         context=self.context)
         self.connection.open_connection(zmq.DEALER)
-        flags = dict(hwm=6000, reconnect_interval=self.reconnect_interval)
+        reconnect_interval = self.reconnect_interval or random.randint(*RECONNECT_INTERVAL_RANGE)
+        flags = dict(hwm=6000, reconnect_interval=reconnect_interval,
+                     reconnect_interval_max=max(reconnect_interval, RECONNECT_INTERVAL_MAX))
         self.connection.set_properties(flags)
         self.socket = self.connection.socket
         yield
@@ -734,6 +749,7 @@ class ZMQCore(Core):
             # self.context.socket()).
             addr = 'inproc://monitor.v-%d' % (id(self.socket), )
             sock = None
+            reconnecting = False
             if self.socket is not None:
                 try:
                     self.socket.monitor(addr)
@@ -746,9 +762,15 @@ class ZMQCore(Core):
                             self.onsockevent.send(self, **message)
                             event = message['event']
                             if event & zmq.EVENT_CONNECTED:
-                                hello()
+                                self._reconnect_attempt = 0
+                                if reconnecting:
+                                    reconnecting = False
+                                    gevent.spawn_later(random.uniform(0, RESYNC_JITTER), hello)
+                                else:
+                                    hello()
                             elif event & zmq.EVENT_DISCONNECTED:
                                 self.connected = False
+                                reconnecting = True
                             elif event & zmq.EVENT_CONNECT_RETRIED:
                                 self._reconnect_attempt += 1
                                 if self._reconnect_attempt == 50:
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*- {{{
+# ===----------------------------------------------------------------------===
+#
+#                 Component of Eclipse VOLTTRON
+#
+# ===----------------------------------------------------------------------===
+#
+# Copyright 2023 Battelle Memorial Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# ===----------------------------------------------------------------------===
+# }}}
+
+"""Agent-level inbox budget.
+
+The inbox counts the work messages an agent has received but not yet
+finished handling (pubsub deliveries and RPC requests) together with
+their size in bytes.  A budget in messages, bytes or both may be set;
+when the inbox is full each subsystem applies the overload policy it
+declared:
+
+``block``
+    Stop reading from the socket until there is room again.  Subsystems
+    count messages from the socket reader, so :py:meth:`Inbox.admit`
+    holds it up while the inbox is full.  Messages then queue up in the
+    router, which eventually drops them once its high water mark is
+    reached.  Handlers of messages in the inbox must not wait on other
+    messages from the socket, e.g. RPC results, or the agent would
+    deadlock.
+``drop_oldest``
+    Accept the message and discard the oldest messages of the subsystem
+    that have not started being handled.
+``reject``
+    Refuse the message; RPC requests are answered with a busy error.
+
+Pubsub declares drop_oldest and RPC reject.  Agents that must not lose
+publishes, such as historians, declare block for pubsub instead.
+Messages of other subsystems, such as responses to the agent's own
+requests, are not counted and always dispatched.
+"""
+
+from collections import defaultdict
+
+import gevent.event
+
+__all__ = ['Inbox', 'BLOCK', 'DROP_OLDEST', 'REJECT']
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+REJECT = 'reject'
+
+
+class Inbox:
+    def __init__(self, max_messages=None, max_bytes=None):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.depth = 0
+        self.bytes = 0
+        self.dropped = defaultdict(int)
+        self.rejected = defaultdict(int)
+        self._policies = {}
+        self._space = gevent.event.Event()
+        self._space.set()
+
+    def configure(self, max_messages=None, max_bytes=None):
+        """Set the budget; None leaves that dimension unbounded."""
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._signal()
+
+    def declare(self, subsystem, policy):
+        """Declare the overload policy of a subsystem."""
+        if policy not in (BLOCK, DROP_OLDEST, REJECT):
+            raise ValueError('unknown inbox policy {}'.format(policy))
+        self._policies[subsystem] = policy
+
+    def policy(self, subsystem):
+        """Return the declared policy of subsystem or None."""
+        return self._policies.get(subsystem)
+
+    def full(self):
+        return ((self.max_messages is not None and self.depth >= self.max_messages) or
+                (self.max_bytes is not None and self.bytes >= self.max_bytes))
+
+    def over(self):
+        """Return True if the inbox holds more than its budget."""
+        return ((self.max_messages is not None and self.depth > self.max_messages) or
+                (self.max_bytes is not None and self.bytes > self.max_bytes))
+
+    def admit(self, subsystem, size=0):
+        """Count a message into the inbox, applying the overload policy of
+        subsystem if the inbox is full.
+
+        A subsystem with the drop_oldest policy must discard its oldest
+        pending messages, through :py:meth:`drop`, while :py:meth:`over`
+        is true after the message was admitted.
+
+        :returns: False if the message was rejected
+        :rtype: bool
+        """
+        if self.full():
+            policy = self.policy(subsystem)
+            if policy == REJECT:
+                self.rejected[subsystem] += 1
+                return False
+            if policy == BLOCK:
+                while self.full():
+                    self._space.clear()
+                    self._space.wait()
+        self.depth += 1
+        self.bytes += size
+        return True
+
+    def release(self, size=0):
+        """Count a handled message out of the inbox."""
+        self.depth -= 1
+        self.bytes -= size
+        self._signal()
+
+    def drop(self, subsystem, size=0):
+        """Count a discarded message out of the inbox."""
+        self.dropped[subsystem] += 1
+        self.release(size)
+
+    def _signal(self):
+        if not self.full():
+            self._space.set()
+
+    def stats(self):
+        """Return the inbox depth, budget and drop and rejection counters."""
+        return dict(depth=self.depth,
+                    bytes=self.bytes,
+                    max_messages=self.max_messages,
+                    max_bytes=self.max_bytes,
+                    dropped=dict(self.dropped),
+                    rejected=dict(self.rejected))
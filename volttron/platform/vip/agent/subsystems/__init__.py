@@ -34,8 +34,18 @@ from .heartbeat import Heartbeat
 from .health import Health
 from .configstore import ConfigStore
 from .auth import Auth
-from .volttronfncs import FNCS
-from .rmq_pubsub import RMQPubSub
 
-__all__ = ['PeerList', 'Ping', 'RPC', 'Hello', 'PubSub', 'RMQPubSub','Channel',
-           'Heartbeat', 'Health', 'ConfigStore', 'Auth', 'FNCS']
+__all__ = ['PeerList', 'Ping', 'RPC', 'Hello', 'PubSub', 'Channel',
+           'Heartbeat', 'Health', 'ConfigStore', 'Auth']
+
+
+def __getattr__(name):
+    # RMQPubSub and FNCS pull in requests, pika and fncs; import them only
+    # when an agent uses them.
+    if name == 'RMQPubSub':
+        from .rmq_pubsub import RMQPubSub
+        return RMQPubSub
+    if name == 'FNCS':
+        from .volttronfncs import FNCS
+        return FNCS
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
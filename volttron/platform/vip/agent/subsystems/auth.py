@@ -59,11 +59,19 @@ class Auth(SubsystemBase):
         self._rpc = weakref.ref(rpc)
         self._user_to_capabilities = {}
         self._dirty = True
+        # Incremented whenever new capabilities are received; lets callers
+        # cache decisions derived from them.
+        self.capabilities_version = 0
+        # Version and epoch of the AuthService state the capabilities
+        # correspond to, None until a snapshot has been fetched.
+        self._auth_version = None
+        self._auth_epoch = None
         self._csr_certs = dict()
         self.remote_certs_dir = None
 
         def onsetup(sender, **kwargs):
             rpc.export(self._update_capabilities, "auth.update")
+            rpc.export(self._update_capabilities_delta, "auth.update_delta")
             rpc.export(
                 self.get_rpc_authorizations, "auth.get_rpc_authorizations"
             )
@@ -107,12 +115,25 @@ class Auth(SubsystemBase):
         while self._dirty:
             self._dirty = False
             try:
+                snapshot = (
+                    self._rpc()
+                    .call(AUTH, "get_capabilities_snapshot")
+                    .get(timeout=10)
+                )
+                self._user_to_capabilities = snapshot["capabilities"]
+                self._auth_version = snapshot["version"]
+                self._auth_epoch = snapshot.get("epoch")
+                self.capabilities_version += 1
+                _log.debug("self. user to cap %s", self._user_to_capabilities)
+            except MethodNotFound:
+                # AuthService predates versioned updates
                 self._user_to_capabilities = (
                     self._rpc()
                     .call(AUTH, "get_user_to_capabilities")
                     .get(timeout=10)
                 )
-                _log.debug("self. user to cap %s", self._user_to_capabilities)
+                self._auth_version = None
+                self.capabilities_version += 1
             except RemoteError:
                 self._dirty = True
 
@@ -132,7 +153,40 @@ class Auth(SubsystemBase):
         identity = self._rpc().context.vip_message.peer
         if identity == AUTH:
             self._user_to_capabilities = user_to_capabilities
+            self.capabilities_version += 1
+            self._dirty = True
+
+    def _update_capabilities_delta(self, version, changed, removed, epoch=None):
+        """
+        Apply an incremental capabilities update from the AuthService.
+
+        The delta is applied only if it directly follows the version held
+        by this agent in the same epoch; otherwise the full state is
+        fetched again the next time capabilities are needed.  The epoch
+        changes when the AuthService restarts and its versions start over.
+
+        :param version: version of the AuthService state after the delta
+        :param changed: mapping of changed or added users to capabilities
+        :param removed: users whose auth entry was removed
+        :param epoch: start of the AuthService the version belongs to
+        """
+        identity = self._rpc().context.vip_message.peer
+        if identity != AUTH:
+            return
+        if self._dirty or self._auth_version is None \
+                or epoch != self._auth_epoch \
+                or version != self._auth_version + 1:
+            _log.debug("auth update %s/%s does not follow %s/%s, resynchronizing",
+                       epoch, version, self._auth_epoch, self._auth_version)
             self._dirty = True
+            return
+        user_to_capabilities = dict(self._user_to_capabilities)
+        user_to_capabilities.update(changed)
+        for user in removed:
+            user_to_capabilities.pop(user, None)
+        self._user_to_capabilities = user_to_capabilities
+        self._auth_version = version
+        self.capabilities_version += 1
 
     def get_rpc_exports(self):
         """
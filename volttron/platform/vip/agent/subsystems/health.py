@@ -57,6 +57,7 @@ class Health(SubsystemBase):
             rpc.export(self.get_status, 'health.get_status')
             rpc.export(self.get_status, 'health.get_status_json')
             rpc.export(self.send_alert, 'health.send_alert')
+            rpc.export(self.get_inbox_stats, 'health.get_inbox_stats')
 
         core.onsetup.connect(onsetup, self)
 
@@ -140,6 +141,25 @@ class Health(SubsystemBase):
         """
         return self._statusobj.as_dict() #.as_json()
 
+    def get_inbox_stats(self):
+        """RPC method
+
+        Returns the number and size of the messages waiting to be handled
+        by the agent, its inbox budget and the number of messages dropped or
+        rejected per subsystem because the inbox was full.
+
+            {
+                "depth": 12,
+                "bytes": 20480,
+                "max_messages": 1000,
+                "max_bytes": None,
+                "dropped": {"pubsub": 3},
+                "rejected": {}
+            }
+
+        """
+        return self._core().inbox.stats()
+
     # TODO fetch status value from status object
     def get_status_value(self):
         return self._statusobj.status
@@ -48,6 +48,41 @@ class PeerList(SubsystemBase):
         self.onadd = Signal()
         self.ondrop = Signal()
         self.peers_list = set()
+        # Incremented whenever peers_list changes.  peers_list is
+        # authoritative once seeded, after which it is kept current by the
+        # add and drop notifications the router sends to every peer.
+        self.version = 0
+        self.seeded = False
+        self._seeding = None
+
+        def onconnected(sender, **kwargs):
+            # Results are weakly referenced; hold on to the seeding request.
+            self._seeding = self.list()
+
+        def ondisconnected(sender, **kwargs):
+            self.seeded = False
+
+        core.onconnected.connect(onconnected)
+        core.ondisconnected.connect(ondisconnected)
+
+    def peers(self):
+        """Return the connected peers without a round trip to the router.
+
+        Falls back to querying the router if the local membership has not
+        been seeded yet.
+
+        :returns: identities of the connected peers
+        :rtype: list
+        """
+        if self.seeded:
+            return list(self.peers_list)
+        return self.list().get(timeout=5)
+
+    def is_connected(self, peer):
+        """Return True if peer is connected to the router."""
+        if self.seeded:
+            return peer in self.peers_list
+        return peer in self.list().get(timeout=5)
 
     def list(self):
         connection = self.core().connection
@@ -134,10 +169,13 @@ class PeerList(SubsystemBase):
             else:
                 getattr(self, onop).send(self, peer=peer)
             if op == 'add':
-                self.peers_list.add(peer)
+                if peer not in self.peers_list:
+                    self.peers_list.add(peer)
+                    self.version += 1
             else:
                 if peer in self.peers_list:
                     self.peers_list.remove(peer)
+                    self.version += 1
         elif op == 'listing':
             try:
                 result = self._results.pop(message.id)
@@ -145,8 +183,12 @@ class PeerList(SubsystemBase):
                 return
 
             peers = [arg for arg in message.args[1:]]
+            if set(peers) != self.peers_list:
+                self.peers_list = set(peers)
+                self.version += 1
+            self.seeded = True
+            self._seeding = None
             result.set(peers)
-            self.peers_list = set(peers)
         elif op == 'listing_with_messagebus':
             try:
                 result = self._results.pop(message.id)
@@ -35,14 +35,19 @@ import gevent
 from zmq import green as zmq
 from zmq import SNDMORE
 from volttron.platform import jsonapi
+from volttron.platform.agent.utils import is_secure_mode
 from .base import SubsystemBase
 from ..decorators import annotate, annotations, dualmethod, spawn
 from ..errors import Unreachable
+from ..inbox import DROP_OLDEST
 from .... import jsonrpc
 
 from ..results import ResultsDictionary
+from ...pubsubfilters import compile_filter
+from ...sharedmemory import (DEFAULT_RING_SIZE, OverwrittenError, SharedMemoryReader,
+                             SharedMemoryRing, remove_stale_rings, ring_name)
 from gevent.queue import Queue
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 __all__ = ['PubSub']
 
@@ -83,13 +88,26 @@ class PubSub(SubsystemBase):
             return defaultdict(set)
 
         self._my_subscriptions = defaultdict(platform_subscriptions)
+        # Minimum delivery interval of conflated subscriptions {bus: {prefix: interval}}
+        self._conflated = defaultdict(dict)
+        # Content filters of subscriptions {bus: {prefix: filter}}
+        self._filters = defaultdict(dict)
         self.protected_topics = ProtectedPubSubTopics()
         core.register('pubsub', self._handle_subsystem, self._handle_error)
+        core.inbox.declare('pubsub', DROP_OLDEST)
+        # Publishes counted in the inbox that have not started being handled, oldest first
+        self._pending = OrderedDict()
         self.vip_socket = None
         self._results = ResultsDictionary()
         self._event_queue = Queue()
         self._retry_period = 300.0
         self._processgreenlet = None
+        # Size of the ring used for publishes with shared_memory=True.
+        self.shared_memory_size = DEFAULT_RING_SIZE
+        self._shared_ring = None
+        # Cleared when rings cannot be shared with the router and subscribers.
+        self._shared_memory_enabled = True
+        self._shared_reader = SharedMemoryReader()
 
         def setup(sender, **kwargs):
             # pylint: disable=unused-argument
@@ -105,7 +123,15 @@ class PubSub(SubsystemBase):
 
             inspect.getmembers(owner, subscribe)
 
+        def finish(sender, **kwargs):
+            # pylint: disable=unused-argument
+            if self._shared_ring is not None:
+                self._shared_ring.close()
+                self._shared_ring = None
+            self._shared_reader.close()
+
         core.onsetup.connect(setup, self)
+        core.onfinish.connect(finish, self)
 
     def _connected(self, sender, **kwargs):
         """
@@ -220,25 +246,15 @@ class PubSub(SubsystemBase):
         """
         result = next(self._results)
 
-        subscriptions = {platform: {bus: list(subscriptions.keys())}
-                         for platform, bus_subscriptions in self._my_subscriptions.items()
-                         for bus, subscriptions in bus_subscriptions.items()}
-        sync_msg = jsonapi.dumpb(dict(subscriptions=subscriptions))
-        frames = ['synchronize', 'connected', sync_msg]
-        self.vip_socket.send_vip('', 'pubsub', frames, result.ident, copy=False)
-
+        # The whole subscription state is sent as one snapshot.
         # 2073 - python3 dictionary keys method returns a dict_keys structure that isn't serializable.
         #        added list(subscriptions.keys()) to make it like python2 list of strings.
-        items = [
-            {platform: {bus: list(subscriptions.keys())}
-             for platform, bus_subscriptions in self._my_subscriptions.items()
-             for bus, subscriptions in bus_subscriptions.items()}]
-        for subscriptions in items:
-            sync_msg = jsonapi.dumpb(
-                dict(subscriptions=subscriptions)
-            )
-            frames = ['synchronize', 'connected', sync_msg]
-            self.vip_socket.send_vip('', 'pubsub', frames, result.ident, copy=False)
+        subscriptions = {platform: {bus: list(subscriptions.keys())
+                                    for bus, subscriptions in bus_subscriptions.items()}
+                         for platform, bus_subscriptions in self._my_subscriptions.items()}
+        sync_msg = jsonapi.dumpb(dict(subscriptions=subscriptions, conflate=self._conflated, filters=self._filters))
+        frames = ['synchronize', 'connected', sync_msg]
+        self.vip_socket.send_vip('', 'pubsub', frames, result.ident, copy=False)
 
     def list(self, peer, prefix='', bus='', subscribed=True, reverse=False, all_platforms=False):
         """Gets list of subscriptions matching the prefix and bus for the specified peer.
@@ -282,7 +298,8 @@ class PubSub(SubsystemBase):
 
     @dualmethod
     @spawn
-    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False, persistent_queue=None):
+    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False, persistent_queue=None,
+                  conflate=None, content_filter=None, prefetch=None):
         """Subscribe to topic and register callback.
 
         Subscribes to topics beginning with prefix. If callback is
@@ -292,6 +309,18 @@ class PubSub(SubsystemBase):
         publishing peer, topic is the full message topic, headers is a
         case-insensitive dictionary (mapping) of message headers, and
         message is a possibly empty list of message parts.
+
+        If conflate is set the subscription only wants the latest value
+        of each topic: the PubSubService delivers at most one message per
+        topic every conflate seconds (and none while the agent is
+        backlogged), dropping superseded messages. Only applies to
+        subscriptions on the local platform.
+
+        content_filter is a declarative predicate (see
+        volttron.platform.vip.pubsubfilters) evaluated by the
+        PubSubService; only messages matching it are delivered, e.g.
+        {"path": "headers.alarm", "op": "eq", "value": True}. Only applies
+        to subscriptions on the local platform.
         :param peer
         :type peer
         :param prefix prefix to the topic
@@ -302,16 +331,34 @@ class PubSub(SubsystemBase):
         :type bus str
         :param platforms
         :type platforms
+        :param conflate minimum interval in seconds between messages per topic, None to receive every message
+        :type conflate float
+        :param content_filter condition or list of conditions messages must satisfy to be delivered
+        :type content_filter dict or list
+        :param prefetch ignored on the ZMQ message bus, see the agent's inbox budget instead
+        :type prefetch int
         :returns: Subscribe is successful or not
         :rtype: boolean
 
         :Return Values:
         Success or Failure
         """
+        if content_filter is not None:
+            # Raises ValueError for an invalid filter before anything is registered.
+            compile_filter(content_filter)
         result = next(self._results)
         self._add_subscription(prefix, callback, bus, all_platforms)
+        if content_filter is None:
+            self._filters[bus].pop(prefix, None)
+        else:
+            self._filters[bus][prefix] = content_filter
+        if conflate is None:
+            self._conflated[bus].pop(prefix, None)
+        else:
+            self._conflated[bus][prefix] = conflate
         sub_msg = jsonapi.dumpb(
-            dict(prefix=prefix, bus=bus, all_platforms=all_platforms)
+            dict(prefix=prefix, bus=bus, all_platforms=all_platforms, conflate=conflate,
+                 filter=content_filter)
         )
 
         frames = ['subscribe', sub_msg]
@@ -444,19 +491,30 @@ class PubSub(SubsystemBase):
             topics = self._drop_subscription(prefix, callback, bus, platform)
             subscriptions[platform] = dict(prefix=topics, bus=bus)
 
+        for topic in topics:
+            if topic not in self._my_subscriptions.get(platform, {}).get(bus, {}):
+                self._conflated[bus].pop(topic, None)
+                self._filters[bus].pop(topic, None)
         unsub_msg = jsonapi.dumpb(subscriptions)
         topics = self._drop_subscription(prefix, callback, bus)
         frames = ['unsubscribe', unsub_msg]
         self.vip_socket.send_vip('', 'pubsub', frames, result.ident, copy=False)
         return result
 
-    def publish(self, peer: str, topic: str, headers=None, message=None, bus=''):
+    def publish(self, peer: str, topic: str, headers=None, message=None, bus='', shared_memory=False):
         """Publish a message to a given topic via a peer.
 
         Publish headers and message to all subscribers of topic on bus.
         If peer is None, use self. Adds volttron platform version
         compatibility information to header as variables
         min_compatible_version and max_compatible version
+
+        If shared_memory is True the message is written to a shared-memory
+        ring owned by this agent and only a descriptor of it is sent
+        through the router. This is meant for high-volume publishers whose
+        subscribers run on the same host; messages that do not fit in the
+        ring are sent inline. Shared memory is not used in agent isolation
+        mode, where agents cannot read each other's rings.
         param peer: peer
         type peer: str
         param topic: topic for the publish message
@@ -467,6 +525,8 @@ class PubSub(SubsystemBase):
         type message: None or any
         param bus: bus
         type bus: str
+        param shared_memory: move the message through shared memory
+        type shared_memory: bool
         return: Number of subscribers the message was sent to.
         :rtype: int
 
@@ -482,10 +542,45 @@ class PubSub(SubsystemBase):
             peer = 'pubsub'
 
         result = next(self._results)
-        args = ['publish', topic, dict(bus=bus, headers=headers, message=message)]
+        msg = dict(bus=bus, headers=headers, message=message)
+        if shared_memory:
+            descriptor = self._write_shared(message)
+            if descriptor is not None:
+                msg['message'] = None
+                msg['shm'] = descriptor
+        args = ['publish', topic, msg]
         self.vip_socket.send_vip('', 'pubsub', args, result.ident, copy=False)
         return result
 
+    def _write_shared(self, message):
+        """Write message to this agent's ring and return its descriptor, or None if it cannot be
+        sent through shared memory.
+        """
+        if not self._shared_memory_enabled:
+            return None
+        if self._shared_ring is None:
+            if is_secure_mode():
+                _log.info("Agent isolation mode is on, sending shared memory publishes inline")
+                self._shared_memory_enabled = False
+                return None
+            remove_stale_rings()
+            try:
+                self._shared_ring = SharedMemoryRing(ring_name(self.core().identity),
+                                                     self.shared_memory_size)
+            except OSError as exc:
+                _log.warning("Sending shared memory publishes inline, unable to create ring: %s", exc)
+                self._shared_memory_enabled = False
+                return None
+        try:
+            return self._shared_ring.write(jsonapi.dumpb(message))
+        except ValueError as exc:
+            _log.debug("Sending publish inline: %s", exc)
+            return None
+
+    def _read_shared(self, descriptor):
+        """Return the message referenced by a shared-memory descriptor."""
+        return jsonapi.loadb(self._shared_reader.read(descriptor))
+
     def _check_if_protected_topic(self, topic):
         required_caps = self.protected_topics.get(topic)
         if required_caps:
@@ -502,6 +597,16 @@ class PubSub(SubsystemBase):
         param message: VIP message from PubSubService
         type message: dict
         """
+        if message.args and message.args[0] == 'publish':
+            inbox = self.core().inbox
+            size = getattr(message, 'size', 0)
+            if not inbox.admit('pubsub', size):
+                return
+            self._pending[id(message)] = message
+            while inbox.over() and self._pending:
+                _, oldest = self._pending.popitem(last=False)
+                oldest.dropped = True
+                inbox.drop('pubsub', getattr(oldest, 'size', 0))
         self._event_queue.put(message)
 
     @spawn
@@ -510,6 +615,17 @@ class PubSub(SubsystemBase):
         param message: VIP message from PubSubService
         type message: dict
         """
+        if self._pending.pop(id(message), None) is None:
+            if getattr(message, 'dropped', False):
+                return
+            self._process_message(message)
+            return
+        try:
+            self._process_message(message)
+        finally:
+            self.core().inbox.release(getattr(message, 'size', 0))
+
+    def _process_message(self, message):
         op = message.args[0]
 
         if op == 'request_response':
@@ -542,8 +658,13 @@ class PubSub(SubsystemBase):
                 message = msg['message']
                 sender = msg['sender']
                 bus = msg['bus']
+                if 'shm' in msg:
+                    message = self._read_shared(msg['shm'])
             except KeyError as exc:
                 _log.error("Missing keys in pubsub message: {}".format(exc))
+            except (OverwrittenError, OSError) as exc:
+                # OSError covers rings that are gone or belong to another user
+                _log.error("Dropping shared memory publish on {}: {}".format(topic, exc))
             else:
                 self._process_callback(sender, bus, topic, headers, message)
 
@@ -28,11 +28,14 @@ import logging
 import uuid
 import weakref
 
+import gevent
+import gevent.event
+
 from volttron.platform import jsonapi
 import errno
 from .base import SubsystemBase
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 from requests.exceptions import HTTPError
 from requests.packages.urllib3.connection import (ConnectionError,
@@ -65,9 +68,27 @@ class RMQPubSub(SubsystemBase):
         self._owner = owner
         self._logger = logging.getLogger(__name__)
         self._results = ResultsDictionary()
-        self._message_number = 0
-        self._pubcount = dict()
         self._isconnected = False
+        # Publisher confirms: maximum number of publishes awaiting
+        # confirmation from the broker, 0 to publish without confirms.
+        self.confirm_window = 0
+        # Batching: number of publishes to the same topic packed into one
+        # AMQP message, 0 to send every publish on its own.  A partial batch
+        # is sent after batch_interval seconds.  Only agents that understand
+        # batches (this implementation) should subscribe to batched topics.
+        self.batch_size = 0
+        self.batch_interval = 0.05
+        self._publish_channel = None
+        self._delivery_tag = 0
+        # delivery tag -> result idents of the publishes in that message
+        self._unconfirmed = OrderedDict()
+        self._window_open = gevent.event.Event()
+        self._window_open.set()
+        # routing key -> list of (message, result ident) waiting to be sent
+        self._batches = {}
+        self._batch_timer = None
+        # queue name -> consumer prefetch count
+        self._prefetch = {}
 
         def subscriptions():
             return defaultdict(set)
@@ -106,10 +127,21 @@ class RMQPubSub(SubsystemBase):
         param kwargs: optional arguments
         type kwargs: pointer to arguments
         """
-        # self.core().connection.channel.confirm_delivery(self.on_delivery_confirmation,nowait=True)
         self._isconnected = True
+        self._publish_channel = None
+        if self.confirm_window:
+            # Confirms are enabled on a channel of their own so that delivery
+            # tags only count pubsub publishes.
+            self.core().connection.open_channel(self._on_publish_channel_open)
         self.synchronize()
 
+    def _on_publish_channel_open(self, channel):
+        # Confirmations pending on a previous channel will never arrive.
+        self._confirm(self._delivery_tag, multiple=True, acked=False)
+        self._delivery_tag = 0
+        channel.confirm_delivery(self.on_delivery_confirmation)
+        self._publish_channel = channel
+
     def synchronize(self):
         """
         Synchronize local subscriptions with RMQ broker.
@@ -139,7 +171,7 @@ class RMQPubSub(SubsystemBase):
                     original_prefix = self._get_original_topic(prefix)
                     self._send_proxy(original_prefix)
                 for cb in callback:
-                    self._add_callback(connection, queue_name, cb)
+                    self._add_callback(connection, queue_name, cb, self._prefetch.get(queue_name))
         return True
 
     def _add_subscription(self, prefix, callback, queue_name):
@@ -160,12 +192,20 @@ class RMQPubSub(SubsystemBase):
 
     @dualmethod
     @spawn
-    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False, persistent_queue=None):
+    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False, persistent_queue=None,
+                  conflate=None, content_filter=None, prefetch=None):
         """Subscribe to a prefix and register callback. If 'all_platforms' flag is set to True, then
         agent subscribes to receive topic from all platforms. A named queue will set persistent
         behavior to the topic subscriptions. That means even if the agent shutdowns and restarts, it
         will receive all the messages during the shutdown/turn off period.
 
+        If prefetch is set, the broker delivers at most that many messages of the subscription
+        before the agent's callbacks have handled them; messages are then acknowledged once the
+        callback returns rather than on receipt.
+
+        Conflation and content filters are features of the ZMQ PubSubService; the conflate
+        and content_filter arguments are accepted for compatibility and every message is delivered.
+
         :param peer "pubsub" string
         :type peer str
         :param prefix prefix of the topic
@@ -178,6 +218,12 @@ class RMQPubSub(SubsystemBase):
         :type all_platforms boolean
         :param persistent_queue Name of the queue for persistent behavior
         :type persistent_queue str
+        :param conflate ignored on the RabbitMQ message bus
+        :type conflate float
+        :param content_filter ignored on the RabbitMQ message bus
+        :type content_filter dict or list
+        :param prefetch maximum number of unacknowledged deliveries, None for no limit
+        :type prefetch int
         :returns: Subscribe is successful or not
         :rtype: boolean
 
@@ -204,6 +250,8 @@ class RMQPubSub(SubsystemBase):
             queue_name = "{user}.pubsub.{uid}".format(user=self.core().rmq_user, uid=str(uuid.uuid4()))
         # Store subscriptions for later use
         self._add_subscription(routing_key, callback, queue_name)
+        if prefetch:
+            self._prefetch[queue_name] = prefetch
 
         self._logger.debug("RMQ PUBSUB subscribing to {}".format(routing_key))
 
@@ -217,7 +265,7 @@ class RMQPubSub(SubsystemBase):
                                           callback=None,
                                           exchange=connection.exchange,
                                           routing_key=routing_key)
-            self._add_callback(connection, queue_name, callback)
+            self._add_callback(connection, queue_name, callback, prefetch)
         except AttributeError as ex:
             self._logger.error("Subscription will be added when agent gets connected to messagebus."
                                .format(self.core().identity))
@@ -239,12 +287,13 @@ class RMQPubSub(SubsystemBase):
                                          rkey,
                                          body=jsonapi.dumps(frames, ensure_ascii=False))
 
-    def _add_callback(self, connection, queue, callback):
+    def _add_callback(self, connection, queue, callback, prefetch=None):
         """
         Register agent's callback method with RabbitMQ broker
         :param connection: RabbitMQ connection object
         :param queue: queue name
         :param callback: callback method
+        :param prefetch: maximum number of unacknowledged deliveries, None for no limit
         :return:
         """
 
@@ -253,19 +302,31 @@ class RMQPubSub(SubsystemBase):
             topic = self._get_original_topic(str(method.routing_key))
             try:
                 msg = jsonapi.loads(body)
-                headers = msg['headers']
-                message = msg['message']
-                bus = msg['bus']
-                sender = msg['sender']
-                self.core().spawn(callback, 'pubsub', sender, bus, topic, headers, message)
-                connection.channel.basic_ack(method.delivery_tag)
+                # A batch carries several publishes to the same topic
+                messages = [(m['sender'], m['bus'], m['headers'], m['message'])
+                            for m in msg.get('batch', [msg])]
             except KeyError as esc:
                 self._logger.error("Missing keys in pubsub message {}".format(esc))
+                return
+            greenlets = [self.core().spawn(callback, 'pubsub', sender, bus, topic, headers, message)
+                         for sender, bus, headers, message in messages]
+            if prefetch:
+                # Acknowledge once handled so the prefetch limit bounds the backlog
+                def ack():
+                    gevent.joinall(greenlets)
+                    connection.channel.basic_ack(method.delivery_tag)
+                gevent.spawn(ack)
+            else:
+                connection.channel.basic_ack(method.delivery_tag)
 
-
+        # The prefetch count applies to consumers started after basic_qos on the channel.
+        if prefetch:
+            connection.channel.basic_qos(prefetch_count=prefetch)
         connection.channel.basic_consume(queue,
                                          rmq_callback
                                          )
+        if prefetch:
+            connection.channel.basic_qos(prefetch_count=0)
 
     @subscribe.classmethod
     def subscribe(cls, peer, prefix, bus='', all_platforms=False, persistent_queue=None):
@@ -357,11 +418,7 @@ class RMQPubSub(SubsystemBase):
         Number of subscribers
         """
         result = next(self._results)
-        self._pubcount[self._message_number] = result.ident
-        self._message_number += 1
         routing_key = self._form_routing_key(topic)
-        connection = self.core().connection
-        self.core().spawn_later(0.01, self.set_result, result.ident, 1)
         if headers is None:
             headers = {}
 
@@ -372,31 +429,89 @@ class RMQPubSub(SubsystemBase):
         #                                                                            message,
         #                                                                            topic))
 
+        json_msg = dict(sender=self.core().identity, bus=bus, headers=headers, message=message)
+        if self.batch_size:
+            self._add_to_batch(routing_key, json_msg, result.ident)
+        else:
+            self._send(routing_key, jsonapi.dumps(json_msg, ensure_ascii=False), [result.ident])
+        return result
+
+    def _properties(self, message_id):
         # VIP format - [SENDER, RECIPIENT, PROTO, USER_ID, MSG_ID, SUBSYS, ARGS...]
         dct = {
             # 'user_id': self.core().identity,
-            'app_id': connection.routing_key,  # SENDER
+            'app_id': self.core().connection.routing_key,  # SENDER
             'headers': dict(recipient='',  # RECEIVER
                             proto='VIP',  # PROTO
                             user=self.core().identity,  # USER_ID
                             ),
-            'message_id': result.ident,  # MSG_ID
+            'message_id': message_id,  # MSG_ID
             'type': 'pubsub',  # SUBSYS
             'content_type': 'application/json'
         }
-        properties = pika.BasicProperties(**dct)
-        json_msg = dict(sender=self.core().identity, bus=bus, headers=headers, message=message)
+        return pika.BasicProperties(**dct)
+
+    def _send(self, routing_key, body, idents):
+        """
+        Send one AMQP message carrying the publishes identified by idents. With publisher confirms
+        enabled the results are set when the broker confirms the message, after waiting for the
+        confirm window to have room; otherwise they are set right away.
+        """
+        connection = self.core().connection
+        while True:
+            channel = self._publish_channel
+            confirmed = channel is not None and channel.is_open
+            if not confirmed or len(self._unconfirmed) < self.confirm_window:
+                break
+            self._window_open.clear()
+            self._window_open.wait()
+        if not confirmed:
+            channel = connection.channel
+            for ident in idents:
+                self.core().spawn_later(0.01, self.set_result, ident, 1)
         try:
-            connection.channel.basic_publish(connection.exchange,
-                                             routing_key,
-                                             jsonapi.dumps(json_msg, ensure_ascii=False),
-                                             properties=properties)
+            channel.basic_publish(connection.exchange,
+                                  routing_key,
+                                  body,
+                                  properties=self._properties(idents[0]))
         except (pika.exceptions.AMQPConnectionError,
                 pika.exceptions.AMQPChannelError) as exc:
             self._isconnected = False
             raise Unreachable(errno.EHOSTUNREACH, "Connection to RabbitMQ is lost",
                               'rabbitmq broker', 'pubsub')
-        return result
+        if confirmed:
+            self._delivery_tag += 1
+            self._unconfirmed[self._delivery_tag] = idents
+
+    def _add_to_batch(self, routing_key, json_msg, ident):
+        batch = self._batches.setdefault(routing_key, [])
+        batch.append((json_msg, ident))
+        if len(batch) >= self.batch_size:
+            self._send_batch(routing_key)
+        elif self._batch_timer is None:
+            self._batch_timer = self.core().spawn_later(self.batch_interval, self.flush_batches)
+
+    def flush_batches(self):
+        """Send all partially filled batches."""
+        self._batch_timer = None
+        for routing_key in list(self._batches):
+            self._send_batch(routing_key)
+
+    def _send_batch(self, routing_key):
+        batch = self._batches.pop(routing_key, None)
+        if not batch:
+            return
+        idents = [ident for _, ident in batch]
+        if len(batch) == 1:
+            body = jsonapi.dumps(batch[0][0], ensure_ascii=False)
+        else:
+            body = jsonapi.dumps(dict(batch=[json_msg for json_msg, _ in batch]), ensure_ascii=False)
+        try:
+            self._send(routing_key, body, idents)
+        except Unreachable as exc:
+            self._logger.error("Dropping batch of {} messages to {}: {}".format(len(batch), routing_key, exc))
+            for ident in idents:
+                self._set_exception(ident, exc)
 
     def set_result(self, ident, value=None):
         try:
@@ -406,34 +521,45 @@ class RMQPubSub(SubsystemBase):
         except KeyError:
             pass
 
+    def _set_exception(self, ident, exc):
+        result = self._results.pop(ident, None)
+        if result:
+            result.set_exception(exc)
+
     def on_delivery_confirmation(self, method_frame):
         """Invoked by pika when RabbitMQ responds to a Basic.Publish RPC
         command, passing in either a Basic.Ack or Basic.Nack frame with
         the delivery tag of the message that was published. The delivery tag
         is an integer counter indicating the message number that was sent
-        on the channel via Basic.Publish. Here we're just doing house keeping
-        to keep track of stats and remove message numbers that we expect
-        a delivery confirmation of from the list used to keep track of messages
-        that are pending confirmation.
+        on the channel via Basic.Publish. The broker may confirm several
+        messages at once, in which case all messages up to and including the
+        delivery tag are confirmed.
 
         :param pika.frame.Method method_frame: Basic.Ack or Basic.Nack frame
 
         """
-        try:
-            delivery_number = method_frame.method.delivery_tag
-            self._logger.info("PUBSUB Delivery confirmation {0}, pending {1}, ".
-                              format(method_frame.method.delivery_tag, len(self._pubcount)))
-            ident = self._pubcount.pop(delivery_number, None)
-            if ident:
-                result = None
-                try:
-                    result = self._results.pop(ident)
-                    if result:
-                        result.set(delivery_number)
-                except KeyError:
-                    pass
-        except TypeError:
-            pass
+        method = method_frame.method
+        self._confirm(method.delivery_tag, multiple=method.multiple,
+                      acked=isinstance(method, pika.spec.Basic.Ack))
+
+    def _confirm(self, delivery_tag, multiple=False, acked=True):
+        if multiple:
+            tags = []
+            for tag in self._unconfirmed:
+                if tag > delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [delivery_tag]
+        for tag in tags:
+            for ident in self._unconfirmed.pop(tag, ()):
+                if acked:
+                    self.set_result(ident, 1)
+                else:
+                    self._set_exception(ident, Unreachable(errno.EHOSTUNREACH, "Message was not accepted by RabbitMQ",
+                                                           'rabbitmq broker', 'pubsub'))
+        if len(self._unconfirmed) < self.confirm_window:
+            self._window_open.set()
 
     def unsubscribe(self, peer, prefix, callback, bus='', all_platforms=False):
         """Unsubscribe and remove callback(s).
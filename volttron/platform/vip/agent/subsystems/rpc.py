@@ -38,6 +38,7 @@ from volttron.platform import jsonapi
 from .base import SubsystemBase
 from ..results import counter, ResultsDictionary
 from ..decorators import annotate, annotations, dualmethod, spawn
+from ..inbox import REJECT
 from .... import jsonrpc
 
 from zmq import ZMQError
@@ -65,6 +66,76 @@ def _isregex(obj):
     )
 
 
+class _AuthDecision:
+    """
+    Precompiled authorization of one user for one capability protected
+    method.  Either the user is denied, or allowed subject to a (possibly
+    empty) list of restrictions on the values of the method's parameters.
+    """
+
+    __slots__ = ("_method", "_signature", "_user", "_error", "_restrictions")
+
+    def __init__(self, method, signature, required_caps, user, user_capabilities):
+        self._method = method
+        self._signature = signature
+        self._user = user
+        self._error = None
+        self._restrictions = []
+
+        if not isinstance(user_capabilities, dict):
+            user_capabilities = {}
+        if required_caps == {""}:
+            return
+        if not required_caps.issubset(user_capabilities):
+            self._error = (
+                "method '{}' requires capabilities {}, but capability {} "
+                "was provided for user {}"
+            ).format(method.__name__, required_caps, user_capabilities, user)
+            return
+        for cap_name, param_dict in user_capabilities.items():
+            if not param_dict or cap_name not in required_caps:
+                continue
+            # The user capability restricts the arguments the method may be called with.
+            for name, value in param_dict.items():
+                if name not in signature.parameters:
+                    self._error = (
+                        "User {} capability is not defined properly. method {} "
+                        "does not have a parameter {}"
+                    ).format(user, method.__name__, name)
+                    return
+                regex = re.compile("^" + value[1:-1] + "$") if _isregex(value) else None
+                self._restrictions.append((name, value, regex))
+
+    def check(self, args, kwargs):
+        """Raise an UNAUTHORIZED error if the call is not allowed."""
+        if self._error is not None:
+            raise jsonrpc.exception_from_json(jsonrpc.UNAUTHORIZED, self._error)
+        if not self._restrictions:
+            return
+        bound = self._signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        for name, value, regex in self._restrictions:
+            actual = arguments[name]
+            if regex is not None:
+                if not (isinstance(actual, str) and regex.match(actual)):
+                    raise jsonrpc.exception_from_json(
+                        jsonrpc.UNAUTHORIZED,
+                        "User {} can call method {} only with {} matching "
+                        "pattern {} but called with {}={}".format(
+                            self._user, self._method.__name__, name, value, name, actual
+                        ),
+                    )
+            elif actual != value:
+                raise jsonrpc.exception_from_json(
+                    jsonrpc.UNAUTHORIZED,
+                    "User {} can call method {} only with {}={} but called "
+                    "with {}={}".format(
+                        self._user, self._method.__name__, name, value, name, actual
+                    ),
+                )
+
+
 class Dispatcher(jsonrpc.Dispatcher):
     def __init__(self, methods, local):
         super(Dispatcher, self).__init__()
@@ -219,6 +290,7 @@ class RPC(SubsystemBase):
         self._counter = counter()
         self._outstanding = weakref.WeakValueDictionary()
         core.register("RPC", self._handle_subsystem, self._handle_error)
+        core.inbox.declare("RPC", REJECT)
         core.register(
             "external_rpc",
             self._handle_external_rpc_subsystem,
@@ -285,7 +357,16 @@ class RPC(SubsystemBase):
         """
         Adds an authorization check to verify the calling agent has the
         required capabilities.
+
+        The outcome of checking a user's capabilities against
+        required_caps is compiled into an _AuthDecision the first time the
+        user calls the method and reused until the auth subsystem receives
+        new capabilities, so a call only pays for a lookup plus the
+        precompiled parameter restrictions.
         """
+        signature = inspect.signature(method)
+        # user -> (capabilities version, decision)
+        decisions = {}
 
         def checked_method(*args, **kwargs):
             user = str(self.context.vip_message.user)
@@ -293,90 +374,21 @@ class RPC(SubsystemBase):
                 # remove platform instance name. rmq user names are of the format <instance name>.<user>
                 user = user[user.index(".")+1:]
 
-            user_capabilites = self._owner.vip.auth.get_capabilities(user)
-            _log.debug("**user caps is: {}".format(user_capabilites))
-            if user_capabilites:
-                user_capabilities_names = set(user_capabilites.keys())
-            else:
-                user_capabilities_names = set()
-            if required_caps == {""}:
-                pass
-            elif not required_caps.issubset(user_capabilities_names):
-                msg = (
-                    "method '{}' requires capabilities {}, but capability {} "
-                    "was provided for user {}"
-                ).format(
-                    method.__name__,
-                    required_caps,
-                    user_capabilites,
-                    user
-                )
-                raise jsonrpc.exception_from_json(jsonrpc.UNAUTHORIZED, msg)
-            else:
-                # Now check if args passed to method are the ones allowed.
-
-                for cap_name, param_dict in user_capabilites.items():
-                    if (
-                            param_dict
-                            and required_caps
-                            and cap_name in required_caps
-                    ):
-                        # if the method has required capabilities and
-                        # if the user capability has argument restrictions,
-                        # check if the args passed to method match the
-                        # requirement
-                        _log.debug("args = {} kwargs= {}".format(args, kwargs))
-                        args_dict = inspect.getcallargs(method, *args, **kwargs)
-                        _log.debug("dict = {}".format(args_dict))
-                        _log.debug(
-                            "name= %r parameters allowed=%r",
-                            cap_name,
-                            param_dict
-                        )
-                        for name, value in param_dict.items():
-                            _log.debug("name= {} value={}".format(name, value))
-                            if name not in args_dict:
-                                raise jsonrpc.exception_from_json(
-                                    jsonrpc.UNAUTHORIZED,
-                                    "User {} capability is not defined "
-                                    "properly. method {} does not have "
-                                    "a parameter {}".format(
-                                        user, method.__name__, name
-                                    ),
-                                )
-                            if _isregex(value):
-                                regex = re.compile("^" + value[1:-1] + "$")
-                                if not regex.match(args_dict[name]):
-                                    raise jsonrpc.exception_from_json(
-                                        jsonrpc.UNAUTHORIZED,
-                                        "User {} can call method {} only "
-                                        "with {} matching pattern {} but "
-                                        "called with {}={}".format(
-                                            user,
-                                            method.__name__,
-                                            name,
-                                            value,
-                                            name,
-                                            args_dict[name],
-                                        ),
-                                    )
-                            elif args_dict[name] != value:
-                                raise jsonrpc.exception_from_json(
-                                    jsonrpc.UNAUTHORIZED,
-                                    "User {} can call method {} only "
-                                    "with {}={} but called with "
-                                    "{}={}".format(
-                                        user,
-                                        method.__name__,
-                                        name,
-                                        value,
-                                        name,
-                                        args_dict[name],
-                                    ),
-                                )
-
+            auth = self._owner.vip.auth
+            user_capabilities = auth.get_capabilities(user)
+            version = auth.capabilities_version
+            try:
+                decision_version, decision = decisions[user]
+            except KeyError:
+                decision_version = decision = None
+            if decision_version != version:
+                decision = _AuthDecision(method, signature, required_caps, user, user_capabilities)
+                decisions[user] = (version, decision)
+            decision.check(args, kwargs)
             return method(*args, **kwargs)
 
+        # Lets inspect.signature (and the RPC inspect call) see the wrapped method.
+        checked_method.__wrapped__ = method
         return checked_method
 
     @spawn
@@ -440,8 +452,38 @@ class RPC(SubsystemBase):
         except KeyError:
             pass
 
-    @spawn
     def _handle_subsystem(self, message):
+        # Requests count against the agent's inbox budget; results of calls
+        # made by this agent are always handled.
+        requests = [msg for msg in message.args if isinstance(msg, dict) and "method" in msg]
+        size = 0
+        if requests:
+            size = getattr(message, "size", 0)
+            if not self.core().inbox.admit("RPC", size):
+                _log.warning("Agent busy, rejecting %d RPC request(s) from %s", len(requests), message.peer)
+                # Results of this agent's own calls are still dispatched.
+                for msg in message.args:
+                    if not (isinstance(msg, dict) and "method" in msg):
+                        self._dispatcher.dispatch(msg, message)
+                busy = "agent {} is busy".format(self.core().identity)
+                errors = [jsonrpc.json_error(msg["id"], jsonrpc.AGENT_BUSY, busy)
+                          for msg in requests if msg.get("id")]
+                if errors:
+                    message.user = ""
+                    message.args = errors
+                    self._send_responses(message)
+                return
+        self._dispatch_message(message, requests, size)
+
+    @spawn
+    def _dispatch_message(self, message, requests, size):
+        try:
+            self._dispatch(message)
+        finally:
+            if requests:
+                self.core().inbox.release(size)
+
+    def _dispatch(self, message):
         dispatch = self._dispatcher.dispatch
 
         if self._message_bus == "rmq":
@@ -463,38 +505,41 @@ class RPC(SubsystemBase):
         if responses:
             message.user = ""
             message.args = responses
-            try:
-                if self._isconnected:
-                    if self._message_bus == "zmq":
+            self._send_responses(message)
+
+    def _send_responses(self, message):
+        try:
+            if self._isconnected:
+                if self._message_bus == "zmq":
+                    self.core().connection.send_vip_object(
+                        message, copy=False
+                    )
+                else:
+                    # Agent is running on RMQ message bus.
+                    # Adding backward compatibility support for ZMQ.
+                    # Check if the peer is running on ZMQ bus.
+                    # If yes, send RPC message to proxy router
+                    # agent to forward using ZMQ message bus connection
+                    try:
+                        msg_bus = self.peer_list[message.peer]
+                    except KeyError:
+                        msg_bus = self._message_bus
+                    if msg_bus == "zmq":
+                        # If peer connected to ZMQ bus,
+                        # send via proxy router agent
+                        self.core().connection.send_vip_object_via_proxy(
+                            message
+                        )
+                    else:
                         self.core().connection.send_vip_object(
                             message, copy=False
                         )
-                    else:
-                        # Agent is running on RMQ message bus.
-                        # Adding backward compatibility support for ZMQ.
-                        # Check if the peer is running on ZMQ bus.
-                        # If yes, send RPC message to proxy router
-                        # agent to forward using ZMQ message bus connection
-                        try:
-                            msg_bus = self.peer_list[message.peer]
-                        except KeyError:
-                            msg_bus = self._message_bus
-                        if msg_bus == "zmq":
-                            # If peer connected to ZMQ bus,
-                            # send via proxy router agent
-                            self.core().connection.send_vip_object_via_proxy(
-                                message
-                            )
-                        else:
-                            self.core().connection.send_vip_object(
-                                message, copy=False
-                            )
-            except ZMQError as exc:
-                if exc.errno == ENOTSOCK:
-                    _log.debug(
-                        "Socket send on non-socket %s",
-                        self.core().identity
-                    )
+        except ZMQError as exc:
+            if exc.errno == ENOTSOCK:
+                _log.debug(
+                    "Socket send on non-socket %s",
+                    self.core().identity
+                )
 
     def _handle_error(self, sender, message, error, **kwargs):
         result = self._outstanding.pop(message.id, None)
@@ -26,12 +26,21 @@ from collections import defaultdict
 from datetime import datetime
 import logging
 
+import gevent
+
 from volttron.platform.agent.known_identities import CONTROL_CONNECTION, PROCESS_IDENTITIES
 from volttron.platform.agent.utils import format_timestamp
+from volttron.platform.jsonrpc import Error, RemoteError
+from volttron.platform.messaging.health import STATUS_UNKNOWN
+from volttron.platform.messaging.topics import PLATFORM_HEALTH_STATUS
 from volttron.platform.vip.agent import Agent, Core, RPC
+from volttron.platform.vip.agent.errors import Unreachable, VIPError
 
 _log = logging.getLogger(__name__)
 
+# Seconds to wait for an agent's full status after it reports a transition.
+STATUS_FETCH_TIMEOUT = 5
+
 
 class HealthService(Agent):
 
@@ -57,8 +66,12 @@ class HealthService(Agent):
 
     def peer_dropped(self, peer):
         # TODO: Should there be an option for  a db/log file for agents coming and going from the platform?
-        self._health_dict[peer]['disconnected'] = format_timestamp(datetime.now())
-        del self._health_dict[peer]
+        health = self._health_dict.pop(peer, {})
+        previous = health.get('message')
+        if previous is not None and previous != STATUS_UNKNOWN:
+            # The agent can no longer report its own status so report the transition for it.
+            self.core.spawn(self._publish_transition, peer, previous, STATUS_UNKNOWN,
+                            format_timestamp(datetime.now()), fetch=False)
 
     @RPC.export
     def get_platform_health(self):
@@ -89,10 +102,71 @@ class HealthService(Agent):
                               if not v.get('peer') == CONTROL_CONNECTION}
         return agents
 
+    @RPC.export
+    def get_agent_statuses(self):
+        """
+        The `get_agent_statuses` returns the last known status of every connected agent
+        from the service's table, so management tools do not have to query each agent.
+
+        The status of an agent is refreshed each time its heartbeat reports a different
+        status value.  Agents that have not published a heartbeat yet are not included.
+
+        .. code-block :: json
+
+            {
+                "listeneragent-3.3_35":
+                {
+                    "status": "GOOD",
+                    "context": null,
+                    "last_updated": "2020-10-28T12:46:58.701119+00:00",
+                    "last_heartbeat": "2020-10-28T12:47:03.709605"
+                }
+            }
+
+        :return: dictionary of identity to status
+        """
+        statuses = {}
+        for identity, health in self._health_dict.items():
+            if health.get('peer') == CONTROL_CONNECTION or 'message' not in health:
+                continue
+            status = health.get('status')
+            if status is None or status.get('status') != health['message']:
+                status = dict(status=health['message'], context=None, last_updated=health['last_heartbeat'])
+            statuses[identity] = dict(status, last_heartbeat=health['last_heartbeat'])
+        return statuses
+
+    def _publish_transition(self, identity, previous, status, last_heartbeat, fetch=True):
+        """
+        Publish a status transition of an agent on `platform/health/status/<identity>`.
+
+        The heartbeat only carries the status value, so the full status (including its
+        context) is requested from the agent once per transition.
+        """
+        full_status = None
+        if fetch:
+            try:
+                full_status = self.vip.rpc.call(identity, 'health.get_status').get(timeout=STATUS_FETCH_TIMEOUT)
+            except (gevent.Timeout, Unreachable, RemoteError, Error) as e:
+                _log.debug("Couldn't get status of {}: {}".format(identity, e))
+            health = self._health_dict.get(identity)
+            # Only keep the fetched status if no newer transition has been seen in the meantime.
+            if full_status is not None and health is not None and health.get('message') == full_status.get('status'):
+                health['status'] = full_status
+
+        message = dict(identity=identity,
+                       previous=previous,
+                       status=status,
+                       context=full_status.get('context') if full_status else None,
+                       last_heartbeat=last_heartbeat)
+        try:
+            self.vip.pubsub.publish('pubsub', PLATFORM_HEALTH_STATUS(identity=identity), message=message)
+        except VIPError as e:
+            _log.debug("Couldn't publish status transition of {}: {}".format(identity, e))
+
     def _heartbeat_updates(self, peer, sender, bus, topic, headers, message):
         """
         This method is called whenever a publish goes on the message bus from the
-        heartbeat* topic.
+        heartbeat* topic.  Only a change of the reported status is published again.
 
         :param peer:
         :param sender:
@@ -109,8 +183,11 @@ class HealthService(Agent):
             health['peer'] = sender
             health['service_agent'] = sender in PROCESS_IDENTITIES
 
+        previous = health.get('message')
         health['last_heartbeat'] = time_now
         health['message'] = message
+        if message != previous:
+            self.core.spawn(self._publish_transition, sender, previous, message, time_now)
 
     @Core.receiver('onstart')
     def onstart(self, sender, **kwargs):
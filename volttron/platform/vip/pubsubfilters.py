@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*- {{{
+# ===----------------------------------------------------------------------===
+#
+#                 Component of Eclipse VOLTTRON
+#
+# ===----------------------------------------------------------------------===
+#
+# Copyright 2023 Battelle Memorial Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# ===----------------------------------------------------------------------===
+# }}}
+
+'''Declarative content filters for pubsub subscriptions.
+
+A filter is evaluated by the PubSubService before a publish is sent to a
+subscriber, so selective consumers do not pay for messages they would
+discard.  A filter is a condition or a list of conditions that must all
+hold.  A condition is a dictionary::
+
+    {"path": "headers.alarm", "op": "eq", "value": true}
+    {"path": "message.0.ZoneTemperature", "op": "crosses", "value": 78.0}
+    {"path": "message.0.DamperPosition", "op": "changed"}
+    {"any": [<condition>, <condition>, ...]}
+
+``path`` is a dotted path into ``{"headers": ..., "message": ...}``;
+numeric segments index into lists.  A condition whose path does not
+resolve is false.  ``op`` is one of eq, ne, gt, ge, lt, le, in, exists,
+changed (value differs from the previous message on the same topic) and
+crosses (value moved to the other side of the threshold since the
+previous message on the same topic).
+
+Filters are compiled once, when the subscription is made.  Publishes
+sent through shared memory are evaluated against the payload read from
+the publisher's ring.
+'''
+
+import operator
+
+__all__ = ['ContentFilter', 'compile_filter']
+
+_MISSING = object()
+
+_COMPARISONS = {
+    'eq': operator.eq,
+    'ne': operator.ne,
+    'gt': operator.gt,
+    'ge': operator.ge,
+    'lt': operator.lt,
+    'le': operator.le,
+    'in': lambda value, expected: value in expected,
+    'exists': lambda value, expected: True
+}
+_STATEFUL = ('changed', 'crosses')
+
+
+def _compile_path(path):
+    if not isinstance(path, str) or not path:
+        raise ValueError('filter path must be a non-empty string')
+    segments = []
+    for segment in path.split('.'):
+        segments.append(int(segment) if segment.isdigit() else segment)
+    if segments[0] not in ('headers', 'message'):
+        raise ValueError('filter path must start with headers or message, got {}'.format(path))
+    return tuple(segments)
+
+
+def _resolve(segments, data):
+    for segment in segments:
+        try:
+            data = data[segment]
+        except (KeyError, IndexError, TypeError):
+            return _MISSING
+    return data
+
+
+class ContentFilter:
+    '''Compiled subscription filter.
+
+    Calling the filter with a topic and the publish message (a dictionary
+    with headers and message keys) returns True if the message should be
+    delivered.
+    '''
+
+    def __init__(self, spec):
+        self.spec = spec
+        # Last value seen per (topic, condition index) for stateful conditions
+        self._last = {}
+        self._count = 0
+        conditions = spec if isinstance(spec, list) else [spec]
+        if not conditions:
+            raise ValueError('filter must contain at least one condition')
+        self._conditions = [self._compile(condition) for condition in conditions]
+
+    def _compile(self, condition):
+        if not isinstance(condition, dict):
+            raise ValueError('filter condition must be a dictionary, got {!r}'.format(condition))
+        if 'any' in condition:
+            if not isinstance(condition['any'], list):
+                raise ValueError('any must be a list of conditions')
+            alternatives = [self._compile(alternative) for alternative in condition['any']]
+            if not alternatives:
+                raise ValueError('any must contain at least one condition')
+
+            def test(topic, data):
+                return any([alternative(topic, data) for alternative in alternatives])
+            return test
+
+        segments = _compile_path(condition.get('path'))
+        op = condition.get('op', 'exists')
+        expected = condition.get('value')
+
+        if op in _STATEFUL:
+            if op == 'crosses' and not isinstance(expected, (int, float)):
+                raise ValueError('crosses requires a numeric value')
+            self._count += 1
+            index = self._count
+            last = self._last
+
+            def test(topic, data):
+                value = _resolve(segments, data)
+                if value is _MISSING:
+                    return False
+                key = (topic, index)
+                previous = last.get(key, _MISSING)
+                last[key] = value
+                if op == 'changed':
+                    return previous is _MISSING or previous != value
+                if previous is _MISSING:
+                    return False
+                try:
+                    return (previous < expected) != (value < expected)
+                except TypeError:
+                    return False
+            return test
+
+        try:
+            compare = _COMPARISONS[op]
+        except KeyError:
+            raise ValueError('unknown filter operation {}'.format(op))
+
+        def test(topic, data):
+            value = _resolve(segments, data)
+            if value is _MISSING:
+                return False
+            try:
+                return compare(value, expected)
+            except TypeError:
+                return False
+        return test
+
+    def __call__(self, topic, data):
+        # Every condition is evaluated so that stateful conditions see every message.
+        results = [test(topic, data) for test in self._conditions]
+        return all(results)
+
+
+def compile_filter(spec):
+    '''Compile a filter specification, raising ValueError if it is invalid.'''
+    return ContentFilter(spec)
@@ -28,6 +28,8 @@ import logging
 import logging.config
 import os
 import re
+import time
+import zlib
 
 import zmq
 from zmq import SNDMORE, EHOSTUNREACH, ZMQError, EAGAIN, NOBLOCK
@@ -35,11 +37,14 @@ from zmq import green
 from collections import defaultdict
 
 # Create a context common to the green and non-green zmq modules.
-from volttron.platform.agent.utils import get_platform_instance_name
+from volttron.platform.agent.utils import get_platform_instance_name, get_hot_path_logger
 from volttron.utils.frame_serialization import serialize_frames
 
 green.Context._instance = green.Context.shadow(zmq.Context.instance().underlying)
 from .agent.subsystems.pubsub import ProtectedPubSubTopics
+from .pubsubfilters import compile_filter
+from .routingservice import decode_batch
+from .sharedmemory import OverwrittenError, SharedMemoryReader, remove_stale_rings
 from volttron.platform.jsonrpc import (INVALID_REQUEST, UNAUTHORIZED)
 from volttron.platform import jsonapi
 
@@ -51,6 +56,16 @@ _ROUTE_ERRORS = {
 }
 
 _log = logging.getLogger(__name__)
+# Per-message logging
+_hot_log = get_hot_path_logger(__name__)
+_UNRESOLVED = object()
+
+# Seconds to wait before retrying delivery to a backlogged conflated subscriber
+CONFLATION_RETRY = 0.1
+
+# Maximum number of cached (topic, user) protected topic verdicts
+PROTECTED_VERDICT_CACHE_SIZE = 10000
+
 
 class PubSubService:
     def __init__(self, socket, protected_topics, routing_service, *args, **kwargs):
@@ -65,6 +80,8 @@ class PubSubService:
         self._peer_subscriptions = defaultdict(platform_subscriptions)
         self._vip_sock = socket
         self._user_capabilities = {}
+        # (topic, user) -> result of _check_if_protected_topic
+        self._protected_verdicts = {}
         self._protected_topics = ProtectedPubSubTopics()
         self._load_protected_topics(protected_topics)
         self._ext_subscriptions = defaultdict(set)
@@ -73,6 +90,16 @@ class PubSubService:
             self._ext_router.register('on_connect', self.external_platform_add)
             self._ext_router.register('on_disconnect', self.external_platform_drop)
         self._rabbitmq_agent = None
+        self._shared_reader = SharedMemoryReader()
+        remove_stale_rings()
+        # Conflated subscriptions: (peer, bus, prefix) -> minimum interval in seconds
+        self._conflation = {}
+        # Subscriptions with a content filter: (peer, bus, prefix) -> compiled filter
+        self._filters = {}
+        # Latest undelivered message per (subscriber, topic): [frames, due time]
+        self._conflated_pending = {}
+        # Time of the last delivery per (subscriber, topic) of conflated subscriptions
+        self._conflated_sent = {}
 
     def _add_peer_subscription(self, peer, bus, prefix, platform='internal'):
         """
@@ -95,6 +122,10 @@ class PubSubService:
         :type pointer to arguments
         """
         self._sync(peer, {})
+        for key in [key for key in self._conflated_pending if key[0] == peer]:
+            del self._conflated_pending[key]
+        for key in [key for key in self._conflated_sent if key[0] == peer]:
+            del self._conflated_sent[key]
 
     def peer_add(self, peer):
         # To do
@@ -113,7 +144,7 @@ class PubSubService:
             self._logger.debug("PUBSUBSERVICE dropping external subscriptions for {}".format(instance_name))
             del self._ext_subscriptions[instance_name]
 
-    def _sync(self, peer, items):
+    def _sync(self, peer, items, conflate=None, filters=None):
         """
         Synchronize the subscriptions with calling agent (peer) when it gets newly connected. OR Unsubscribe from
         stale/forgotten/unsolicited subscriptions when the peer is dropped.
@@ -121,7 +152,24 @@ class PubSubService:
         :type peer str
         :param items subcription items or empty dict
         :type dict
+        :param conflate conflated subscriptions of the peer as {bus: {prefix: interval}}
+        :type dict
+        :param filters content filters of the peer as {bus: {prefix: filter}}
+        :type dict
         """
+        for key in [key for key in self._conflation if key[0] == peer]:
+            del self._conflation[key]
+        for bus, prefixes in (conflate or {}).items():
+            for prefix, interval in prefixes.items():
+                self._conflation[(peer, bus, prefix)] = float(interval)
+        for key in [key for key in self._filters if key[0] == peer]:
+            del self._filters[key]
+        for bus, prefixes in (filters or {}).items():
+            for prefix, spec in prefixes.items():
+                try:
+                    self._filters[(peer, bus, prefix)] = compile_filter(spec)
+                except ValueError as exc:
+                    self._logger.error("Invalid filter from {} for {}: {}".format(peer, prefix, exc))
         # self._logger.debug("SYNC before: {0}, {1}".format(peer, items))
         items = {(platform, bus, prefix) for platform, buses in items.items()
                                          for bus, topics in buses.items()
@@ -167,7 +215,7 @@ class PubSubService:
                 try:
                     items = msg['subscriptions']
                     assert isinstance(items, dict)
-                    self._sync(peer, items)
+                    self._sync(peer, items, msg.get('conflate'), msg.get('filters'))
                 except KeyError as exc:
                     self._logger.error("Missing key in _peer_sync message {}".format(exc))
 
@@ -192,6 +240,14 @@ class PubSubService:
                 return False
 
             is_all = msg.get('all_platforms', False)
+            conflate = msg.get('conflate')
+            content_filter = msg.get('filter')
+            if content_filter is not None:
+                try:
+                    content_filter = compile_filter(content_filter)
+                except ValueError as exc:
+                    self._logger.error("Invalid filter in _peer_subscribe message {}".format(exc))
+                    return False
 
             if is_all:
                 platform = 'all'
@@ -206,6 +262,14 @@ class PubSubService:
 
             for prefix in prefix if isinstance(prefix, list) else [prefix]:
                 self._add_peer_subscription(peer, bus, prefix, platform)
+                if conflate is None:
+                    self._conflation.pop((peer, bus, prefix), None)
+                else:
+                    self._conflation[(peer, bus, prefix)] = float(conflate)
+                if content_filter is None:
+                    self._filters.pop((peer, bus, prefix), None)
+                else:
+                    self._filters[(peer, bus, prefix)] = content_filter
 
             # self._logger.debug("Subscribe after: {}".format(self._peer_subscriptions))
             if is_all and self._ext_router is not None:
@@ -250,12 +314,16 @@ class PubSubService:
                     remove = []
                     for topic, subscribers in subscriptions.items():
                         subscribers.discard(peer)
+                        self._conflation.pop((peer, bus, topic), None)
+                        self._filters.pop((peer, bus, topic), None)
                         if not subscribers:
                             remove.append(topic)
                     for topic in remove:
                         del subscriptions[topic]
                 else:
                     for prefix in prefix if isinstance(prefix, list) else [prefix]:
+                        self._conflation.pop((peer, bus, prefix), None)
+                        self._filters.pop((peer, bus, prefix), None)
                         subscribers = subscriptions[prefix]
                         subscribers.discard(peer)
                         if not subscribers:
@@ -287,6 +355,9 @@ class PubSubService:
                 peer = frames[0]
                 bus = msg['bus']
                 pub_msg = dict(sender=peer, bus=bus, headers=headers, message=message)
+                if 'shm' in msg:
+                    # Payload stays in the publisher's shared memory ring, only forward the descriptor.
+                    pub_msg['shm'] = msg['shm']
                 frames[8] = pub_msg
             except KeyError as exc:
                 self._logger.error("Missing key in _peer_publish message {}".format(exc))
@@ -424,14 +495,40 @@ class PubSubService:
         subs.update(all_subscriptions)
         subs.update(subscriptions)
         subscribers = set()
+        # Conflated subscribers and their minimum interval. A subscriber also holding a regular
+        # subscription matching the topic receives every message.
+        conflated = {}
+        regular = set()
+        # Message content filters are evaluated against, resolved from shared memory on first use
+        filter_msg = _UNRESOLVED
         # Check for local subscribers
         for prefix, subscription in subs.items():
             if subscription and topic.startswith(prefix):
-                subscribers |= subscription
+                if not (self._conflation or self._filters):
+                    subscribers |= subscription
+                    continue
+                for subscriber in subscription:
+                    key = (subscriber, bus, prefix)
+                    content_filter = self._filters.get(key)
+                    if content_filter is not None:
+                        if filter_msg is _UNRESOLVED:
+                            filter_msg = self._inline_shared(msg) if 'shm' in msg else msg
+                        # An unreadable shared memory publish cannot be delivered anyway.
+                        if filter_msg is None or not content_filter(topic, filter_msg):
+                            continue
+                    subscribers.add(subscriber)
+                    interval = self._conflation.get(key)
+                    if interval is None:
+                        regular.add(subscriber)
+                    else:
+                        conflated[subscriber] = min(interval, conflated.get(subscriber, interval))
 
         if subscribers:
             # self._logger.debug("PUBSUBSERVICE: found subscribers: {}".format(subscribers))
             for subscriber in subscribers:
+                if subscriber in conflated and subscriber not in regular:
+                    self._conflate(subscriber, topic, frames, conflated[subscriber])
+                    continue
                 frames[0] = subscriber
                 try:
                     # Send the message to the subscriber
@@ -460,12 +557,21 @@ class PubSubService:
                     external_subscribers.add(platform_id)
         # self._logger.debug("PUBSUBSERVICE External subscriptions {0}, {1}".format(topic, external_subscribers))
         if external_subscribers:
+            if isinstance(data, dict) and 'shm' in data:
+                data = self._inline_shared(data)
+                if data is None:
+                    return 0
+            if self._ext_router is not None and self._ext_router.batching:
+                # Coalesced per platform, the routing service sends the batch when it is full or due
+                for platform_id in external_subscribers:
+                    self._ext_router.queue_external(platform_id, topic, data)
+                return len(external_subscribers)
             frames[:] = []
             frames[0:7] = '', proto, user_id, msg_id, subsystem, 'external_publish', topic, data
             for platform_id in external_subscribers:
                 try:
                     if self._ext_router is not None:
-                        self._logger.debug("Sending to: {}".format(platform_id))
+                        _hot_log.debug("Sending to: %s", platform_id)
                         # Send the message to the external platform
                         success = self._ext_router.send_external(platform_id, frames)
                 except ZMQError as exc:
@@ -491,6 +597,85 @@ class PubSubService:
                         raise
         return len(external_subscribers)
 
+    def _conflate(self, subscriber, topic, frames, interval):
+        """
+        Deliver a publish to a conflated subscriber. The message is sent right away unless an earlier message for
+        the topic is still pending or was delivered less than interval seconds ago; it is then kept as the pending
+        message for the topic, superseding (and dropping) any older one without serializing it.
+        """
+        key = (subscriber, topic)
+        frames = list(frames)
+        frames[0] = subscriber
+        now = time.time()
+        pending = self._conflated_pending.get(key)
+        if pending is not None:
+            pending[0] = frames
+            return
+        due = self._conflated_sent.get(key, 0) + interval
+        if due > now or not self._send_conflated(key, frames, now):
+            self._conflated_pending[key] = [frames, max(due, now)]
+
+    def _send_conflated(self, key, frames, now):
+        """
+        Send a conflated message without blocking.
+        :returns: False if the subscriber is backlogged and the message should stay pending.
+        """
+        try:
+            self._vip_sock.send_multipart(serialize_frames(frames), flags=NOBLOCK, copy=False)
+        except ZMQError as exc:
+            if exc.errno == EAGAIN:
+                return False
+            if exc.errno == EHOSTUNREACH:
+                self._logger.debug("Host unreachable {}".format(key[0]))
+                self.peer_drop(key[0])
+                return True
+            raise
+        self._conflated_sent[key] = now
+        return True
+
+    def flush_conflated(self):
+        """
+        Send pending conflated messages that are due. Called by the router after each poll.
+        """
+        if not self._conflated_pending:
+            return
+        now = time.time()
+        for key, (frames, due) in list(self._conflated_pending.items()):
+            if due > now or key not in self._conflated_pending:
+                continue
+            if self._send_conflated(key, frames, now):
+                self._conflated_pending.pop(key, None)
+            else:
+                # Subscriber is still backlogged, retry shortly with whatever is newest then.
+                self._conflated_pending[key][1] = now + CONFLATION_RETRY
+
+    def conflation_timeout(self):
+        """
+        Milliseconds until the next pending conflated message is due or None if nothing is pending. Used by the
+        router as its poll timeout.
+        """
+        if not self._conflated_pending:
+            return None
+        due = min(pending[1] for pending in self._conflated_pending.values())
+        return max(0, int((due - time.time()) * 1000))
+
+    def _inline_shared(self, msg):
+        """
+        Replace the shared memory descriptor of a publish message with the payload it references. Used when
+        the message has to leave this host.
+        :param msg: publish message containing a shm descriptor
+        :return: copy of the message with the payload inlined or None if the payload is no longer available
+        """
+        msg = dict(msg)
+        descriptor = msg.pop('shm')
+        try:
+            msg['message'] = jsonapi.loadb(self._shared_reader.read(descriptor))
+        except (OverwrittenError, OSError) as exc:
+            # OSError covers rings that are gone or belong to another user
+            self._logger.error("Unable to read shared memory publish: {}".format(exc))
+            return None
+        return msg
+
     def _send(self, frames, publisher):
         """
         Sends the message to the recipient. If the recipient is unreachable, it is dropped from list of peers (and
@@ -549,6 +734,7 @@ class PubSubService:
             try:
                 msg = frames[7]
                 self._user_capabilities = msg['capabilities']
+                self._protected_verdicts.clear()
             except KeyError as exc:
                 self._logger.error("Missing key in update auth capabilities message {}".format(exc))
             except ValueError:
@@ -583,6 +769,7 @@ class PubSubService:
             self._logger.exception('invalid format for protected topics ')
         else:
             self._protected_topics = topics
+            self._protected_verdicts.clear()
             self._logger.debug('protected-topics loaded')
 
     def handle_subsystem(self, frames, user_id=''):
@@ -640,6 +827,8 @@ class PubSubService:
             elif op == 'external_publish':
                 self._logger.debug("PUBSUBSERVICE external to local publish")
                 self._external_to_local_publish(frames)
+            elif op == 'external_publish_batch':
+                self._external_batch_to_local_publish(frames)
             elif op == 'error':
                 self._handle_error(frames)
             elif op == 'request_response':
@@ -669,6 +858,17 @@ class PubSubService:
         :Return Values:
         None or error message
         """
+        key = (topic, peer)
+        try:
+            return self._protected_verdicts[key]
+        except KeyError:
+            pass
+        if len(self._protected_verdicts) >= PROTECTED_VERDICT_CACHE_SIZE:
+            self._protected_verdicts.clear()
+        msg = self._protected_verdicts[key] = self._protected_topic_verdict(peer, topic)
+        return msg
+
+    def _protected_topic_verdict(self, peer, topic):
         msg = None
         required_caps = self._protected_topics.get(topic)
 
@@ -727,7 +927,7 @@ class PubSubService:
         if len(frames) <= 7:
             return False
         else:
-            _log.debug(f"external subscription frames {frames}")
+            _hot_log.debug("external subscription frames %s", frames)
             msg = frames[7]
             if not isinstance(msg, dict):
                 raise ValueError(f"Invalid frame passed for frame {frames[7]}")
@@ -767,7 +967,7 @@ class PubSubService:
         results = []
         subscribers_count = 0
         # Check if destination is local VIP -- Todo
-        _log.debug(f"external_to_local_publish frames {frames}")
+        _hot_log.debug("external_to_local_publish frames %s", frames)
 
         if len(frames) > 8:
             publisher, receiver, proto, user_id, msg_id, subsystem, op, topic, data = frames[0:9]
@@ -805,6 +1005,23 @@ class PubSubService:
             self._logger.debug("Incorrect frames {}".format(len(frames)))
         return subscribers_count
 
+    def _external_batch_to_local_publish(self, frames):
+        """
+        Publish a batch of external pubsub messages to local subscribers
+        :param frames: frames containing the codec and the batch payload
+        """
+        if len(frames) < 9:
+            self._logger.debug("Incorrect frames {}".format(len(frames)))
+            return
+        try:
+            entries = decode_batch(frames[7], frames[8])
+        except (ValueError, zlib.error) as exc:
+            self._logger.error("Unable to decode external publish batch: {}".format(exc))
+            return
+        _hot_log.debug("PUBSUBSERVICE external to local publish of %s messages", len(entries))
+        for topic, data in entries:
+            self._external_to_local_publish(frames[:6] + ['external_publish', topic, data])
+
     def _handle_error(self, frames):
         """
         Error handler
@@ -831,7 +1048,7 @@ class PubSubService:
         frames = [sender, '', 'VIP1', '', '', 'pubsub', 'publish', topic, json_msg]
         # Send it through ZMQ bus
         self._distribute(frames, '')
-        self._logger.debug("Publish callback {}".format(topic))
+        _hot_log.debug("Publish callback %s", topic)
 
     def _publish_on_rmq_bus(self, frames: list):
         """
@@ -849,6 +1066,10 @@ class PubSubService:
             self._logger.error("Missing key in _peer_publish message {}".format(exc))
         except ValueError:
             self._logger.error("JSON decode error. Invalid character")
+        if 'shm' in msg:
+            msg = self._inline_shared(msg)
+            if msg is None:
+                return
         if self._rabbitmq_agent:
             self._rabbitmq_agent.vip.pubsub.publish('pubsub',
                                                     topic,
@@ -858,11 +1079,22 @@ class PubSubService:
 
 
 class ProtectedPubSubTopics:
-    '''Simple class to contain protected pubsub topics'''
+    '''Protected pubsub topics compiled for matching on every publish.
+
+    Literal topics are kept in a character trie, so the first configured
+    literal that prefixes a topic is found in time proportional to the
+    length of the topic.  Regular expression topics (``/.../``) are combined
+    into a single alternation; the alternatives are tried in configuration
+    order, so the first matching pattern wins as before.
+    '''
 
     def __init__(self):
         self._dict = {}
         self._re_list = []
+        # Trie node: [children, (insertion index, topic) or None]
+        self._trie = [{}, None]
+        self._combined = None
+        self._dirty = False
 
     def add(self, topic, capabilities):
         if isinstance(capabilities, str):
@@ -870,7 +1102,13 @@ class ProtectedPubSubTopics:
         if len(topic) > 1 and topic[0] == topic[-1] == '/':
             regex = re.compile('^' + topic[1:-1] + '$')
             self._re_list.append((regex, capabilities))
+            self._dirty = True
         else:
+            if topic not in self._dict:
+                node = self._trie
+                for char in topic:
+                    node = node[0].setdefault(char, [{}, None])
+                node[1] = (len(self._dict), topic)
             self._dict[topic] = capabilities
 
     def get(self, topic):
@@ -880,6 +1118,13 @@ class ProtectedPubSubTopics:
         prefix = self._isprefix(topic)
         if prefix is not None:
             return self._dict[prefix]
+        if self._dirty:
+            self._compile()
+        if self._combined is not None:
+            match = self._combined.match(topic)
+            if match is not None:
+                return self._re_list[int(match.lastgroup[2:])][1]
+            return None
         for regex, capabilities in self._re_list:
             if regex.match(topic):
                 return capabilities
@@ -888,9 +1133,33 @@ class ProtectedPubSubTopics:
     def get_topic_caps(self):
         return self._dict.copy()
 
+    def _compile(self):
+        self._dirty = False
+        self._combined = None
+        if not self._re_list:
+            return
+        patterns = [regex.pattern for regex, _ in self._re_list]
+        # Numbered back-references would point at the wrong group once the
+        # patterns are combined; such configurations are matched one by one.
+        if any(re.search(r'\\[1-9]', pattern) for pattern in patterns):
+            return
+        try:
+            self._combined = re.compile('|'.join(
+                '(?P<_p{}>{})'.format(index, pattern) for index, pattern in enumerate(patterns)))
+        except re.error:
+            self._combined = None
+
     def _isprefix(self, topic):
-        for prefix in self._dict:
-            if topic[:len(prefix)] == prefix:
-                _log.debug(f"Prefix is {prefix}")
-                return prefix
-        return None
+        # The first configured literal that prefixes topic wins, as when
+        # the literals were scanned in order.
+        node = self._trie
+        found = node[1]
+        for char in topic:
+            node = node[0].get(char)
+            if node is None:
+                break
+            if node[1] is not None and (found is None or node[1][0] < found[0]):
+                found = node[1]
+        if found is None:
+            return None
+        return found[1]
@@ -122,6 +122,14 @@ class RMQConnection(BaseConnection):
         # Open a channel
         self._connection.channel(on_open_callback=self.on_channel_open)
 
+    def open_channel(self, on_open_callback):
+        """
+        Open an additional channel on the connection.
+        :param on_open_callback: called with the channel once it is open
+        :return:
+        """
+        self._connection.channel(on_open_callback=on_open_callback)
+
     def on_open_error(self, _connection_unused, error_message=None):
         """
         Call the registered error handler
@@ -285,6 +293,8 @@ class RMQConnection(BaseConnection):
         msg.id = props.message_id
         msg.subsystem = props.type
         msg.args = jsonapi.loads(body)
+        # Size of the arguments on the wire, used for the agent's inbox budget
+        msg.size = len(body)
         if self._vip_handler:
             self._vip_handler(msg)
         self.channel.basic_ack(method.delivery_tag)
@@ -27,11 +27,14 @@
 
 import os
 import logging
+from collections import deque
 from typing import Optional
 
 import zmq
 from zmq import Frame, NOBLOCK, ZMQError, EINVAL, EHOSTUNREACH
 
+from volttron.platform.agent.known_identities import (AUTH, CONFIGURATION_STORE, CONTROL,
+                                                       PLATFORM_HEALTH)
 from volttron.platform.vip.servicepeer import ServicePeerNotifier
 from volttron.utils.frame_serialization import serialize_frames
 
@@ -55,6 +58,14 @@ _INVALID_SUBSYSTEM = (
     zmq.Frame(os.strerror(zmq.EPROTONOSUPPORT).encode('ascii'))
 )
 
+# Control-plane traffic that is routed ahead of bulk traffic when the
+# router is backlogged.  Messages are classified by subsystem, by the
+# platform services taking part in the exchange and by pubsub topic.
+PRIORITY_SUBSYSTEMS = frozenset(['hello', 'ping', 'peerlist', 'query', 'error',
+                                 'agentstop', 'quit', 'routing_table'])
+PRIORITY_PEERS = frozenset([CONTROL, CONFIGURATION_STORE, AUTH, PLATFORM_HEALTH])
+PRIORITY_TOPIC_PREFIXES = ('heartbeat/',)
+
 
 class BaseRouter:
     '''Abstract base class of VIP router implementation.
@@ -75,6 +86,15 @@ class BaseRouter:
     _socket_class = zmq.Socket
     _poller_class = zmq.Poller
 
+    # Maximum number of messages read from the socket before the queued
+    # messages are routed.
+    backlog_batch_size = 256
+
+    # Maximum number of subscription snapshots admitted per routing pass.
+    # After a platform restart every agent resynchronizes at once; pacing
+    # the snapshots keeps control traffic flowing while they are applied.
+    admission_batch_size = 16
+
     def __init__(self, context=None, default_user_id=None, service_notifier=Optional[ServicePeerNotifier]):
         '''Initialize the object instance.
 
@@ -89,6 +109,12 @@ class BaseRouter:
         self._ext_sockets = []
         self._socket_id_mapping = {}
         self._service_notifier = service_notifier
+        self._priority_lane = deque()
+        self._bulk_lane = deque()
+        # Subscription snapshots awaiting admission, followed by any later
+        # pubsub messages of the same peers so their order is kept.
+        self._admission_lane = deque()
+        self._admitting = {}
 
     def run(self):
         '''Main router loop.'''
@@ -165,6 +191,71 @@ class BaseRouter:
     def issue(self, topic, frames, extra=None):
         pass
 
+    def is_priority(self, frames):
+        '''Return True if the deserialized frames carry control traffic.
+
+        Control traffic is any message for a router handled control
+        subsystem, any message sent to or from one of the platform
+        services in PRIORITY_PEERS and heartbeat publishes.  Messages
+        that cannot be classified are treated as bulk traffic and are
+        rejected (if need be) by route().
+        '''
+        if len(frames) < 6:
+            return True
+        subsystem = frames[5]
+        if subsystem in PRIORITY_SUBSYSTEMS:
+            return True
+        if frames[0] in PRIORITY_PEERS or frames[1] in PRIORITY_PEERS:
+            return True
+        if subsystem == 'pubsub' and len(frames) > 7 and frames[6] == 'publish':
+            topic = frames[7]
+            return isinstance(topic, str) and topic.startswith(PRIORITY_TOPIC_PREFIXES)
+        return False
+
+    def is_resync(self, frames):
+        '''Return True if the frames carry a pubsub subscription snapshot.'''
+        return len(frames) > 6 and frames[5] == 'pubsub' and frames[6] == 'synchronize'
+
+    def enqueue(self, frames):
+        '''Queue deserialized frames on the priority, admission or bulk lane.'''
+        sender = frames[0] if frames else None
+        if self.is_resync(frames) or (sender in self._admitting and frames[5:6] == ['pubsub']):
+            self._admission_lane.append(frames)
+            self._admitting[sender] = self._admitting.get(sender, 0) + 1
+        elif self.is_priority(frames):
+            self._priority_lane.append(frames)
+        else:
+            self._bulk_lane.append(frames)
+
+    def admission_pending(self):
+        '''Return True if subscription snapshots are waiting to be admitted.'''
+        return bool(self._admission_lane)
+
+    def route_queued(self):
+        '''Route queued messages, emptying the priority lane first.
+
+        At most admission_batch_size subscription snapshots are admitted
+        per call; the rest wait for the next call.  Ordering is preserved
+        within each lane.
+        '''
+        priority, bulk = self._priority_lane, self._bulk_lane
+        while priority:
+            self.route(priority.popleft())
+        admission, admitting = self._admission_lane, self._admitting
+        admitted = 0
+        while admission and admitted < self.admission_batch_size:
+            frames = admission.popleft()
+            sender = frames[0]
+            if admitting[sender] == 1:
+                del admitting[sender]
+            else:
+                admitting[sender] -= 1
+            if self.is_resync(frames):
+                admitted += 1
+            self.route(frames)
+        while bulk:
+            self.route(bulk.popleft())
+
     if zmq.zmq_version_info() >= (4, 1, 0):
         def lookup_user_id(self, sender, recipient, auth_token):
             '''Find and return a user identifier.
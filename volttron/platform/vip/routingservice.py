@@ -26,11 +26,14 @@
 
 import os
 import re
+import time
+import zlib
 import zmq
 import logging
 from zmq import SNDMORE, EHOSTUNREACH, ZMQError, EAGAIN, NOBLOCK
 
-from volttron.utils.frame_serialization import serialize_frames
+from volttron.platform import jsonapi as vjsonapi
+from volttron.utils.frame_serialization import ENCODE_FORMAT, serialize_frames
 from ..keystore import KeyStore
 from zmq.utils import jsonapi
 from ..vip.socket import Address
@@ -52,12 +55,64 @@ _ROUTE_ERRORS = {
 
 _log = logging.getLogger(__name__)
 
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+BATCH_CODECS = ('none', 'zlib', 'zstd')
+
+
+def encode_batch(codec, entries):
+    """
+    Encode a list of already serialized [topic, message] entries for an external publish batch.
+    :param codec: none, zlib or zstd
+    :param entries: list of JSON strings
+    :return: batch payload
+    """
+    payload = ('[' + ','.join(entries) + ']').encode('utf-8')
+    if codec == 'zlib':
+        return zlib.compress(payload)
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor().compress(payload)
+    return payload
+
+
+def decode_batch(codec, payload):
+    """
+    Decode the payload of an external publish batch back into a list of [topic, message] entries.
+    :param codec: none, zlib or zstd
+    :param payload: payload frame as deserialized by the router
+    :return: list of entries
+    """
+    if isinstance(payload, list):
+        # Uncompressed batches are already decoded by deserialize_frames
+        return payload
+    if isinstance(payload, str):
+        payload = payload.encode(ENCODE_FORMAT)
+    if codec == 'zlib':
+        payload = zlib.decompress(payload)
+    elif codec == 'zstd':
+        if not HAS_ZSTD:
+            raise ValueError("zstd batch received but the zstandard package is not installed")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    return vjsonapi.loadb(payload)
+
 
 class RoutingService:
     """
     This class maintains connection with external platforms.
     """
-    def __init__(self, socket, context, socket_class, poller, my_addr, instance_name, *args, **kwargs):
+    def __init__(self, socket, context, socket_class, poller, my_addr, instance_name, *args,
+                 batch_size=0, batch_bytes=256 * 1024, batch_interval=0.1, compression='none', **kwargs):
+        """
+        :param batch_size: number of publishes coalesced per remote platform before a batch is sent, 0 or 1 sends
+            every publish on its own
+        :param batch_bytes: flush a batch once its serialized size reaches this many bytes
+        :param batch_interval: maximum time in seconds a publish waits in a batch
+        :param compression: codec for batches: none, zlib or zstd
+        """
         self._routing_table = dict()
         self._poller = poller
         self._instances = dict()
@@ -72,6 +127,67 @@ class RoutingService:
         self._monitor_sockets = set()
         self._socket_identities = dict()
         self._web_addresses = []
+        if compression not in BATCH_CODECS:
+            raise ValueError("Unknown external compression {}, expected one of {}".format(compression, BATCH_CODECS))
+        if compression == 'zstd' and not HAS_ZSTD:
+            _log.warning("zstandard package is not installed, compressing external batches with zlib")
+            compression = 'zlib'
+        self._batch_size = batch_size
+        self._batch_bytes = batch_bytes
+        self._batch_interval = batch_interval
+        self._compression = compression
+        # instance name -> [serialized entries, size in bytes, flush deadline]
+        self._batches = dict()
+
+    @property
+    def batching(self):
+        """True if publishes to remote platforms are coalesced into batches."""
+        return self._batch_size > 1
+
+    def queue_external(self, instance_name, topic, data):
+        """
+        Add a publish to the batch for a remote platform, sending the batch once it is full.
+        :param instance_name: name of remote instance
+        :param topic: publish topic
+        :param data: publish message (sender, bus, headers and message)
+        """
+        entry = vjsonapi.dumps([topic, data])
+        try:
+            batch = self._batches[instance_name]
+        except KeyError:
+            batch = self._batches[instance_name] = [[], 0, time.time() + self._batch_interval]
+        batch[0].append(entry)
+        batch[1] += len(entry)
+        if len(batch[0]) >= self._batch_size or batch[1] >= self._batch_bytes:
+            self._send_batch(instance_name)
+
+    def flush_batches(self, force=False):
+        """
+        Send the batches that are due (or all batches if force is True). Called by the router after each poll.
+        """
+        if not self._batches:
+            return
+        now = time.time()
+        for instance_name in [name for name, batch in self._batches.items() if force or batch[2] <= now]:
+            self._send_batch(instance_name)
+
+    def batch_timeout(self):
+        """
+        Milliseconds until the next batch has to be sent or None if no batch is pending.
+        """
+        if not self._batches:
+            return None
+        deadline = min(batch[2] for batch in self._batches.values())
+        return max(0, int((deadline - time.time()) * 1000))
+
+    def _send_batch(self, instance_name):
+        entries = self._batches.pop(instance_name)[0]
+        payload = encode_batch(self._compression, entries)
+        frames = ['', 'VIP1', '', '', 'pubsub', 'external_publish_batch', self._compression, payload]
+        try:
+            self.send_external(instance_name, frames)
+        except ZMQError as exc:
+            _log.warning("Dropped batch of {} publishes to {}: {}".format(len(entries), instance_name, exc))
 
     def handle_subsystem(self, frames):
         """
@@ -436,5 +552,6 @@ class RoutingService:
         Close external platform socket connections
         :return:
         """
+        self.flush_batches(force=True)
         for name in self._instances:
             self.disconnect_external_instances(name)
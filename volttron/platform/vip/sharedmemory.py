@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*- {{{
+# ===----------------------------------------------------------------------===
+#
+#                 Component of Eclipse VOLTTRON
+#
+# ===----------------------------------------------------------------------===
+#
+# Copyright 2023 Battelle Memorial Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# ===----------------------------------------------------------------------===
+# }}}
+
+'''Shared-memory ring buffer used to move bulk pubsub payloads between
+co-located agents.
+
+The publisher writes the serialized payload into a ring it owns and
+publishes a small descriptor through the router as usual, so routing,
+authorization and subscription matching stay with the PubSubService.
+Subscribers (and the router, when a message has to leave the host)
+resolve the descriptor by reading the payload back out of the ring.
+
+Each record is laid out as ``[seq (u64), length (u32), payload]``.  A
+reader validates the sequence number before and after copying the
+payload; if the writer has wrapped around and overwritten the record in
+the meantime an :class:`OverwrittenError` is raised.
+
+Rings are only readable by the user that created them, so shared memory
+is not used when agents run as separate users (agent isolation mode).
+'''
+
+import logging
+import os
+import re
+import struct
+from multiprocessing import shared_memory
+
+__all__ = ['SharedMemoryRing', 'SharedMemoryReader', 'OverwrittenError',
+           'DEFAULT_RING_SIZE', 'remove_stale_rings']
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_RING_SIZE = 16 * 1024 * 1024
+
+_HEADER = struct.Struct('<QI')
+
+# Where POSIX shared memory segments are visible as files on Linux
+_SHM_DIR = '/dev/shm'
+_RING_NAME = re.compile(r'^volttron-.+-(\d+)$')
+
+# Rings created by this process, so local readers use them directly.
+_owned = {}
+
+
+class OverwrittenError(Exception):
+    '''Raised when a record was overwritten before it could be read.'''
+    pass
+
+
+def _attach(name):
+    '''Attach to an existing segment without taking ownership of it.
+
+    The resource tracker would otherwise unlink a segment it did not
+    create when the reading process exits.
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # track was added in python 3.13
+        from multiprocessing import resource_tracker
+        segment = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        except Exception:
+            pass
+        return segment
+
+
+def ring_name(identity):
+    '''Return a segment name for the given agent identity.'''
+    return 'volttron-{}-{}'.format(re.sub(r'[^A-Za-z0-9_.-]', '_', identity), os.getpid())
+
+
+def remove_stale_rings():
+    '''Unlink rings left behind by processes that are no longer running.
+
+    A ring is named after the pid of its writer and is only unlinked when
+    the writer closes it, so it outlives a writer that crashed.
+
+    :returns: names of the removed rings
+    :rtype: list
+    '''
+    removed = []
+    try:
+        names = os.listdir(_SHM_DIR)
+    except OSError:
+        return removed
+    for name in names:
+        match = _RING_NAME.match(name)
+        if match is None:
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except OSError:
+            # The process exists but belongs to another user.
+            continue
+        try:
+            os.unlink(os.path.join(_SHM_DIR, name))
+        except OSError as exc:
+            _log.debug('Unable to remove stale ring %s: %s', name, exc)
+            continue
+        _log.info('Removed stale shared memory ring %s', name)
+        removed.append(name)
+    return removed
+
+
+class SharedMemoryRing:
+    '''Single-writer ring buffer owned by a publishing agent.'''
+
+    def __init__(self, name, size=DEFAULT_RING_SIZE):
+        self._segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _owned[name] = self._segment
+        self.name = name
+        self.size = size
+        self._offset = 0
+        self._seq = 0
+
+    def write(self, payload):
+        '''Copy payload into the ring and return its descriptor.
+
+        :param payload: serialized message
+        :type payload: bytes
+        :returns: descriptor to be sent in place of the payload
+        :rtype: dict
+        :raises ValueError: if the payload can never fit in the ring
+        '''
+        length = len(payload)
+        record = _HEADER.size + length
+        if record > self.size:
+            raise ValueError('payload of {} bytes does not fit in ring of {} bytes'.format(length, self.size))
+        offset = self._offset
+        if offset + record > self.size:
+            offset = 0
+        self._seq += 1
+        buf = self._segment.buf
+        # Invalidate the slot before writing so readers never see a torn record.
+        _HEADER.pack_into(buf, offset, 0, length)
+        buf[offset + _HEADER.size:offset + record] = payload
+        _HEADER.pack_into(buf, offset, self._seq, length)
+        self._offset = offset + record
+        return dict(name=self.name, offset=offset, length=length, seq=self._seq)
+
+    def close(self):
+        '''Release and remove the segment.'''
+        _owned.pop(self.name, None)
+        try:
+            self._segment.close()
+            self._segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedMemoryReader:
+    '''Resolves descriptors against the rings of any number of writers.'''
+
+    def __init__(self):
+        self._segments = {}
+
+    def read(self, descriptor):
+        '''Return the payload referenced by descriptor.
+
+        :raises OverwrittenError: if the record is no longer available
+        :raises FileNotFoundError: if the ring no longer exists
+        :raises PermissionError: if the ring belongs to another user
+        '''
+        name = descriptor['name']
+        offset = descriptor['offset']
+        seq = descriptor['seq']
+        segment = _owned.get(name)
+        if segment is None:
+            try:
+                segment = self._segments[name]
+            except KeyError:
+                segment = self._segments[name] = _attach(name)
+        buf = segment.buf
+        start = offset + _HEADER.size
+        if _HEADER.unpack_from(buf, offset) != (seq, descriptor['length']):
+            raise OverwrittenError('record {} in {} was overwritten'.format(seq, name))
+        payload = bytes(buf[start:start + descriptor['length']])
+        if _HEADER.unpack_from(buf, offset)[0] != seq:
+            raise OverwrittenError('record {} in {} was overwritten'.format(seq, name))
+        return payload
+
+    def forget(self, name):
+        '''Detach from the named ring, e.g. when its writer went away.'''
+        segment = self._segments.pop(name, None)
+        if segment is not None:
+            segment.close()
+
+    def close(self):
+        for name in list(self._segments):
+            self.forget(name)
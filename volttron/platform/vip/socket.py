@@ -558,8 +558,11 @@ class _Socket:
         # from volttron.utils.frame_serialization import decode_frames
         # decoded = decode_frames(frames)
 
+        # Size of the arguments on the wire, used for the agent's inbox budget
+        size = sum(len(frame) for frame in frames[-1])
         myframes = deserialize_frames(frames)
         dct = dict(zip(('peer', 'user', 'id', 'subsystem', 'args'), myframes))
+        dct['size'] = size
         if via is not None:
             dct['via'] = via
         return dct
@@ -57,6 +57,9 @@ class ZMQConnection(BaseConnection):
         reconnect_interval = flags.get('reconnect_interval', None)
         if reconnect_interval:
             self.socket.setsockopt(zmq.RECONNECT_IVL, reconnect_interval)
+        reconnect_interval_max = flags.get('reconnect_interval_max', None)
+        if reconnect_interval_max:
+            self.socket.setsockopt(zmq.RECONNECT_IVL_MAX, reconnect_interval_max)
 
     def connect(self, callback=None):
         _log.debug(f"connecting to url {self._url}")
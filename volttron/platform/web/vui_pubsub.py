@@ -10,6 +10,10 @@ _log = logging.getLogger()
 
 
 class VUIPubsubManager:
+    # Websocket clients only display the current value of a topic, so deliver at most one message per topic
+    # per interval (in seconds) and let the platform drop superseded ones.
+    conflate_interval = 1.0
+
     def __init__(self, agent):
         self._agent = agent
         self.subscription_websockets = WeakValueDictionary() # Websockets for all topics with current subscriptions.
@@ -58,7 +62,7 @@ class VUIPubsubManager:
 
     def client_opened(self, ws, topic, access_token):
         _log.debug(f'VUIPubsubManager: Subscribing to {topic}')
-        self._agent.vip.pubsub.subscribe('pubsub', topic, ws.on_topic)
+        self._agent.vip.pubsub.subscribe('pubsub', topic, ws.on_topic, conflate=self.conflate_interval)
         self.user_websockets[access_token][topic] = ws
 
         # if topic not in self.subscription_websockets:
@@ -9,8 +9,6 @@ from volttron.platform.agent.base_historian import BackupDatabase, BaseHistorian
 
 SIZE_LIMIT = 1000  # the default submit_size_limit for BaseHistorianAgents
 
-agent_data_dir = os.path.join(os.getcwd(), os.path.basename(os.getcwd()) + ".agent-data")
-cache_db = str(Path(agent_data_dir).joinpath("backup.sqlite"))
 
 def test_get_outstanding_to_publish_should_return_records(
     backup_database, new_publish_list_unique
@@ -183,6 +181,27 @@ def test_get_outstanding_to_publish_should_return_unique_records_on_multiple_tra
     assert backup_database.get_outstanding_to_publish(SIZE_LIMIT) == []
 
 
+@pytest.mark.parametrize("eviction_policy, max_share", [("oldest_records", 1.0), ("oldest_segment", 0.9)])
+def test_backup_new_data_should_evict_oldest_records_over_limit(new_publish_list_unique, eviction_policy, max_share):
+    backup_database = BackupDatabase(BaseHistorian(), 0.0002, 0.9, eviction_policy=eviction_policy)
+    for _ in range(5):
+        cache_full = backup_database.backup_new_data(new_publish_list_unique)
+    assert cache_full
+
+    used_pages = int(query_db("PRAGMA page_count")) - int(query_db("PRAGMA freelist_count"))
+    assert used_pages <= backup_database.max_pages * max_share
+    ids = [int(row) for row in query_db("SELECT id FROM outstanding ORDER BY id").split()]
+    # the newest records are kept without gaps
+    assert 1 < ids[0] and ids == list(range(ids[0], 5001))
+    assert backup_database._record_count == len(ids)
+    assert int(query_db("PRAGMA auto_vacuum")) == 2
+
+
+def test_backup_database_should_reject_unknown_eviction_policy():
+    with pytest.raises(ValueError):
+        BackupDatabase(BaseHistorian(), None, 0.9, eviction_policy="newest_records")
+
+
 def init_db_with_dupes(backup_database, new_publish_list_dupes):
     backup_database.backup_new_data(new_publish_list_dupes)
 
@@ -245,18 +264,19 @@ def new_publish_list_dupes():
     return tuple(dupes)
 
 
+@pytest.fixture(autouse=True)
+def agent_data_dir(tmp_path, monkeypatch):
+    # the backup database is an sqlite database with the name "backup.sqlite" in the agent-data directory of the
+    # working directory; see the method: BackupDatabase._setupdb(check_same_thread) for details
+    monkeypatch.chdir(tmp_path)
+    data_dir = tmp_path.joinpath(tmp_path.name + ".agent-data")
+    data_dir.mkdir()
+    return data_dir
+
+
 @pytest.fixture()
 def backup_database():
-    os.makedirs(agent_data_dir, exist_ok=True)
-    yield BackupDatabase(BaseHistorian(), None, 0.9)
-
-    # Teardown
-    # the backup database is an sqlite database with the name "backup.sqlite".
-    # the db is created if it doesn't exist; see the method: BackupDatabase._setupdb(check_same_thread) for details
-    if os.path.exists(cache_db):
-        os.remove(cache_db)
-    if os.path.exists(agent_data_dir):
-        os.rmdir(agent_data_dir)
+    return BackupDatabase(BaseHistorian(), None, 0.9)
 
 
 def get_all_data(table):
@@ -267,7 +287,8 @@ def get_all_data(table):
 
 def query_db(query):
     output = subprocess.run(
-        ["sqlite3", cache_db, query], text=True, capture_output=True
+        ["sqlite3", str(Path(os.getcwd(), os.path.basename(os.getcwd()) + ".agent-data", "backup.sqlite")), query],
+        text=True, capture_output=True
     )
     # check_returncode() will raise a CalledProcessError if the query fails
     # see https://docs.python.org/3/library/subprocess.html#subprocess.CompletedProcess.returncode
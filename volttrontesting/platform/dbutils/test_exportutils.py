@@ -0,0 +1,91 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+pyarrow = pytest.importorskip("pyarrow")
+import pyarrow.ipc
+import pyarrow.parquet
+
+from volttron.platform.dbutils import exportutils
+from volttron.platform.dbutils.exportutils import export_history
+from volttron.platform.dbutils.sqlitefuncts import SqlLiteFuncts
+
+START = datetime(2020, 6, 1, tzinfo=pytz.UTC)
+END = START + timedelta(hours=4)
+
+
+@pytest.mark.dbutils
+def test_export_parquet_writes_a_row_group_per_block(sqlitefuncts, tmp_path):
+    output_dir = str(tmp_path / "export")
+
+    rows = export_history(sqlitefuncts, output_dir, START, END, topics=["Topic1", "topic2"],
+                          block=timedelta(hours=1), blocks_per_file=2, page_size=7)
+
+    assert rows == 4 * 60 * 2
+    assert sorted(os.listdir(output_dir)) == ["20200601T000000Z.parquet", "20200601T020000Z.parquet",
+                                              "export.json"]
+    parquet_file = pyarrow.parquet.ParquetFile(os.path.join(output_dir, "20200601T000000Z.parquet"))
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read_row_group(0).to_pydict()
+    assert table["topic"] == ["Topic1"] * 60 + ["topic2"] * 60
+    assert table["ts"][0] == START
+    assert table["value"][:60] == [float(minute) for minute in range(60)]
+    assert table["value_string"][60] == '"off"'
+
+
+@pytest.mark.dbutils
+def test_export_keeps_large_integers_exact(sqlitefuncts, tmp_path):
+    output_dir = str(tmp_path / "export")
+    topic3 = sqlitefuncts.insert_topic("topic3")
+    for minute, value in enumerate([2 ** 53, 2 ** 53 + 1, -(2 ** 63), 2 ** 70, 1.5]):
+        sqlitefuncts.insert_data(START + timedelta(minutes=minute), topic3, value)
+    sqlitefuncts.commit()
+
+    export_history(sqlitefuncts, output_dir, START, START + timedelta(hours=1), topics=["topic3"])
+
+    table = pyarrow.parquet.read_table(os.path.join(output_dir, "20200601T000000Z.parquet")).to_pydict()
+    assert table["value"] == [float(2 ** 53), None, None, None, 1.5]
+    assert table["value_string"] == [None, str(2 ** 53 + 1), str(-(2 ** 63)), str(2 ** 70), None]
+
+
+@pytest.mark.dbutils
+def test_export_arrow_resumes_after_interruption(sqlitefuncts, tmp_path, monkeypatch):
+    output_dir = str(tmp_path / "export")
+    write_file = exportutils._write_file
+
+    def interrupted_write_file(dbfuncts, path, *args):
+        if path.endswith("20200601T020000Z.arrow"):
+            raise KeyboardInterrupt()
+        return write_file(dbfuncts, path, *args)
+
+    monkeypatch.setattr(exportutils, "_write_file", interrupted_write_file)
+    with pytest.raises(KeyboardInterrupt):
+        export_history(sqlitefuncts, output_dir, START, END, export_format="arrow", blocks_per_file=2)
+    monkeypatch.undo()
+
+    assert export_history(sqlitefuncts, output_dir, START, END, export_format="arrow", blocks_per_file=2) == 240
+    with pyarrow.ipc.open_file(os.path.join(output_dir, "20200601T020000Z.arrow")) as reader:
+        assert reader.num_record_batches == 2
+        assert reader.read_all().num_rows == 240
+    with pytest.raises(ValueError):
+        export_history(sqlitefuncts, output_dir, START, END, topics=["topic1"], export_format="arrow",
+                       blocks_per_file=2)
+
+
+@pytest.fixture()
+def sqlitefuncts(tmp_path):
+    table_names = {"data_table": "data", "topics_table": "topics", "meta_table": "meta",
+                   "agg_topics_table": "aggregate_topics", "agg_meta_table": "aggregate_meta"}
+    client = SqlLiteFuncts({"database": str(tmp_path / "historian.sqlite")}, table_names)
+    client.setup_historian_tables()
+    topic1 = client.insert_topic("Topic1")
+    topic2 = client.insert_topic("topic2")
+    for minute in range(4 * 60):
+        ts = START + timedelta(minutes=minute)
+        client.insert_data(ts, topic1, minute % 60)
+        client.insert_data(ts, topic2, "off")
+    client.commit()
+    yield client
+    client.close()
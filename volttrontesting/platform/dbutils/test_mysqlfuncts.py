@@ -136,6 +136,39 @@ def test_insert_data_query_should_succeed(get_container_func):
     assert get_data_in_table(connection_port, "data") == expected_data
 
 
+def test_bulk_insert_should_succeed(get_container_func):
+    container, sqlfuncts, connection_port, historian_version = get_container_func
+    with sqlfuncts.bulk_insert() as insert_data:
+        for minute in range(10):
+            assert insert_data(f"2001-09-11 09:{minute:02}:00", 21, f"value{minute}") is True
+        # replaces the value inserted above
+        assert insert_data("2001-09-11 09:00:00", 21, "replaced") is True
+
+    rows = [row for row in get_data_in_table(connection_port, "data") if row[1] == 21]
+    assert len(rows) == 10
+    assert (datetime.datetime(2001, 9, 11, 9, 0), 21, '"replaced"') in rows
+    assert (datetime.datetime(2001, 9, 11, 9, 9), 21, '"value9"') in rows
+
+
+def test_bulk_insert_should_split_statements_at_max_packet_size(get_container_func):
+    container, sqlfuncts, connection_port, historian_version = get_container_func
+    max_packet_size = sqlfuncts.max_packet_size
+    # Room for the statement and about ten rows of this size per statement
+    sqlfuncts.max_packet_size = 3000
+    try:
+        records = [(f"2001-09-11 10:{minute:02}:00", 22, jsonapi.dumps("x" * 50)) for minute in range(30)]
+        statements = sqlfuncts.insert_rows(
+            f"INSERT INTO {DATA_TABLE} (ts, topic_id, value_string) VALUES ",
+            " ON DUPLICATE KEY UPDATE value_string=VALUES(value_string)",
+            records)
+    finally:
+        sqlfuncts.max_packet_size = max_packet_size
+
+    assert statements > 1
+    rows = [row for row in get_data_in_table(connection_port, "data") if row[1] == 22]
+    assert len(rows) == 30
+
+
 def test_insert_topic_query_should_succeed(get_container_func):
     container, sqlfuncts, connection_port, historian_version = get_container_func
     topic = "football"
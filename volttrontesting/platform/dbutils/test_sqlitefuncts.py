@@ -1,11 +1,14 @@
 import sqlite3
+from datetime import datetime, timedelta
 
 from gevent import subprocess
 import pytest
+import pytz
 import os
 
 from setuptools import glob
 
+from volttron.platform.agent import downsampling
 from volttron.platform.dbutils.sqlitefuncts import SqlLiteFuncts
 
 
@@ -77,6 +80,84 @@ def test_query(get_sqlitefuncts, topic_ids, id_name_map, expected_values):
     assert actual_results == expected_values
 
 
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+@pytest.mark.parametrize(
+    "skip, count, order, expected_minutes",
+    [
+        (0, None, "FIRST_TO_LAST", [0, 1, 2, 3]),
+        (1, 2, "FIRST_TO_LAST", [1, 2]),
+        (0, 1, "LAST_TO_FIRST", [3]),
+        (3, None, "LAST_TO_FIRST", [0]),
+    ],
+)
+def test_query_multiple_topics(get_sqlitefuncts, skip, count, order, expected_minutes):
+    sqlitefuncts, historain_version = get_sqlitefuncts
+    query_db("; ".join(f"INSERT OR REPLACE INTO data VALUES('2020-06-01 12:0{minute}:00',{topic_id},'{minute}')"
+                       for topic_id in (41, 43) for minute in range(4)))
+    id_name_map = {41: "topic41", 42: "topic42", 43: "topic43"}
+
+    actual_results = sqlitefuncts.query([41, 42, 43], id_name_map, skip=skip, count=count, order=order)
+
+    expected = [(f"2020-06-01T12:0{minute}:00.000000", minute) for minute in expected_minutes]
+    assert actual_results == {"topic41": expected, "topic42": [], "topic43": expected}
+
+
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+@pytest.mark.parametrize("order", ["FIRST_TO_LAST", "LAST_TO_FIRST"])
+@pytest.mark.parametrize("topics_per_query", [500, 1])
+def test_query_page(get_sqlitefuncts, order, topics_per_query, monkeypatch):
+    sqlitefuncts, historain_version = get_sqlitefuncts
+    # With one topic per statement, every page is merged from the pages of both topics
+    monkeypatch.setattr("volttron.platform.dbutils.sqlitefuncts.MAX_TOPICS_PER_QUERY", topics_per_query)
+    # Same timestamps for both topics so pages have to break between topics of one timestamp
+    query_db("; ".join(f"INSERT OR REPLACE INTO data VALUES('2020-06-01 12:0{minute}:00',{topic_id},'{minute}')"
+                       for topic_id in (41, 43) for minute in range(5)))
+    id_name_map = {41: "topic41", 43: "topic43"}
+
+    pages = []
+    after = None
+    while True:
+        values, after = sqlitefuncts.query_page([41, 43], id_name_map, after=after, count=3, order=order)
+        pages.append(values)
+        if after is None:
+            break
+
+    assert len(pages) == 4
+    assert [len(page["topic41"]) + len(page["topic43"]) for page in pages] == [3, 3, 3, 1]
+    expected = [(f"2020-06-01T12:0{minute}:00.000000", minute) for minute in range(5)]
+    if order == "LAST_TO_FIRST":
+        expected.reverse()
+    for name in id_name_map.values():
+        assert [row for page in pages for row in page[name]] == expected
+
+
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+@pytest.mark.parametrize("order", ["FIRST_TO_LAST", "LAST_TO_FIRST"])
+@pytest.mark.parametrize("topics_per_query", [500, 1])
+def test_query_minmax_matches_python_downsampling(get_sqlitefuncts, order, topics_per_query, monkeypatch):
+    sqlitefuncts, historain_version = get_sqlitefuncts
+    # With one topic per statement, both topics are still split into the same buckets
+    monkeypatch.setattr("volttron.platform.dbutils.sqlitefuncts.MAX_TOPICS_PER_QUERY", topics_per_query)
+    rows = [f"INSERT OR REPLACE INTO data VALUES('2020-06-01 {minute // 60:02}:{minute % 60:02}:00',41,"
+            f"'{(minute * 37) % 101 - 50}')" for minute in range(300)]
+    rows += [f"INSERT OR REPLACE INTO data VALUES('2020-06-01 00:0{minute}:30',43,'{minute}')" for minute in range(5)]
+    rows.append("INSERT OR REPLACE INTO data VALUES('2020-06-01 01:00:30',41,'\"text\"')")
+    query_db("; ".join(rows))
+    id_name_map = {41: "topic41", 43: "topic43"}
+    start = datetime(2020, 6, 1, tzinfo=pytz.UTC)
+    end = datetime(2020, 6, 1, 6, tzinfo=pytz.UTC)
+
+    for bounds in ((None, None), (start, end)):
+        values = sqlitefuncts.query_minmax([41, 43], id_name_map, *bounds, buckets=10, max_points=20, order=order)
+        raw = sqlitefuncts.query([41, 43], id_name_map, *bounds, order=order)
+        assert values == downsampling.downsample(raw, 20, "minmax", *bounds, order=order)
+        assert len(values["topic41"]) <= 20
+        assert values["topic43"] == raw["topic43"]
+
+
 @pytest.mark.sqlitefuncts
 @pytest.mark.dbutils
 @pytest.mark.parametrize(
@@ -106,6 +187,104 @@ def test_manage_db_size(get_sqlitefuncts, history_limit_timestamp, storage_limit
     assert get_all_data(DATA_TABLE) == expected_data
 
 
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+def test_partitioned_storage(sqlitefuncts_db_not_initialized):
+    legacy = sqlitefuncts_db_not_initialized
+    legacy.setup_historian_tables()
+    start = datetime(2020, 6, 1, tzinfo=pytz.UTC)
+    legacy.insert_data(start - timedelta(hours=1), 42, 1.0)
+    legacy.commit()
+
+    sqlitefuncts = SqlLiteFuncts(dict(CONNECT_PARAMS, partition_period="1d"), get_table_names())
+    sqlitefuncts.setup_historian_tables()
+    with sqlitefuncts.bulk_insert() as insert_data:
+        for hour in range(5 * 24):
+            insert_data(start + timedelta(hours=hour), 42, float(hour))
+    sqlitefuncts.commit()
+
+    assert len(get_all_data(DATA_TABLE)) == 1
+    assert sqlitefuncts.get_partitions() == ["data_2020060100", "data_2020060200", "data_2020060300",
+                                             "data_2020060400", "data_2020060500"]
+    assert len(get_all_data("data_2020060300")) == 24
+    assert sqlitefuncts.get_partitions(start + timedelta(hours=30), start + timedelta(hours=48)) == \
+        ["data_2020060200"]
+    # Readers find the partitions without being configured for them
+    assert legacy.is_partitioned()
+    values = legacy.query([42], {42: "topic"}, start - timedelta(hours=2), start + timedelta(hours=25))["topic"]
+    assert [value for ts, value in values] == [1.0] + [float(hour) for hour in range(25)]
+    assert legacy.collect_partial_aggregates([42], start + timedelta(hours=47), start + timedelta(hours=49)) == \
+        {42: (2, 95.0, 0.5, 47.0, 48.0)}
+
+    sqlitefuncts.manage_db_size(start + timedelta(hours=30), None)
+    assert sqlitefuncts.get_partitions() == ["data_2020060200", "data_2020060300", "data_2020060400",
+                                             "data_2020060500"]
+    assert "data_2020060100" not in get_tables()
+    assert get_all_data(DATA_TABLE) == []
+    assert len(get_all_data("data_2020060200")) == 18
+
+
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+def test_partitioned_storage_over_compound_select_limit(sqlitefuncts_db_not_initialized):
+    # SQLite allows at most 500 terms in a compound SELECT, so the partitions are read in batches
+    sqlitefuncts = SqlLiteFuncts(dict(CONNECT_PARAMS, partition_period="1h"), get_table_names())
+    sqlitefuncts.setup_historian_tables()
+    start = datetime(2020, 6, 1, tzinfo=pytz.UTC)
+    hours = 600
+    with sqlitefuncts.bulk_insert() as insert_data:
+        for hour in range(hours):
+            insert_data(start + timedelta(hours=hour), 42, float(hour))
+            insert_data(start + timedelta(hours=hour, minutes=30), 43, float(hour % 7))
+    sqlitefuncts.commit()
+    assert len(sqlitefuncts.get_partitions()) == hours
+    id_name_map = {42: "topic42", 43: "topic43"}
+
+    raw = sqlitefuncts.query([42, 43], id_name_map)
+    assert [value for ts, value in raw["topic42"]] == [float(hour) for hour in range(hours)]
+    values = sqlitefuncts.query([42, 43], id_name_map, skip=240, count=20, order="LAST_TO_FIRST")
+    assert [value for ts, value in values["topic42"]] == [float(hour) for hour in range(359, 339, -1)]
+
+    pages = []
+    after = None
+    while True:
+        values, after = sqlitefuncts.query_page([42, 43], id_name_map, after=after, count=250)
+        pages.append(values)
+        if after is None:
+            break
+    assert len(pages) == 5
+    for name in id_name_map.values():
+        assert [row for page in pages for row in page[name]] == raw[name]
+
+    values = sqlitefuncts.query_minmax([42, 43], id_name_map, buckets=50, max_points=100)
+    assert values == downsampling.downsample(raw, 100, "minmax")
+
+    assert sqlitefuncts.collect_aggregate([42], "avg") == (299.5, hours)
+    assert sqlitefuncts.collect_aggregate([42, 43], "count") == (2 * hours, 2 * hours)
+    partials = sqlitefuncts.collect_partial_aggregates([42, 43])
+    assert partials[42] == pytest.approx((hours, 179700.0, hours * (hours ** 2 - 1) / 12, 0.0, 599.0))
+    assert partials[43][0] == hours and partials[43][3:] == (0.0, 6.0)
+
+
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+def test_partitioned_storage_limit(sqlitefuncts_db_not_initialized):
+    sqlitefuncts = SqlLiteFuncts(dict(CONNECT_PARAMS, partition_period="1d"), get_table_names())
+    sqlitefuncts.setup_historian_tables()
+    start = datetime(2020, 6, 1, tzinfo=pytz.UTC)
+    with sqlitefuncts.bulk_insert() as insert_data:
+        for minute in range(0, 4 * 24 * 60, 30):
+            insert_data(start + timedelta(minutes=minute), 42, "x" * 1000)
+    sqlitefuncts.commit()
+    page_size = sqlitefuncts.select("PRAGMA page_size")[0][0]
+    pages = sqlitefuncts.select("PRAGMA page_count")[0][0]
+
+    sqlitefuncts.manage_db_size(None, pages * 0.6 * page_size / 1024 ** 3)
+
+    assert sqlitefuncts.get_partitions() == ["data_2020060300", "data_2020060400"]
+    assert len(get_all_data("data_2020060300")) == 48
+
+
 @pytest.mark.sqlitefuncts
 @pytest.mark.dbutils
 def test_insert_meta(get_sqlitefuncts):
@@ -144,6 +323,41 @@ def test_insert_data(get_sqlitefuncts):
     assert get_all_data(DATA_TABLE) == expected_data
 
 
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+def test_bulk_insert(get_sqlitefuncts):
+    sqlitefuncts, historain_version = get_sqlitefuncts
+    assert get_all_data(DATA_TABLE) == []
+
+    with sqlitefuncts.bulk_insert() as insert_data:
+        assert insert_data("2001-09-11 08:46:00", "11", "1wtc") is True
+        assert insert_data("2001-09-11 09:03:00", "12", 2) is True
+        assert insert_data("2001-09-11 08:46:00", "11", "replaced") is True
+        # nothing is written until the batch is complete
+        assert get_all_data(DATA_TABLE) == []
+    sqlitefuncts.commit()
+
+    assert sorted(get_all_data(DATA_TABLE)) == ['2001-09-11 08:46:00|11|"replaced"',
+                                                '2001-09-11 09:03:00|12|2']
+
+
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+def test_connection_pragmas(sqlitefuncts_db_not_initialized):
+    assert sqlitefuncts_db_not_initialized.select("PRAGMA journal_mode") == [("wal",)]
+    assert sqlitefuncts_db_not_initialized.select("PRAGMA synchronous") == [(1,)]
+
+    client = SqlLiteFuncts(dict(CONNECT_PARAMS, journal_mode="delete", synchronous="full", cache_size=-4096),
+                           None)
+    assert client.select("PRAGMA journal_mode") == [("delete",)]
+    assert client.select("PRAGMA synchronous") == [(2,)]
+    assert client.select("PRAGMA cache_size") == [(-4096,)]
+    client.close()
+
+    with pytest.raises(ValueError):
+        SqlLiteFuncts(dict(CONNECT_PARAMS, synchronous="sometimes"), None)
+
+
 @pytest.mark.sqlitefuncts
 @pytest.mark.dbutils
 def test_insert_topic(get_sqlitefuncts):
@@ -418,6 +632,51 @@ def test_collect_aggregate(get_sqlitefuncts):
     assert actual_aggregate == expected_aggregate
 
 
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+@pytest.mark.parametrize("topics_per_query", [500, 1])
+def test_collect_partial_aggregates(get_sqlitefuncts, topics_per_query, monkeypatch):
+    sqlitefuncts, historain_version = get_sqlitefuncts
+    monkeypatch.setattr("volttron.platform.dbutils.sqlitefuncts.MAX_TOPICS_PER_QUERY", topics_per_query)
+    query = (
+        "INSERT OR REPLACE INTO data values('2020-06-01T12:30:59.000000+00:00', 42, '2');"
+        "INSERT OR REPLACE INTO data values('2020-06-01T12:31:59.000000+00:00', 42, '10');"
+        "INSERT OR REPLACE INTO data values('2020-06-01T12:32:59.000000+00:00', 42, '-3.5');"
+        "INSERT OR REPLACE INTO data values('2020-06-01T12:31:59.000000+00:00', 43, '8');"
+        "INSERT OR REPLACE INTO data values('2020-06-01T12:30:59.000000+00:00', 45, '1000000001');"
+        "INSERT OR REPLACE INTO data values('2020-06-01T12:31:59.000000+00:00', 45, '1000000002');"
+        "INSERT OR REPLACE INTO data values('2020-06-01T12:32:59.000000+00:00', 45, '1000000004');"
+    )
+    query_db(query)
+    start = datetime(2020, 6, 1, 12, 31, tzinfo=pytz.UTC)
+
+    partials = sqlitefuncts.collect_partial_aggregates([42, 43, 44])
+    assert sorted(partials) == [42, 43]
+    assert partials[42] == pytest.approx((3, 8.5, 92.1666666666667, -3.5, 10.0))
+    assert partials[43] == (1, 8.0, 0.0, 8.0, 8.0)
+    assert sqlitefuncts.collect_partial_aggregates([42], start) == {42: (2, 6.5, 91.125, -3.5, 10.0)}
+    assert sqlitefuncts.collect_partial_aggregates([45])[45] == pytest.approx((3, 3000000007.0, 42 / 9, 1000000001.0,
+                                                                               1000000004.0))
+    assert sqlitefuncts.collect_partial_aggregates([42, 43], start, datetime(2020, 6, 1, 12, 32, tzinfo=pytz.UTC),
+                                                   count_only=True) == {42: (1, 10.0, None, None, None),
+                                                                        43: (1, 8.0, None, None, None)}
+
+
+@pytest.mark.sqlitefuncts
+@pytest.mark.dbutils
+def test_get_last_aggregate_time(get_sqlitefuncts):
+    sqlitefuncts, historain_version = get_sqlitefuncts
+    sqlitefuncts.create_aggregate_store("avg", "1h")
+    assert sqlitefuncts.get_last_aggregate_time("avg", "1h", 7) is None
+
+    for hour in (3, 1, 2):
+        sqlitefuncts.insert_aggregate(7, "avg", "1h", datetime(2020, 6, 1, hour, tzinfo=pytz.UTC), 1.0, [42])
+    sqlitefuncts.insert_aggregate(8, "avg", "1h", datetime(2020, 6, 1, 4, tzinfo=pytz.UTC), 1.0, [43])
+    sqlitefuncts.commit()
+
+    assert sqlitefuncts.get_last_aggregate_time("avg", "1h", 7) == datetime(2020, 6, 1, 3, tzinfo=pytz.UTC)
+
+
 def get_indexes(table):
     res = query_db(f"""PRAGMA index_list({table})""")
     return res.splitlines()
@@ -446,17 +705,20 @@ def query_db(query):
     return output.stdout
 
 
-@pytest.fixture()
-def sqlitefuncts_db_not_initialized():
-    global CONNECT_PARAMS
-    table_names = {
+def get_table_names():
+    return {
         "data_table": DATA_TABLE,
         "topics_table": TOPICS_TABLE,
         "meta_table": META_TABLE,
         "agg_topics_table": AGG_TOPICS_TABLE,
         "agg_meta_table": AGG_META_TABLE,
     }
-    client = SqlLiteFuncts(CONNECT_PARAMS, table_names)
+
+
+@pytest.fixture()
+def sqlitefuncts_db_not_initialized():
+    global CONNECT_PARAMS
+    client = SqlLiteFuncts(CONNECT_PARAMS, get_table_names())
     yield client
 
     # Teardown
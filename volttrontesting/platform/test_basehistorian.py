@@ -1,13 +1,15 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import os
 import pytest
+import pytz
 import mock
 
 from volttron.platform.agent import utils
 from volttron.platform.messaging import headers as header_mod
 from volttron.platform.vip.agent import Agent
-from volttron.platform.agent.base_historian import BaseHistorianAgent, BaseQueryHistorianAgent, BackupDatabase
+from volttron.platform.agent.base_historian import BaseHistorianAgent, BaseQueryHistorianAgent, BackupDatabase, \
+    QueryCache
 from volttron.platform.vip.agent.results import AsyncResult
 # need import so that we can mock it.
 from volttron.platform.vip.agent.subsystems.query import Query
@@ -36,6 +38,12 @@ class QueryHelper:
 BaseHistorianAgent.__bases__ = (AgentMock.imitate(Agent, Agent()),)
 
 
+@pytest.fixture(autouse=True)
+def working_dir(tmp_path, monkeypatch):
+    # Historians create their backup.sqlite cache in the working directory
+    monkeypatch.chdir(tmp_path)
+
+
 class ConcreteHistorianAgent(BaseHistorianAgent):
     def __init__(self, **kwargs):
         super(ConcreteHistorianAgent, self).__init__(**kwargs)
@@ -130,3 +138,195 @@ def test_cache_enable():
         # give a small amount of time so that the queue can get empty
         assert agent.has_published_items()
         assert len(agent.get_publish_list()) == 2
+
+
+class PagedQueryHistorian(BaseQueryHistorianAgent):
+    def __init__(self, rows):
+        # rows of (ts, topic, value) in key order
+        self.rows = rows
+        self.calls = []
+
+    def query_historian_page(self, topics, start, end, page_size, after, order):
+        self.calls.append(after)
+        rows = [row for row in self.rows if after is None or [row[0], row[1]] > after][:page_size]
+        values = {topic: [(ts, value) for ts, row_topic, value in rows if row_topic == topic] for topic in topics}
+        last = [rows[-1][0], rows[-1][1]] if len(rows) == page_size else None
+        return values, last
+
+
+def test_query_paged_continues_with_token():
+    rows = [(f"2020-01-01T00:0{minute}:00", topic, minute) for minute in range(5) for topic in ("a", "b")]
+    historian = PagedQueryHistorian(rows)
+
+    pages = []
+    token = None
+    while True:
+        page = historian.query_paged(["a", "b"], page_size=4, token=token)
+        pages.append(page["values"])
+        token = page["next"]
+        if token is None:
+            break
+
+    assert len(pages) == 3
+    assert historian.calls == [None, ["2020-01-01T00:01:00", "b"], ["2020-01-01T00:03:00", "b"]]
+    assert [value for page in pages for _, value in page["a"]] == [0, 1, 2, 3, 4]
+
+    with pytest.raises(ValueError):
+        historian.query_paged("a", token="not a token")
+    with pytest.raises(ValueError):
+        historian.query_paged("a", page_size=0)
+
+
+class MemoryQueryHistorian(BaseQueryHistorianAgent):
+    def __init__(self, rows, **kwargs):
+        # rows of (datetime, topic, value)
+        self.rows = rows
+        self.calls = []
+        self._query_cache = QueryCache(10, **kwargs)
+
+    def query_historian(self, topic, start=None, end=None, agg_type=None, agg_period=None, skip=0, count=None,
+                        order="FIRST_TO_LAST"):
+        self.calls.append((start, end))
+        topics = [topic] if isinstance(topic, str) else topic
+        values = {}
+        for name in topics:
+            rows = sorted(row for row in self.rows if row[1] == name and (start is None or row[0] >= start) and
+                          (end is None or row[0] < end))
+            if order == "LAST_TO_FIRST":
+                rows.reverse()
+            values[name] = [(utils.format_timestamp(ts), value) for ts, _, value in rows][skip:][:count]
+        if len(topics) == 1:
+            values = values[topics[0]]
+            return {'values': values, 'metadata': {'units': 'F'}} if values else {}
+        return {'values': values, 'metadata': {}}
+
+
+def _uncached(historian, *args, **kwargs):
+    cache, historian._query_cache = historian._query_cache, None
+    try:
+        return historian.query(*args, **kwargs)
+    finally:
+        historian._query_cache = cache
+
+
+@pytest.mark.parametrize("order", ["FIRST_TO_LAST", "LAST_TO_FIRST"])
+def test_query_cache_reads_only_open_tail(order):
+    now = utils.get_aware_utc_now()
+    rows = [(now - timedelta(minutes=minute), topic, minute) for minute in range(60) for topic in ("a", "b")]
+    historian = MemoryQueryHistorian(rows)
+    start = utils.format_timestamp(now - timedelta(minutes=30))
+    end = utils.format_timestamp(now)
+
+    for topic in ("a", ["a", "b"]):
+        for count in (5, 100):
+            expected = _uncached(historian, topic, start, end, count=count, order=order)
+            assert historian.query(topic, start, end, count=count, order=order) == expected
+
+    historian.calls.clear()
+    rows.append((now + timedelta(seconds=1), "a", -1))
+    end = utils.format_timestamp(now + timedelta(minutes=1))
+    expected = _uncached(historian, "a", start, end, count=100, order=order)
+    historian.calls.clear()
+    assert historian.query("a", start, end, count=100, order=order) == expected
+    # Only the range after the cached, closed part is read
+    assert len(historian.calls) == 1
+    assert historian.calls[0][0] >= now - timedelta(seconds=61)
+
+
+def test_query_cache_invalidated_by_late_data():
+    now = utils.get_aware_utc_now()
+    rows = [(now - timedelta(minutes=minute), "a", minute) for minute in range(60)]
+    historian = MemoryQueryHistorian(rows)
+    start = utils.format_timestamp(now - timedelta(hours=1))
+    end = utils.format_timestamp(now)
+
+    before = historian.query("a", start, end, count=100)
+    late = (now - timedelta(minutes=30, seconds=30), "a", "late")
+    rows.append(late)
+    assert historian.query("a", start, end, count=100) == before
+
+    historian._query_cache.invalidate([("A", late[0])])
+    after = historian.query("a", start, end, count=100)
+    assert after == _uncached(historian, "a", start, end, count=100)
+    assert (utils.format_timestamp(late[0]), "late") in after["values"]
+
+
+def test_query_cache_remembers_ranges_over_limit():
+    now = utils.get_aware_utc_now()
+    rows = [(now - timedelta(minutes=minute), "a", minute) for minute in range(60)]
+    historian = MemoryQueryHistorian(rows, max_values=10)
+    start = utils.format_timestamp(now - timedelta(hours=1))
+    end = utils.format_timestamp(now)
+    expected = _uncached(historian, "a", start, end, count=5)
+
+    historian.calls.clear()
+    assert historian.query("a", start, end, count=5) == expected
+    # The load for caching and the query itself
+    assert len(historian.calls) == 2
+    historian.calls.clear()
+    assert historian.query("a", start, end, count=5) == expected
+    assert len(historian.calls) == 1
+
+    # A range that starts later may fit.
+    later = utils.format_timestamp(now - timedelta(minutes=5))
+    assert historian.query("a", later, end, count=5) == _uncached(historian, "a", later, end, count=5)
+    assert ("a",) in historian._query_cache._entries
+
+
+def test_query_cache_expires_values_past_retention():
+    now = utils.get_aware_utc_now()
+    rows = [(now - timedelta(minutes=minute), "a", minute) for minute in range(60)]
+    historian = MemoryQueryHistorian(rows)
+    start = utils.format_timestamp(now - timedelta(hours=1))
+    end = utils.format_timestamp(now)
+    historian.query("a", start, end, count=100)
+
+    cutoff = now - timedelta(minutes=30)
+    rows[:] = [row for row in rows if row[0] >= cutoff]
+    historian._query_cache.expire(cutoff)
+    assert historian.query("a", start, end, count=100) == _uncached(historian, "a", start, end, count=100)
+    historian._query_cache.expire(now)
+    assert not historian._query_cache._entries
+
+
+def test_query_cache_not_used_for_skip_aggregates_or_open_start():
+    start = datetime(2020, 1, 1)
+    assert QueryCache.is_cacheable(start, None, None, 0, 10)
+    assert not QueryCache.is_cacheable(None, None, None, 0, 10)
+    assert not QueryCache.is_cacheable(start, None, None, 0, None)
+    assert not QueryCache.is_cacheable(start, None, None, 5, 10)
+    assert not QueryCache.is_cacheable(start, None, "avg", 0, 10)
+    assert not QueryCache.is_cacheable(start, start, None, 0, 10)
+
+
+@pytest.mark.parametrize("method", ["minmax", "lttb"])
+def test_query_downsampled(method):
+    start = datetime(2020, 1, 1, tzinfo=pytz.UTC)
+    rows = [(start + timedelta(minutes=minute), topic, (minute * 37) % 101) for minute in range(1000)
+            for topic in ("a", "b")]
+    rows += [(start + timedelta(minutes=minute), "c", minute) for minute in range(10)]
+    historian = MemoryQueryHistorian(rows)
+
+    result = historian.query(["a", "b", "c"], utils.format_timestamp(start), max_points=50,
+                             downsample_method=method)
+    raw = _uncached(historian, ["a", "b", "c"], utils.format_timestamp(start))
+    for name in ("a", "b"):
+        values = result["values"][name]
+        assert 2 < len(values) <= 50
+        assert values == sorted(values)
+        assert set(values) <= set(raw["values"][name])
+    assert result["values"]["c"] == raw["values"]["c"]
+
+    if method == "lttb":
+        values = result["values"]["a"]
+        assert len(values) == 50
+        assert values[0] == raw["values"]["a"][0] and values[-1] == raw["values"]["a"][-1]
+    else:
+        # Every spike is kept
+        assert max(value for _, value in result["values"]["a"]) == 100
+        assert min(value for _, value in result["values"]["a"]) == 0
+
+    with pytest.raises(ValueError):
+        historian.query("a", max_points=1)
+    with pytest.raises(ValueError):
+        historian.query("a", max_points=10, downsample_method="average")
@@ -0,0 +1,92 @@
+import logging
+from unittest import mock
+
+from volttron.platform import jsonapi
+from volttron.platform.agent import utils
+from volttron.platform.agent.utils import FastJsonFormatter, HotPathLogger
+
+
+class _Records(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _logger(name, level=logging.DEBUG):
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.propagate = False
+    handler = _Records()
+    logger.handlers = [handler]
+    return logger, handler
+
+
+def test_disabled_level_does_not_format_arguments():
+    logger, handler = _logger('test.hotpath.disabled', logging.INFO)
+    frames = mock.MagicMock()
+    HotPathLogger(logger).debug('frames %s', frames)
+    assert handler.records == []
+    frames.__str__.assert_not_called()
+
+
+def test_record_is_attributed_to_caller():
+    logger, handler = _logger('test.hotpath.caller')
+    HotPathLogger(logger).debug('frames %s', 3)
+    assert handler.records[0].getMessage() == 'frames 3'
+    # The record is attributed to the caller, not to HotPathLogger.
+    assert handler.records[0].funcName == 'test_record_is_attributed_to_caller'
+
+
+def test_sampling_reports_suppressed_records():
+    logger, handler = _logger('test.hotpath.sampled')
+    hot_log = HotPathLogger(logger, sample_every=3)
+    for i in range(7):
+        hot_log.debug('message %d', i)
+    messages = [r.getMessage() for r in handler.records]
+    assert messages == ['message 0',
+                        'message 3 (2 similar messages suppressed)',
+                        'message 6 (2 similar messages suppressed)']
+
+
+def test_rate_limit():
+    logger, handler = _logger('test.hotpath.rate')
+    hot_log = HotPathLogger(logger, max_per_second=2)
+    with mock.patch('volttron.platform.agent.utils.time.monotonic', return_value=10.0):
+        for i in range(5):
+            hot_log.info('message %d', i)
+    with mock.patch('volttron.platform.agent.utils.time.monotonic', return_value=11.5):
+        hot_log.info('later')
+    messages = [r.getMessage() for r in handler.records]
+    assert messages == ['message 0', 'message 1', 'later (3 similar messages suppressed)']
+
+
+def test_fast_json_formatter_round_trip():
+    record = logging.LogRecord('agent.module', logging.WARNING, '/tmp/module.py', 42,
+                               'value %s', ('x',), None, func='handler')
+    record.remote_name = 'platform.driver'
+    obj = jsonapi.loads(FastJsonFormatter().format(record))
+    assert obj['msg'] == 'value x'
+    assert obj['remote_name'] == 'platform.driver'
+    assert 'args' not in obj
+    rebuilt = logging.makeLogRecord(obj)
+    assert rebuilt.getMessage() == 'value x'
+    assert (rebuilt.name, rebuilt.levelno, rebuilt.lineno, rebuilt.funcName) == \
+        ('agent.module', logging.WARNING, 42, 'handler')
+
+
+def test_configure_hot_path_loggers(monkeypatch):
+    monkeypatch.setattr(utils, '_hot_path_loggers', {})
+    monkeypatch.setattr(utils, '_hot_path_settings', dict(sample_every=1, max_per_second=None))
+    monkeypatch.setenv('HOT_LOG_SAMPLE_EVERY', '1')
+    monkeypatch.setenv('HOT_LOG_MAX_PER_SECOND', '')
+    existing = utils.get_hot_path_logger('test.hotpath.existing')
+    utils.configure_hot_path_loggers(10, 5)
+    created = utils.get_hot_path_logger('test.hotpath.created')
+    for hot_log in (existing, created):
+        assert (hot_log.sample_every, hot_log.max_per_second) == (10, 5)
+    # Agents started by the platform pick the sampling up from the environment.
+    assert utils._hot_path_settings_from_env() == dict(sample_every=10, max_per_second=5)
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from volttron.platform.vip.sharedmemory import (OverwrittenError, SharedMemoryReader,
+                                                SharedMemoryRing, remove_stale_rings)
+
+
+@pytest.fixture
+def ring():
+    ring = SharedMemoryRing('volttron-test-{}'.format(os.getpid()), size=64)
+    reader = SharedMemoryReader()
+    yield ring, reader
+    reader.close()
+    ring.close()
+
+
+def test_read_returns_written_payload(ring):
+    ring, reader = ring
+    first = ring.write(b'first')
+    second = ring.write(b'second')
+    assert reader.read(first) == b'first'
+    assert reader.read(second) == b'second'
+
+
+def test_wrapped_record_is_reported_overwritten(ring):
+    ring, reader = ring
+    old = ring.write(b'x' * 30)
+    new = ring.write(b'y' * 30)
+    assert new['offset'] == 0
+    assert reader.read(new) == b'y' * 30
+    with pytest.raises(OverwrittenError):
+        reader.read(old)
+
+
+def test_oversized_payload_is_rejected(ring):
+    ring, reader = ring
+    with pytest.raises(ValueError):
+        ring.write(b'z' * 64)
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='needs /dev/shm')
+def test_stale_rings_are_removed(ring):
+    ring, reader = ring
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    stale = 'volttron-test-{}'.format(exited.pid)
+    open(os.path.join('/dev/shm', stale), 'wb').close()
+
+    assert stale in remove_stale_rings()
+    assert not os.path.exists(os.path.join('/dev/shm', stale))
+    # The ring of this process is still in use.
+    assert os.path.exists(os.path.join('/dev/shm', ring.name))
@@ -0,0 +1,31 @@
+import sys
+
+from volttron.platform.agent.startuptrace import StartupTrace, measure
+
+
+def test_trace_records_imports_and_subsystems(tmp_path, monkeypatch):
+    (tmp_path / 'trace_sample_module.py').write_text('VALUE = 1\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    trace = StartupTrace('agent')
+    trace.start()
+    try:
+        import trace_sample_module
+        with measure('subsystem', 'pubsub'):
+            pass
+        trace.phase('started')
+    finally:
+        trace.stop()
+        sys.modules.pop('trace_sample_module', None)
+
+    assert trace_sample_module.VALUE == 1
+    names = [(kind, name) for kind, name, _ in trace.timings]
+    assert ('import', 'trace_sample_module') in names
+    assert ('subsystem', 'pubsub') in names
+    report = trace.report()
+    assert 'trace_sample_module' in report and 'started' in report
+
+    # Nothing is recorded once the trace is stopped
+    with measure('subsystem', 'rpc'):
+        pass
+    assert ('subsystem', 'rpc') not in [(kind, name) for kind, name, _ in trace.timings]
@@ -1,5 +1,11 @@
+import math
+import re
+import statistics
+from unittest import mock
+
 import pytz
-from volttron.platform.agent.base_aggregate_historian import AggregateHistorian
+from volttron.platform.agent import base_aggregate_historian
+from volttron.platform.agent.base_aggregate_historian import AggregateHistorian, PartialAggregate
 import pytest
 from datetime import datetime, timedelta
 
@@ -191,3 +197,243 @@ def test_compute_next_collection_time():
     assert next2 == datetime.strptime(
         '2016-04-30T01:15:23.123456',
         '%Y-%m-%dT%H:%M:%S.%f').replace(tzinfo=pytz.utc)
+
+
+@pytest.mark.aggregator
+@pytest.mark.parametrize("agg_type, function", [
+    ('avg', statistics.mean),
+    ('sum', sum),
+    ('count', len),
+    ('min', min),
+    ('max', max),
+    ('stddev_pop', statistics.pstdev),
+    ('stddev_samp', statistics.stdev),
+    ('var_pop', statistics.pvariance),
+    ('var_samp', statistics.variance)
+])
+def test_partial_aggregate_value(agg_type, function):
+    values = [3.5, -1.0, 7.25, 0.0, 2.0, 11.5, 4.0]
+    merged = PartialAggregate()
+    for part in (values[:2], values[2:3], [], values[3:]):
+        if part:
+            merged.merge(_partial(part))
+        else:
+            merged.merge(None)
+    assert math.isclose(merged.value(agg_type), function(values), abs_tol=1e-9)
+    assert PartialAggregate().value(agg_type) == (0 if agg_type == 'count' else None)
+    assert PartialAggregate().value('total') == 0.0
+
+
+@pytest.mark.aggregator
+@pytest.mark.parametrize("agg_type, function", [
+    ('avg', statistics.mean),
+    ('stddev_pop', statistics.pstdev),
+    ('stddev_samp', statistics.stdev),
+    ('var_pop', statistics.pvariance),
+    ('var_samp', statistics.variance)
+])
+def test_partial_aggregate_value_with_large_offset(agg_type, function):
+    values = [1e9 + v for v in (3.5, -1.0, 7.25, 0.0, 2.0, 11.5, 4.0, 0.25)]
+    merged = PartialAggregate()
+    for part in (values[:3], values[3:4], values[4:]):
+        merged.merge(_partial(part))
+    assert math.isclose(merged.value(agg_type), function(values), rel_tol=1e-9)
+
+
+def _partial(values):
+    mean = statistics.mean(values)
+    return PartialAggregate(len(values), sum(values), sum((v - mean) ** 2 for v in values), min(values), max(values))
+
+
+class MemoryAggregateHistorian(AggregateHistorian):
+    """
+    Aggregate historian over in memory raw data that runs scheduled calls
+    when the test advances the clock.
+    """
+
+    def __init__(self, now, **config):
+        self.now = now
+        self.data = []
+        self.aggregates = {}
+        self.scheduled = []
+        self.partial_queries = []
+        self.full_queries = []
+        self.topic_id_map = {'campus/building/device/point1': 1,
+                             'campus/building/device/point2': 2,
+                             'other/point3': 3}
+        self.agg_topic_id_map = {}
+        self.incremental_interval = config.get('incremental_interval', 300)
+        self.late_data_periods = config.get('late_data_periods', 1)
+        self.max_backfill_periods = config.get('max_backfill_periods', 100)
+        self.backfill_chunk_size = config.get('backfill_chunk_size', 10)
+        self._aggregation_generation = 1
+        self.vip = mock.Mock()
+        self.vip.rpc.call.side_effect = lambda identity, method, topic_pattern: mock.Mock(get=lambda: {
+            name: topic_id for name, topic_id in self.topic_id_map.items() if re.search(topic_pattern, name)})
+        historian = self
+
+        class Core(object):
+            def schedule(self, deadline, method, *args):
+                historian.scheduled.append((deadline, method, args))
+
+        self.core = Core()
+
+    def advance(self, now):
+        self.now = now
+        while True:
+            due = [call for call in self.scheduled if call[0] <= now]
+            if not due:
+                return
+            call = min(due, key=lambda c: c[0])
+            self.scheduled.remove(call)
+            call[1](*call[2])
+
+    def _rows(self, topic_ids, start_time, end_time):
+        return [(ts, topic_id, value) for ts, topic_id, value in self.data
+                if topic_id in topic_ids and (start_time is None or ts >= start_time) and
+                (end_time is None or ts < end_time)]
+
+    def get_topic_map(self):
+        return dict(self.topic_id_map), {}
+
+    def get_agg_topic_map(self):
+        return self.agg_topic_id_map
+
+    def initialize_aggregate_store(self, aggregation_topic_name, agg_type, agg_time_period, topics_meta):
+        agg_id = 100 + len(self.agg_topic_id_map)
+        self.agg_topic_id_map[(aggregation_topic_name.lower(), agg_type.lower(), agg_time_period)] = agg_id
+        return agg_id
+
+    def update_aggregate_metadata(self, agg_id, aggregation_topic_name, topic_meta):
+        pass
+
+    def collect_aggregate(self, topic_ids, agg_type, start_time, end_time):
+        self.full_queries.append((agg_type, start_time, end_time))
+        values = [value for ts, topic_id, value in self._rows(topic_ids, start_time, end_time)]
+        if not values:
+            return None, 0
+        return {'avg': statistics.mean, 'max': max, 'median': statistics.median}[agg_type](values), len(values)
+
+    def collect_partial_aggregates(self, topic_ids, start_time, end_time, count_only=False):
+        self.partial_queries.append((tuple(topic_ids), start_time, end_time, count_only))
+        partials = {}
+        for ts, topic_id, value in self._rows(topic_ids, start_time, end_time):
+            partial = PartialAggregate(1, value, 0.0, value, value)
+            partials.setdefault(topic_id, PartialAggregate()).merge(partial)
+        return {topic_id: (p.count, p.total, None, None, None) if count_only else
+                (p.count, p.total, p.m2, p.minimum, p.maximum) for topic_id, p in partials.items()}
+
+    def get_last_aggregate_time(self, agg_type, agg_time_period, agg_topic_id):
+        times = [end_time for (agg_id, end_time) in self.aggregates if agg_id == agg_topic_id]
+        return max(times) if times else None
+
+    def insert_aggregate(self, agg_topic_id, agg_type, agg_time_period, end_time, value, topic_ids):
+        self.aggregates[(agg_topic_id, end_time)] = value
+
+    def get_aggregation_list(self):
+        return ['AVG', 'MAX', 'MEDIAN']
+
+
+def points(historian):
+    points = [{'topic_names': ['campus/building/device/point1'], 'aggregation_type': 'avg'},
+              {'topic_name_pattern': 'campus/building/device/', 'aggregation_type': 'max',
+               'aggregation_topic_name': 'campus/building/max'},
+              {'topic_names': ['other/point3'], 'aggregation_type': 'median', 'min_count': 2}]
+    historian._init_agg_group({'aggregation_period': '1h', 'points': points}, '1h')
+    return points
+
+
+@pytest.fixture()
+def aggregation_clock(monkeypatch):
+    historian = MemoryAggregateHistorian(datetime(2020, 6, 1, 10, 0, tzinfo=pytz.utc))
+    monkeypatch.setattr(base_aggregate_historian.utils, 'get_aware_utc_now', lambda: historian.now)
+    return historian
+
+
+def hour(h, minute=0):
+    return datetime(2020, 6, 1, h, minute, tzinfo=pytz.utc)
+
+
+@pytest.mark.aggregator
+def test_incremental_aggregation(aggregation_clock):
+    historian = aggregation_clock
+    group = points(historian)
+    avg_id, max_id, median_id = [historian._get_agg_topic_id(data, '1h') for data in group]
+    historian.data = [(hour(9, 10), 1, 1.0), (hour(9, 20), 2, 5.0), (hour(9, 30), 3, 2.0), (hour(9, 40), 3, 4.0)]
+
+    historian.start_incremental_aggregation(hour(10), '1h', False, group)
+    historian.advance(hour(10))
+    assert historian.aggregates == {(avg_id, hour(10)): 1.0, (max_id, hour(10)): 5.0, (median_id, hour(10)): 3.0}
+
+    # Raw data for the open period is read as it comes, a few minutes at a time
+    for minute in range(0, 60, 5):
+        historian.data.append((hour(10, minute), 1, float(minute)))
+        historian.data.append((hour(10, minute), 3, float(minute)))
+        historian.advance(hour(10, minute + 1))
+    reads = [query for query in historian.partial_queries if not query[3] and query[1] >= hour(10)]
+    assert len(reads) == 11
+    assert reads[0][1] == hour(10)
+    assert all(previous[2] == read[1] for previous, read in zip(reads, reads[1:]))
+    assert all(end - start <= timedelta(minutes=6) for topics, start, end, count_only in reads)
+    # A topic matching the pattern appears and a row of the previous period arrives late
+    historian.topic_id_map['campus/building/device/point4'] = 4
+    historian.data.append((hour(10, 30), 4, 99.0))
+    historian.data.append((hour(9, 50), 1, 3.0))
+    historian.advance(hour(11))
+
+    assert historian.aggregates[(avg_id, hour(11))] == 27.5
+    assert historian.aggregates[(max_id, hour(11))] == 99.0
+    assert historian.aggregates[(median_id, hour(11))] == 27.5
+    assert historian.aggregates[(avg_id, hour(10))] == 2.0
+    assert historian.aggregates[(max_id, hour(10))] == 5.0
+    # Only the point with the median needs all the raw data of the period
+    assert [start for agg_type, start, end in historian.full_queries] == [hour(9), hour(10)]
+
+
+@pytest.mark.aggregator
+def test_incremental_aggregation_records_overwritten_data_again(aggregation_clock):
+    historian = aggregation_clock
+    group = [{'topic_names': ['campus/building/device/point1'], 'aggregation_type': 'avg'}]
+    historian._init_agg_group({'aggregation_period': '1h', 'points': group}, '1h')
+    avg_id = historian._get_agg_topic_id(group[0], '1h')
+    historian.data = [(hour(10, 10), 1, 1.0), (hour(10, 20), 1, 3.0)]
+
+    historian.start_incremental_aggregation(hour(11), '1h', False, group)
+    historian.advance(hour(11))
+    assert historian.aggregates[(avg_id, hour(11))] == 2.0
+    # A row of the closed period is replaced, which leaves the count unchanged
+    historian.data[1] = (hour(10, 20), 1, 7.0)
+    historian.advance(hour(12))
+    assert historian.aggregates[(avg_id, hour(11))] == 4.0
+
+
+@pytest.mark.aggregator
+def test_incremental_aggregation_backfills_in_chunks(aggregation_clock):
+    historian = aggregation_clock
+    group = [{'topic_names': ['campus/building/device/point1'], 'aggregation_type': 'avg'}]
+    historian._init_agg_group({'aggregation_period': '1h', 'points': group}, '1h')
+    avg_id = historian._get_agg_topic_id(group[0], '1h')
+    historian.backfill_chunk_size = 2
+    historian.max_backfill_periods = 4
+    historian.aggregates[(avg_id, hour(2))] = 0.0
+    historian.data = [(hour(h, 30), 1, float(h)) for h in range(10)]
+
+    historian.start_incremental_aggregation(hour(10), '1h', False, group)
+    # Periods ending at 3, 4 and 5 are beyond max_backfill_periods
+    assert sorted(historian.aggregates) == [(avg_id, hour(2)), (avg_id, hour(6)), (avg_id, hour(7))]
+    historian.advance(hour(10))
+    assert sorted(historian.aggregates) == [(avg_id, hour(h)) for h in (2, 6, 7, 8, 9, 10)]
+    assert historian.aggregates[(avg_id, hour(10))] == 9.0
+
+
+@pytest.mark.aggregator
+def test_incremental_aggregation_stops_on_configuration_change(aggregation_clock):
+    historian = aggregation_clock
+    group = [{'topic_names': ['campus/building/device/point1'], 'aggregation_type': 'avg'}]
+    historian._init_agg_group({'aggregation_period': '1h', 'points': group}, '1h')
+    historian.start_incremental_aggregation(hour(10), '1h', False, group)
+    historian.advance(hour(10, 30))
+    assert historian.scheduled
+    historian._aggregation_generation += 1
+    historian.advance(hour(12))
+    assert not historian.scheduled
@@ -0,0 +1,79 @@
+from collections import defaultdict
+from unittest import mock
+
+from volttron.platform.messaging.health import STATUS_BAD, STATUS_GOOD, STATUS_UNKNOWN
+from volttron.platform.vip.healthservice import HealthService
+
+
+def _service():
+    service = HealthService.__new__(HealthService)
+    service._health_dict = defaultdict(dict)
+    service.core = mock.Mock()
+    service.vip = mock.Mock()
+    # Run spawned work inline.
+    service.core.spawn.side_effect = lambda fn, *args, **kwargs: fn(*args, **kwargs)
+    return service
+
+
+def _published(service):
+    return [c[1]['message'] for c in service.vip.pubsub.publish.call_args_list]
+
+
+def test_only_transitions_are_published():
+    service = _service()
+    service.vip.rpc.call.return_value.get.return_value = dict(status=STATUS_GOOD, context='ok',
+                                                              last_updated='t0')
+    service.peer_added('agent')
+    for _ in range(3):
+        service._heartbeat_updates('pubsub', 'agent', '', 'heartbeat/agent', {}, STATUS_GOOD)
+
+    published = _published(service)
+    assert len(published) == 1
+    assert published[0]['previous'] is None
+    assert published[0]['status'] == STATUS_GOOD
+    assert published[0]['context'] == 'ok'
+    assert service.vip.pubsub.publish.call_args[0][1] == 'platform/health/status/agent'
+    assert service.vip.rpc.call.call_count == 1
+
+    service.vip.rpc.call.return_value.get.return_value = dict(status=STATUS_BAD, context='broken',
+                                                              last_updated='t1')
+    service._heartbeat_updates('pubsub', 'agent', '', 'heartbeat/agent', {}, STATUS_BAD)
+    published = _published(service)
+    assert len(published) == 2
+    assert (published[1]['previous'], published[1]['status']) == (STATUS_GOOD, STATUS_BAD)
+
+
+def test_get_agent_statuses_from_table():
+    service = _service()
+    service.vip.rpc.call.return_value.get.return_value = dict(status=STATUS_GOOD, context='ok',
+                                                              last_updated='t0')
+    service.peer_added('agent')
+    service.peer_added('quiet')
+    service._heartbeat_updates('pubsub', 'agent', '', 'heartbeat/agent', {}, STATUS_GOOD)
+
+    statuses = service.get_agent_statuses()
+    assert list(statuses) == ['agent']
+    assert statuses['agent']['status'] == STATUS_GOOD
+    assert statuses['agent']['context'] == 'ok'
+    assert 'last_heartbeat' in statuses['agent']
+
+    # A newer status than the fetched one is reported without the stale context.
+    service._health_dict['agent']['message'] = STATUS_BAD
+    assert service.get_agent_statuses()['agent']['context'] is None
+
+
+def test_dropped_peer_transitions_to_unknown():
+    service = _service()
+    service.vip.rpc.call.return_value.get.return_value = dict(status=STATUS_GOOD, context=None,
+                                                              last_updated='t0')
+    service.peer_added('agent')
+    service._heartbeat_updates('pubsub', 'agent', '', 'heartbeat/agent', {}, STATUS_GOOD)
+    service.peer_dropped('agent')
+
+    published = _published(service)
+    assert (published[-1]['previous'], published[-1]['status']) == (STATUS_GOOD, STATUS_UNKNOWN)
+    assert 'agent' not in service.get_agent_statuses()
+    # Peers that never reported a status are dropped quietly.
+    service.peer_added('quiet')
+    service.peer_dropped('quiet')
+    assert len(_published(service)) == 2
@@ -1,5 +1,6 @@
 from volttron.platform.vip.pubsubservice import PubSubService, ProtectedPubSubTopics
 from mock import Mock, MagicMock
+import os
 import pytest
 
 
@@ -53,3 +54,157 @@ def test_returns_empty_list_when_subsystem_not_specified(pubsub_service):
     frames[6] = "not_pubsub"
     result = service.handle_subsystem(frames)
     assert [] == result
+
+
+def _subscribe_frames(peer, prefix, conflate=None, content_filter=None):
+    return [peer, '', 'VIP1', '', '1', 'pubsub', 'subscribe',
+            dict(prefix=prefix, bus='', all_platforms=False, conflate=conflate, filter=content_filter)]
+
+
+def _publish_frames(peer, topic, message):
+    return [peer, '', 'VIP1', '', '2', 'pubsub', 'publish', topic,
+            dict(bus='', headers={}, message=message)]
+
+
+def test_conflated_subscriber_receives_latest_message(pubsub_service):
+    parameters, service = pubsub_service
+    socket = parameters['socket']
+    service._check_if_protected_topic = Mock(return_value=None)
+
+    service.handle_subsystem(_subscribe_frames('ui', 'devices', conflate=60))
+    service.handle_subsystem(_subscribe_frames('historian', 'devices'))
+    for value in range(3):
+        service.handle_subsystem(_publish_frames('driver', 'devices/point', value))
+
+    sent_to = [call[0][0][0].bytes for call in socket.send_multipart.call_args_list]
+    assert sent_to.count(b'historian') == 3
+    assert sent_to.count(b'ui') == 1
+    assert service.conflation_timeout() is not None
+
+    # Make the pending message due and flush it; only the newest value is delivered.
+    pending = service._conflated_pending[('ui', 'devices/point')]
+    assert pending[0][8]['message'] == 2
+    pending[1] = 0
+    service.flush_conflated()
+    assert not service._conflated_pending
+    assert service.conflation_timeout() is None
+    assert socket.send_multipart.call_count == 5
+
+
+def test_filtered_subscriber_receives_matching_messages(pubsub_service):
+    parameters, service = pubsub_service
+    socket = parameters['socket']
+    service._check_if_protected_topic = Mock(return_value=None)
+
+    crossing = {'path': 'message.temperature', 'op': 'crosses', 'value': 80}
+    service.handle_subsystem(_subscribe_frames('alarms', 'devices', content_filter=crossing))
+    for value in (70, 75, 85, 90, 60):
+        service.handle_subsystem(_publish_frames('driver', 'devices/point', dict(temperature=value)))
+
+    delivered = [call[0][0][8].bytes for call in socket.send_multipart.call_args_list]
+    assert len(delivered) == 2
+    assert b'85' in delivered[0] and b'60' in delivered[1]
+
+
+def test_filtered_subscriber_receives_matching_shared_memory_publishes(pubsub_service):
+    from volttron.platform import jsonapi
+    from volttron.platform.vip.sharedmemory import SharedMemoryRing
+
+    parameters, service = pubsub_service
+    socket = parameters['socket']
+    service._check_if_protected_topic = Mock(return_value=None)
+    ring = SharedMemoryRing('volttron-filter-test-{}'.format(os.getpid()), size=1024)
+    try:
+        service.handle_subsystem(_subscribe_frames('alarms', 'devices',
+                                                   content_filter={'path': 'message.temperature',
+                                                                   'op': 'gt', 'value': 80}))
+        for value in (70, 85):
+            frames = _publish_frames('driver', 'devices/point', None)
+            frames[8]['shm'] = ring.write(jsonapi.dumpb(dict(temperature=value)))
+            service.handle_subsystem(frames)
+    finally:
+        ring.close()
+
+    delivered = [call[0][0][8].bytes for call in socket.send_multipart.call_args_list]
+    # The descriptor, not the payload, is forwarded to the subscriber.
+    assert len(delivered) == 1
+    assert b'shm' in delivered[0] and b'"seq": 2' in delivered[0]
+
+
+def test_unreadable_shared_memory_publish_is_dropped(pubsub_service):
+    parameters, service = pubsub_service
+    # Rings of agents running as another user cannot be attached to.
+    service._shared_reader.read = Mock(side_effect=PermissionError('Permission denied'))
+    msg = dict(bus='', headers={}, message=None, shm=dict(name='volttron-other-1', offset=0, length=1, seq=1))
+    assert service._inline_shared(msg) is None
+
+
+def test_invalid_filter_is_rejected(pubsub_service):
+    parameters, service = pubsub_service
+    result = service.handle_subsystem(_subscribe_frames('alarms', 'devices',
+                                                        content_filter={'path': 'x', 'op': 'eq'}))
+    assert result[-1] is False
+    assert not service._filters
+
+
+@pytest.mark.parametrize('codec', ['none', 'zlib'])
+def test_external_publishes_are_batched(codec):
+    from volttron.platform.vip.routingservice import RoutingService
+    from volttron.utils.frame_serialization import deserialize_frames, serialize_frames
+
+    routing = RoutingService(Mock(), Mock(), Mock(), Mock(), [], 'local', batch_size=3, compression=codec)
+    routing.send_external = Mock()
+    service = PubSubService(socket=Mock(), protected_topics=MagicMock(), routing_service=routing)
+    service._ext_subscriptions['remote'] = ['devices']
+    service._check_if_protected_topic = Mock(return_value=None)
+
+    for value in range(2):
+        service.handle_subsystem(_publish_frames('driver', 'devices/point', value))
+    assert not routing.send_external.called
+    assert routing.batch_timeout() is not None
+    service.handle_subsystem(_publish_frames('driver', 'devices/point', 2))
+    assert routing.send_external.call_count == 1
+    assert routing.batch_timeout() is None
+
+    name, frames = routing.send_external.call_args[0]
+    assert name == 'remote'
+    # Deliver the batch to a receiving platform
+    received = deserialize_frames(serialize_frames(['instance.local'] + frames))
+    receiver = PubSubService(socket=Mock(), protected_topics=MagicMock(), routing_service=None)
+    receiver._external_to_local_publish = Mock()
+    receiver.handle_subsystem(received)
+    published = [call[0][0] for call in receiver._external_to_local_publish.call_args_list]
+    assert [(f[7], f[8]['message']) for f in published] == [('devices/point', 0), ('devices/point', 1),
+                                                            ('devices/point', 2)]
+
+
+def test_protected_topics_matching():
+    topics = ProtectedPubSubTopics()
+    topics.add('devices/campus', ['a'])
+    topics.add('devices', ['b'])
+    topics.add('/analysis/.*/alarm/', 'c')
+    topics.add('/analysis/.*/', ['d'])
+    topics.add(r'/(x+)y\1/', ['e'])
+
+    assert topics.get('devices') == ['b']
+    # First configured literal prefix wins
+    assert topics.get('devices/campus/building') == ['a']
+    assert topics.get('devices/other') == ['b']
+    # First configured pattern wins
+    assert topics.get('analysis/a/alarm') == ['c']
+    assert topics.get('analysis/a/value') == ['d']
+    assert topics.get('xxyxx') == ['e']
+    assert topics.get('record/a') is None
+
+
+def test_protected_topic_verdicts_are_invalidated():
+    service = PubSubService(socket=Mock(), routing_service=None,
+                            protected_topics={'write-protect': [{'topic': 'devices', 'capabilities': ['can_publish']}]})
+    service._user_capabilities = {'driver': []}
+    assert service._check_if_protected_topic('driver', 'devices/a') is not None
+
+    service._update_caps_users([None] * 7 + [{'capabilities': {'driver': ['can_publish']}}])
+    assert service._check_if_protected_topic('driver', 'devices/a') is None
+
+    service._load_protected_topics({'write-protect': [{'topic': 'devices', 'capabilities': ['admin']}]})
+    assert service._check_if_protected_topic('driver', 'devices/a') is not None
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import gevent
+import pytest
+
+from volttron.platform.vip.agent import Agent
+from volttron.platform.vip.agent.inbox import BLOCK, Inbox, REJECT
+
+
+def test_reject_policy_when_full():
+    inbox = Inbox(max_messages=1)
+    inbox.declare('RPC', REJECT)
+    assert inbox.admit('RPC', 10)
+    assert not inbox.admit('RPC', 10)
+    inbox.release(10)
+    assert inbox.admit('RPC', 10)
+    assert inbox.stats()['rejected'] == {'RPC': 1}
+
+
+def test_block_policy_waits_for_space():
+    inbox = Inbox(max_bytes=100)
+    inbox.declare('config', BLOCK)
+    assert inbox.admit('config', 100)
+    waiter = gevent.spawn(inbox.admit, 'config', 50)
+    gevent.sleep(0)
+    assert not waiter.ready()
+    inbox.release(100)
+    assert waiter.get(timeout=1)
+    assert inbox.stats()['bytes'] == 50
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        Inbox().declare('pubsub', 'ignore')
+
+
+def _publish(value):
+    return SimpleNamespace(peer='pubsub', user='', id='', subsystem='pubsub', size=10,
+                           args=['publish', 'devices/all', dict(headers={}, message=value, sender='driver',
+                                                                 bus='')])
+
+
+def test_pubsub_drops_oldest_pending_publish():
+    agent = Agent(identity='inbox-test', address='inproc://inbox-test', enable_auth=False,
+                  inbox_max_messages=2)
+    pubsub = agent.vip.pubsub
+    received = []
+    pubsub._process_message = lambda message: received.append(message.args[2]['message'])
+    for value in range(3):
+        pubsub._handle_subsystem(_publish(value))
+    assert agent.core.inbox.stats()['dropped'] == {'pubsub': 1}
+    for message in list(pubsub._event_queue.queue):
+        pubsub._process_incoming_message(message).join()
+    assert received == [1, 2]
+    assert agent.core.inbox.depth == 0
+
+
+def test_pubsub_block_policy_stalls_reader_while_full():
+    agent = Agent(identity='inbox-block-test', address='inproc://inbox-block-test', enable_auth=False,
+                  inbox_max_messages=1)
+    agent.core.inbox.declare('pubsub', BLOCK)
+    pubsub = agent.vip.pubsub
+    received = []
+    pubsub._process_message = lambda message: received.append(message.args[2]['message'])
+    pubsub._handle_subsystem(_publish(0))
+    reader = gevent.spawn(pubsub._handle_subsystem, _publish(1))
+    gevent.sleep(0)
+    assert not reader.ready()
+    pubsub._process_incoming_message(pubsub._event_queue.get()).join()
+    reader.get(timeout=1)
+    pubsub._process_incoming_message(pubsub._event_queue.get()).join()
+    assert received == [0, 1]
+    assert agent.core.inbox.stats()['dropped'] == {}
+    assert agent.core.inbox.depth == 0
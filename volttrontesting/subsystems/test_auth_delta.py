@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import gevent
+
+from volttron.platform.agent.known_identities import AUTH
+from volttron.platform.auth.auth import AuthService
+from volttron.platform.vip.agent.subsystems.auth import Auth
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self, timeout=None):
+        return self.value
+
+
+def _auth(snapshot):
+    core = mock.Mock()
+    rpc = mock.Mock()
+    rpc.context.vip_message.peer = AUTH
+    rpc.call.return_value = _Result(snapshot)
+    auth = Auth(mock.Mock(), core, rpc)
+    # Keep strong references; the subsystem only holds weak ones.
+    auth._test_refs = (core, rpc)
+    return auth, rpc
+
+
+def test_delta_applied_in_order():
+    auth, rpc = _auth(dict(version=3, capabilities={'a': {'x': None}, 'b': {}}))
+    assert auth.get_capabilities('a') == {'x': None}
+    auth._update_capabilities_delta(4, {'a': {'y': None}, 'c': {}}, ['b'])
+    assert rpc.call.call_count == 1
+    assert auth._user_to_capabilities == {'a': {'y': None}, 'c': {}}
+    assert auth.capabilities_version == 2
+
+
+def test_version_gap_triggers_resync():
+    auth, rpc = _auth(dict(version=3, capabilities={'a': {}}))
+    auth.get_capabilities('a')
+    auth._update_capabilities_delta(5, {'a': {'y': None}}, [])
+    assert auth._user_to_capabilities == {'a': {}}
+    rpc.call.return_value = _Result(dict(version=5, capabilities={'a': {'y': None}}))
+    assert auth.get_capabilities('a') == {'y': None}
+    assert rpc.call.call_count == 2
+
+
+def test_delta_from_other_peer_ignored():
+    auth, rpc = _auth(dict(version=0, capabilities={}))
+    auth.get_capabilities('a')
+    rpc.context.vip_message.peer = 'impostor'
+    auth._update_capabilities_delta(1, {'a': {'admin': None}}, [])
+    assert auth._user_to_capabilities == {}
+
+
+def test_delta_from_restarted_auth_service_triggers_resync():
+    auth, rpc = _auth(dict(version=3, epoch='first', capabilities={'a': {}}))
+    auth.get_capabilities('a')
+    auth._update_capabilities_delta(4, {'a': {'x': None}}, [], 'first')
+    assert auth._user_to_capabilities == {'a': {'x': None}}
+    # After a restart versions start over; version 5 must not be taken as contiguous.
+    auth._update_capabilities_delta(5, {'b': {}}, ['a'], 'second')
+    assert auth._user_to_capabilities == {'a': {'x': None}}
+    rpc.call.return_value = _Result(dict(version=5, epoch='second', capabilities={'b': {}}))
+    assert auth.get_capabilities('b') == {}
+    assert rpc.call.call_count == 2
+    auth._update_capabilities_delta(6, {'c': {}}, [], 'second')
+    assert auth._user_to_capabilities == {'b': {}, 'c': {}}
+
+
+def test_delta_sent_when_unseeded_peerlist_times_out():
+    peerlist = mock.Mock()
+    peerlist.peers.side_effect = [gevent.Timeout(), ['agent']]
+    peerlist.peers_list = set()
+    service = SimpleNamespace(vip=SimpleNamespace(peerlist=peerlist, rpc=mock.Mock()),
+                              core=SimpleNamespace(identity=AUTH),
+                              _capabilities_version=1, _capabilities_epoch='epoch')
+    AuthService._send_capabilities_delta(service, {'a': {}}, [])
+    service.vip.rpc.call.assert_called_once_with('agent', 'auth.update_delta', 1, {'a': {}}, [], 'epoch')
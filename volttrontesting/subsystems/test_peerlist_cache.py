@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from volttron.platform.vip.agent.dispatch import Signal
+from volttron.platform.vip.agent.subsystems.peerlist import PeerList
+
+
+def _peerlist():
+    core = mock.Mock()
+    core.onconnected = Signal()
+    core.ondisconnected = Signal()
+    peerlist = PeerList(core)
+    peerlist._test_core = core
+    return peerlist, core
+
+
+def _listing(peerlist, core, peers):
+    msg_id = core.connection.send_vip.call_args[1]['msg_id']
+    peerlist._handle_subsystem(SimpleNamespace(id=msg_id, args=['listing'] + peers))
+
+
+def test_membership_seeded_on_connect_and_updated_by_events():
+    peerlist, core = _peerlist()
+    assert not peerlist.seeded
+    core.onconnected.send(core)
+    _listing(peerlist, core, ['a', 'b'])
+    assert peerlist.seeded
+    assert sorted(peerlist.peers()) == ['a', 'b']
+    version = peerlist.version
+
+    peerlist._handle_subsystem(SimpleNamespace(id='', args=['add', 'c']))
+    peerlist._handle_subsystem(SimpleNamespace(id='', args=['drop', 'a']))
+    assert peerlist.is_connected('c')
+    assert not peerlist.is_connected('a')
+    assert peerlist.version == version + 2
+    assert core.connection.send_vip.call_count == 1
+
+    core.ondisconnected.send(core)
+    assert not peerlist.seeded
@@ -0,0 +1,137 @@
+"""RMQPubSub publisher confirms, batching and prefetch against an in-process AMQP stand-in."""
+from types import SimpleNamespace
+from unittest import mock
+
+import gevent
+import gevent.event
+import pytest
+
+pika = pytest.importorskip("pika")
+
+from volttron.platform import jsonapi
+from volttron.platform.vip.agent.dispatch import Signal
+from volttron.platform.vip.agent.errors import Unreachable
+from volttron.platform.vip.agent.subsystems.rmq_pubsub import RMQPubSub
+
+
+class FakeChannel:
+    is_open = True
+
+    def __init__(self):
+        self.published = []
+        self.calls = []
+        self.acked = []
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append((routing_key, jsonapi.loads(body)))
+
+    def basic_qos(self, prefetch_count=0):
+        self.calls.append(('qos', prefetch_count))
+
+    def basic_consume(self, queue, callback):
+        self.calls.append(('consume', queue))
+        self.consumer = callback
+
+    def basic_ack(self, delivery_tag):
+        self.acked.append(delivery_tag)
+
+    def queue_declare(self, *args, **kwargs):
+        pass
+
+    def queue_bind(self, *args, **kwargs):
+        pass
+
+    def confirm_delivery(self, callback):
+        self.confirm_callback = callback
+
+
+class FakeCore:
+    identity = 'publisher'
+    instance_name = 'v1'
+    rmq_user = 'v1.publisher'
+
+    def __init__(self):
+        self.onsetup = Signal()
+        self.onconnected = Signal()
+        self.connection = SimpleNamespace(channel=FakeChannel(), exchange='volttron', routing_key='v1.publisher',
+                                          open_channel=self.open_channel)
+        self.publish_channel = FakeChannel()
+
+    def open_channel(self, callback):
+        callback(self.publish_channel)
+
+    def spawn(self, fn, *args):
+        return gevent.spawn(fn, *args)
+
+    def spawn_later(self, delay, fn, *args):
+        return gevent.spawn_later(delay, fn, *args)
+
+
+def _pubsub():
+    core = FakeCore()
+    rpc, peerlist = mock.Mock(), mock.Mock()
+    pubsub = RMQPubSub(core, rpc, peerlist, mock.Mock())
+    pubsub._test_refs = (core, rpc, peerlist)
+    return pubsub, core
+
+
+def _confirm(tag, multiple=False, ack=True):
+    method = pika.spec.Basic.Ack(tag, multiple) if ack else pika.spec.Basic.Nack(tag, multiple)
+    return SimpleNamespace(method=method)
+
+
+def test_publisher_confirms_are_windowed():
+    pubsub, core = _pubsub()
+    pubsub.confirm_window = 2
+    pubsub._connected(core)
+    results = [pubsub.publish('pubsub', 'devices/a', message=i) for i in range(2)]
+    blocked = gevent.spawn(pubsub.publish, 'pubsub', 'devices/a', message=2)
+    gevent.sleep(0.01)
+    assert len(core.publish_channel.published) == 2
+    assert not blocked.ready()
+
+    pubsub.on_delivery_confirmation(_confirm(2, multiple=True))
+    assert [result.get(timeout=1) for result in results] == [1, 1]
+    third = blocked.get(timeout=1)
+    assert len(core.publish_channel.published) == 3
+
+    pubsub.on_delivery_confirmation(_confirm(3, ack=False))
+    with pytest.raises(Unreachable):
+        third.get(timeout=1)
+
+
+def test_batched_publishes_are_delivered_individually():
+    pubsub, core = _pubsub()
+    pubsub.batch_size = 3
+    for i in range(3):
+        pubsub.publish('pubsub', 'devices/a', message=i)
+    pubsub.publish('pubsub', 'devices/b', message='x')
+    channel = core.connection.channel
+    assert len(channel.published) == 1
+    routing_key, body = channel.published[0]
+    assert [m['message'] for m in body['batch']] == [0, 1, 2]
+    gevent.sleep(pubsub.batch_interval * 2)
+    assert channel.published[1][1]['message'] == 'x'
+
+    received = []
+    pubsub._add_callback(core.connection, 'queue', lambda *args: received.append(args[-1]))
+    channel.consumer(channel, SimpleNamespace(routing_key=routing_key, delivery_tag=7), None,
+                     jsonapi.dumps(body))
+    gevent.sleep(0.01)
+    assert received == [0, 1, 2]
+    assert channel.acked == [7]
+
+
+def test_prefetch_acknowledges_after_callback():
+    pubsub, core = _pubsub()
+    channel = core.connection.channel
+    release = gevent.event.Event()
+    pubsub._add_callback(core.connection, 'queue', lambda *args: release.wait(), prefetch=5)
+    assert channel.calls == [('qos', 5), ('consume', 'queue'), ('qos', 0)]
+    body = jsonapi.dumps(dict(sender='s', bus='', headers={}, message=1))
+    channel.consumer(channel, SimpleNamespace(routing_key='__pubsub__.v1.devices.a.#', delivery_tag=1), None, body)
+    gevent.sleep(0.01)
+    assert channel.acked == []
+    release.set()
+    gevent.sleep(0.01)
+    assert channel.acked == [1]
@@ -0,0 +1,38 @@
+import inspect
+
+import pytest
+
+from volttron.platform import jsonrpc
+from volttron.platform.vip.agent.subsystems.rpc import _AuthDecision
+
+
+def set_point(topic, value, priority=16):
+    return topic, value
+
+
+def _decision(capabilities, required=frozenset(['can_set'])):
+    return _AuthDecision(set_point, inspect.signature(set_point), set(required), 'user', capabilities)
+
+
+def test_missing_capability_is_denied():
+    with pytest.raises(jsonrpc.Error) as exc:
+        _decision({'other': None}).check(('a', 1), {})
+    assert exc.value.code == jsonrpc.UNAUTHORIZED
+
+
+def test_unrestricted_capability_is_allowed():
+    _decision({'can_set': None}).check(('devices/a', 1), {})
+
+
+def test_parameter_restrictions_are_checked():
+    decision = _decision({'can_set': {'topic': '/devices/campus/.*/', 'priority': 16}})
+    decision.check(('devices/campus/point', 1), {})
+    with pytest.raises(jsonrpc.Error):
+        decision.check(('devices/other/point', 1), {})
+    with pytest.raises(jsonrpc.Error):
+        decision.check(('devices/campus/point', 1), {'priority': 1})
+
+
+def test_restriction_on_unknown_parameter_is_denied():
+    with pytest.raises(jsonrpc.Error):
+        _decision({'can_set': {'unknown': 1}}).check(('devices/a', 1), {})
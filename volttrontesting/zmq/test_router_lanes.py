@@ -0,0 +1,63 @@
+from volttron.platform.vip.router import BaseRouter
+
+
+class RecordingRouter(BaseRouter):
+
+    def __init__(self):
+        super(RecordingRouter, self).__init__(context=object(), service_notifier=None)
+        self.routed = []
+
+    def route(self, frames):
+        self.routed.append(frames)
+
+
+def _publish(sender, topic):
+    return [sender, '', 'VIP1', '', '1', 'pubsub', 'publish', topic, {}]
+
+
+def test_control_traffic_is_priority():
+    router = RecordingRouter()
+    assert router.is_priority(['agent', '', 'VIP1', '', '1', 'hello', 'hello'])
+    assert router.is_priority(['agent', 'control', 'VIP1', '', '1', 'RPC', {}])
+    assert router.is_priority(['config.store', 'agent', 'VIP1', '', '1', 'RPC', {}])
+    assert router.is_priority(_publish('agent', 'heartbeat/agent'))
+    assert not router.is_priority(_publish('platform.driver', 'devices/campus/building/all'))
+    assert not router.is_priority(['agent', 'historian', 'VIP1', '', '1', 'RPC', {}])
+
+
+def test_priority_lane_is_routed_first():
+    router = RecordingRouter()
+    bulk = [_publish('platform.driver', 'devices/d{}/all'.format(i)) for i in range(3)]
+    for frames in bulk:
+        router.enqueue(frames)
+    heartbeat = _publish('agent', 'heartbeat/agent')
+    router.enqueue(heartbeat)
+    router.route_queued()
+    assert router.routed == [heartbeat] + bulk
+    assert not router._priority_lane and not router._bulk_lane
+
+
+def _sync(sender):
+    return [sender, '', 'VIP1', '', '1', 'pubsub', 'synchronize', 'connected', {}]
+
+
+def test_subscription_snapshots_are_paced():
+    router = RecordingRouter()
+    router.admission_batch_size = 2
+    syncs = [_sync('agent{}'.format(i)) for i in range(3)]
+    for frames in syncs:
+        router.enqueue(frames)
+    # A later pubsub message from a peer waiting for admission stays behind its snapshot
+    subscribe = ['agent2', '', 'VIP1', '', '2', 'pubsub', 'subscribe', {}]
+    router.enqueue(subscribe)
+    hello = ['agent9', '', 'VIP1', '', '1', 'hello', 'hello']
+    router.enqueue(hello)
+    bulk = _publish('platform.driver', 'devices/all')
+    router.enqueue(bulk)
+
+    router.route_queued()
+    assert router.routed == [hello] + syncs[:2] + [bulk]
+    assert router.admission_pending()
+    router.route_queued()
+    assert router.routed[4:] == [syncs[2], subscribe]
+    assert not router.admission_pending() and not router._admitting